@@ -1,25 +1,188 @@
 import os
 import pickle
 import base64
-import email.message
-import email.policy
-from typing import Generator, Optional, Dict, Any
+import itertools
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Generator, Iterable, Optional, Dict, Any, List, Tuple
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from .parsed_email import ParsedEmail, parse_envelope
+from .predicates import (BEFORE, AFTER, FROM, TO, INVOLVES, LARGER, SMALLER, LABEL,
+                         ANY, NOT)
+from .prefetch import ordered_prefetch
+from .sync_state import SyncStateStore
+from .rate_limit import TokenBucket, retry_with_backoff
+
+
+# Headers requested with format='metadata' when listing
+METADATA_HEADERS = ['From', 'Sender', 'Subject', 'Date', 'Message-ID', 'Reply-To', 'To', 'Cc', 'Bcc']
+
+# Partial-response masks: only the parts of each response that are used
+LIST_FIELDS = 'messages/id,nextPageToken,resultSizeEstimate'
+METADATA_FIELDS = 'id,threadId,labelIds,internalDate,sizeEstimate,payload/headers'
+THREAD_LIST_FIELDS = 'threads/id,nextPageToken,resultSizeEstimate'
+THREAD_FIELDS = f'id,messages({METADATA_FIELDS})'
+HISTORY_FIELDS = ('history(messagesAdded/message/id,messagesDeleted/message/id,'
+                  'labelsAdded/message/id,labelsRemoved/message/id),nextPageToken')
+
+# Labels of the messages that messages.list leaves out (no includeSpamTrash)
+HIDDEN_LABELS = {'SPAM', 'TRASH'}
+
+# Most requests the Gmail batch endpoint accepts in one HTTP call
+MAX_BATCH_REQUESTS = 100
+
+# Quota units charged per call (https://developers.google.com/gmail/api/reference/quota).
+# Each request inside an HTTP batch is charged separately.
+QUOTA_UNITS = {
+    'getProfile': 1,
+    'labels.list': 1,
+    'history.list': 2,
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.delete': 10,
+    'messages.batchDelete': 50,
+    'messages.batchModify': 50,
+    'threads.list': 10,
+    'threads.get': 10,
+}
+
+# Per-user quota: 15,000 units per minute
+QUOTA_UNITS_PER_SECOND = 250
+
+# History record types that can make a message (re)appear in a listing
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+
+def _track_date(date_range: Dict[str, Optional[int]], internal_date: Optional[int]) -> None:
+    """Widen date_range ({'earliest', 'latest'} in epoch ms) to include internal_date"""
+    if internal_date is None:
+        return
+    if date_range['earliest'] is None or internal_date < date_range['earliest']:
+        date_range['earliest'] = internal_date
+    if date_range['latest'] is None or internal_date > date_range['latest']:
+        date_range['latest'] = internal_date
+
+
+def _describe_date_range(date_range: Dict[str, Optional[int]]) -> str:
+    """Format a date range built by _track_date"""
+    if date_range['earliest'] is None:
+        return "Could not determine date range of fetched emails"
+    earliest, latest = (datetime.fromtimestamp(date_range[k] / 1000).strftime('%Y-%m-%d %H:%M')
+                        for k in ('earliest', 'latest'))
+    return f"Date range of fetched emails: {earliest} to {latest}"
+
+
+def _gmail_quoted(text: str) -> str:
+    """Quote text as a Gmail search phrase"""
+    return '"%s"' % text.replace('"', ' ').strip()
+
+
+def _gmail_phrase(text: str) -> str:
+    """Quote text for Gmail search if it isn't a single plain word"""
+    if text and all(c.isalnum() or c in "@._+-" for c in text):
+        return text
+    return _gmail_quoted(text)
+
+
+def _gmail_or(terms: List[str]) -> str:
+    """Combine alternative terms, parenthesized when there are several"""
+    return terms[0] if len(terms) == 1 else f"({' OR '.join(terms)})"
+
+
+def _gmail_exact(predicate) -> bool:
+    """
+    Tell whether Gmail search evaluates a predicate (tree) exactly like the
+    client does, which is what negating its term requires
+    
+    Only the size filters qualify: larger:/smaller: compare the same
+    sizeEstimate the client reads. The other terms (address and date
+    matching, labels) only narrow the candidates, and their negation would
+    drop emails the client check accepts.
+    """
+    if isinstance(predicate, (LARGER, SMALLER)):
+        return True
+    if isinstance(predicate, ANY):
+        return bool(predicate.predicates) and all(_gmail_exact(p) for p in predicate.predicates)
+    if isinstance(predicate, NOT):
+        return _gmail_exact(predicate.predicate)
+    return False
+
+
+def _gmail_term(predicate) -> Optional[str]:
+    """
+    Translate a predicate (tree) into a Gmail search term.
+    
+    The term may match more emails than the predicate but never fewer,
+    since the client-side check can only remove emails. Subject, body and
+    attachment filters are left out: Gmail matches text as whole words
+    ("inv" doesn't find "Invoice") and detects attachments differently
+    from the client, so those terms could lose matches.
+    
+    Returns:
+        The term, or None if Gmail search can't express the predicate (an
+        ANY is only pushed down when all of its alternatives can be, a NOT
+        only when Gmail evaluates its predicate exactly)
+    """
+    if isinstance(predicate, FROM):
+        return _gmail_or([f"from:{_gmail_phrase(s)}" for s in predicate.senders])
+    if isinstance(predicate, TO):
+        return _gmail_or([f"{field}:{_gmail_phrase(r)}" for r in predicate.recipients for field in ('to', 'cc', 'bcc')])
+    if isinstance(predicate, INVOLVES):
+        return _gmail_or([f"{field}:{_gmail_phrase(p)}" for p in predicate.persons
+                          for field in ('from', 'to', 'cc', 'bcc')])
+    if isinstance(predicate, BEFORE):
+        return f"before:{predicate.date_str.replace('-', '/')}"
+    if isinstance(predicate, AFTER):
+        return f"after:{predicate.date_str.replace('-', '/')}"
+    if isinstance(predicate, LARGER):
+        return f"larger:{predicate.size}"
+    if isinstance(predicate, SMALLER):
+        return f"smaller:{predicate.size}"
+    if isinstance(predicate, LABEL):
+        # Gmail search writes spaces and slashes in label names as dashes
+        return _gmail_or([f"label:{l.replace(' ', '-').replace('/', '-')}" for l in predicate.labels])
+    if isinstance(predicate, ANY):
+        terms = [_gmail_term(p) for p in predicate.predicates]
+        if not terms or None in terms:
+            return None
+        return _gmail_or(terms)
+    if isinstance(predicate, NOT):
+        if not _gmail_exact(predicate.predicate):
+            return None
+        term = _gmail_term(predicate.predicate)
+        return f"-{term}" if term else None
+    return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Tell whether an API error is a rate-limit rejection or a transient server error"""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status == 403:
+        # Quota errors come as 403 with a rateLimitExceeded/userRateLimitExceeded reason
+        return 'ratelimitexceeded' in str(error.content).lower()
+    return status == 429 or status >= 500
 
 
 class GmailClient:
     """Gmail API client that implements the same interface as RealImapClient"""
     
+    # Mailbox.delete passes all matching UIDs to delete_messages at once
+    supports_bulk_delete = True
+    
     # Gmail API scopes needed for reading and modifying emails
     SCOPES = [
         'https://mail.google.com/'  # Full Gmail access (matches OAuth consent screen)
     ]
     
-    def __init__(self, credentials_json_path: str = "credentials.json", batch_size: int = 100, fetch_limit: int = None, allow_delete: bool = False):
+    def __init__(self, credentials_json_path: str = "credentials.json", batch_size: int = 100, fetch_limit: int = None, allow_delete: bool = False,
+                 prefetch_bodies: bool = False, workers: int = 4, sync_state: SyncStateStore = None,
+                 trash_on_delete: bool = False, rate_limiter: TokenBucket = None, threads: bool = False):
         """
         Initialize Gmail OAuth2 client
         
@@ -28,14 +191,42 @@ class GmailClient:
             batch_size: Number of messages to fetch per API call (1-500, default 100)
             fetch_limit: Maximum number of emails to fetch from server (None for all emails)
             allow_delete: Whether to allow actual deletion of emails (default False for safety)
+            prefetch_bodies: Download message bodies in a thread pool ahead of the
+                consumer. Use this when the query needs bodies (body_contains,
+                store_local, reduce_all...).
+            workers: Number of threads fetching bodies when prefetch_bodies is set;
+                at most 2 * workers bodies are held ahead of the consumer
+            sync_state: Store for the mailbox historyId. When given, each listing
+                only returns messages added or relabeled since the previous
+                complete listing with the same query (via the History API).
+            trash_on_delete: Move deleted messages to the Trash (recoverable for
+                30 days) instead of deleting them permanently
+            rate_limiter: Token bucket of quota units that every API call draws
+                from (default: the per-user Gmail quota). Pass the same bucket
+                to clients sharing an account.
+            threads: List whole conversations: list_messages yields the messages
+                of each matching thread together, with one threads.get per
+                thread, and fetch_limit counts threads rather than messages, so
+                the last thread isn't cut short. sync_state isn't used in
+                this mode.
         """
         self.credentials_path = credentials_json_path
         self.batch_size = min(max(batch_size, 1), 500)  # Clamp between 1 and 500
         self.fetch_limit = fetch_limit
         self.allow_delete = allow_delete
+        self.trash_on_delete = trash_on_delete
+        self.rate_limiter = rate_limiter or TokenBucket(QUOTA_UNITS_PER_SECOND)
+        self.prefetch_bodies = prefetch_bodies
+        self.workers = max(1, workers)
         self.service = None
         self.connected = False
         self.verbose = True  # Default verbose setting
+        self._creds = None
+        self._labels = None  # Label names by ID
+        self._local = threading.local()  # Per-thread services for prefetch workers
+        self.sync_state = sync_state
+        self.deleted_ids: List[str] = []  # Messages deleted, spammed or trashed since the previous sync
+        self.threads = threads
         
     def _get_credentials(self):
         """Get OAuth2 credentials for Gmail API"""
@@ -64,8 +255,8 @@ class GmailClient:
     def connect(self) -> None:
         """Establish connection to Gmail API"""
         try:
-            creds = self._get_credentials()
-            self.service = build('gmail', 'v1', credentials=creds)
+            self._creds = self._get_credentials()
+            self.service = build('gmail', 'v1', credentials=self._creds)
             self.connected = True
             
         except Exception as e:
@@ -75,6 +266,28 @@ class GmailClient:
         """Close the Gmail API connection"""
         self.service = None
         self.connected = False
+        self._labels = None
+        self._local = threading.local()
+    
+    def _execute(self, request, method: str, count: int = 1):
+        """
+        Execute an API request (or HTTP batch of count requests) within the quota.
+        
+        Quota units for the method are taken from the rate limiter first.
+        Rate-limit rejections and transient server errors are retried with
+        jittered exponential backoff; other errors are raised as usual.
+        """
+        def call():
+            self.rate_limiter.acquire(QUOTA_UNITS[method] * count)
+            return request.execute()
+        return retry_with_backoff(call, _is_retryable)
+    
+    def _thread_service(self):
+        """Return a Gmail service for the calling thread (the HTTP transport isn't thread-safe)"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._local.service = build('gmail', 'v1', credentials=self._creds)
+        return service
     
     def select_mailbox(self, mailbox: str = "INBOX") -> None:
         """Select a mailbox (Gmail API doesn't need this, but keeping interface consistent)"""
@@ -101,11 +314,12 @@ class GmailClient:
                 batch_size = self.batch_size
             
             # Get batch of message IDs
-            results = self.service.users().messages().list(
+            results = self._execute(self.service.users().messages().list(
                 userId='me', 
                 pageToken=page_token,
-                maxResults=batch_size
-            ).execute()
+                maxResults=batch_size,
+                fields=LIST_FIELDS
+            ), 'messages.list')
             
             batch_messages = results.get('messages', [])
             messages.extend([msg['id'] for msg in batch_messages])
@@ -127,83 +341,184 @@ class GmailClient:
         
         return messages
     
-    def _create_parsed_email(self, msg_id: str) -> ParsedEmail:
-        """Create a ParsedEmail object for a given message ID"""
-        try:
-            # Fetch message details (headers only for now)
-            msg = self.service.users().messages().get(
-                userId='me', id=msg_id, format='metadata',
-                metadataHeaders=['From', 'Sender', 'Subject', 'Date', 'Message-ID', 'Reply-To', 'To', 'Cc', 'Bcc']
-            ).execute()
-            
-            # Extract headers
-            headers = msg.get('payload', {}).get('headers', [])
-            header_dict = {h['name']: h['value'] for h in headers}
-            
-            # Debug: Check if this is a problematic email (empty date but matches date filter)
-            date_header = header_dict.get('Date', '')
-            if not date_header and self.verbose:
-                print(f"GmailClient: DEBUG - Message {msg_id} has empty Date header")
-                print(f"GmailClient: DEBUG - Full Gmail API response keys: {list(msg.keys())}")
-                if 'internalDate' in msg:
-                    print(f"GmailClient: DEBUG - Internal date: {msg['internalDate']}")
-                if 'snippet' in msg:
-                    print(f"GmailClient: DEBUG - Snippet: {msg['snippet']}")
-                print(f"GmailClient: DEBUG - Headers found: {list(header_dict.keys())}")
-            
-            # Create envelope dict similar to IMAP format
-            envelope = {
-                "sender": header_dict.get('From', ''),
-                "from": header_dict.get('From', ''),  # Alias for consistency
-                "sender_header": header_dict.get('Sender', ''),  # Separate Sender header
-                "subject": header_dict.get('Subject', ''),
-                "date": header_dict.get('Date', ''),
-                "message_id": header_dict.get('Message-ID', ''),
-                "reply_to": header_dict.get('Reply-To', ''),
-                "to": header_dict.get('To', ''),
-                "cc": header_dict.get('Cc', ''),
-                "bcc": header_dict.get('Bcc', ''),
-            }
-            
-            # Use Gmail's internal date as fallback if email header date is empty
-            if not envelope["date"] and 'internalDate' in msg:
-                try:
-                    from datetime import datetime
-                    # Convert milliseconds to datetime
-                    internal_timestamp = int(msg['internalDate']) / 1000  # Convert to seconds
-                    internal_date = datetime.fromtimestamp(internal_timestamp)
-                    # Format as RFC 2822 string
-                    envelope["date"] = internal_date.strftime("%a, %d %b %Y %H:%M:%S +0000")
-                    if self.verbose:
-                        print(f"GmailClient: Using internal date for message {msg_id}: {envelope['date']}")
-                except Exception as e:
-                    if self.verbose:
-                        print(f"GmailClient: Failed to convert internal date for message {msg_id}: {e}")
-            
-            # Create lazy body fetcher
-            def make_body_fetcher(msg_id=msg_id):
-                def fetch_body():
-                    return self._fetch_full_message(msg_id)
-                return fetch_body
-            
-            return ParsedEmail(msg_id, envelope, make_body_fetcher())
-            
-        except HttpError as error:
-            if error.resp.status == 404:
-                # Message not found - skip this message
-                if self.verbose:
-                    print(f"GmailClient: Skipping message {msg_id} - not found (may have been deleted)")
-                return None
+    def _label_names(self) -> Dict[str, str]:
+        """Return the label names by label ID (fetched once per connection)"""
+        if self._labels is None:
+            results = self._execute(self.service.users().labels().list(userId='me', fields='labels(id,name)'),
+                                    'labels.list')
+            self._labels = {label['id']: label['name'] for label in results.get('labels', [])}
+        return self._labels
+    
+    def _metadata_request(self, msg_id: str):
+        """Build (without executing) the metadata request for a message"""
+        return self.service.users().messages().get(
+            userId='me', id=msg_id, format='metadata', metadataHeaders=METADATA_HEADERS, fields=METADATA_FIELDS
+        )
+    
+    def _thread_request(self, thread_id: str):
+        """Build (without executing) the request for the metadata of every message in a thread"""
+        return self.service.users().threads().get(
+            userId='me', id=thread_id, format='metadata', metadataHeaders=METADATA_HEADERS, fields=THREAD_FIELDS
+        )
+    
+    def _fetch_metadata(self, msg_ids: List[str], verbose_mode: bool) -> List[Optional[dict]]:
+        """
+        Fetch format='metadata' responses for several messages using batch HTTP requests.
+        
+        Args:
+            msg_ids: Gmail message IDs
+            verbose_mode: Whether to print diagnostic messages
+        
+        Returns:
+            List with the response (or None for deleted messages) for each ID, in order
+        """
+        return self._batch_get(msg_ids, self._metadata_request, 'messages.get', 'message', verbose_mode)
+    
+    def _batch_get(self, ids: List[str], make_request, method: str, kind: str,
+                   verbose_mode: bool) -> List[Optional[dict]]:
+        """
+        Execute one get request per ID using batch HTTP requests.
+        
+        Up to MAX_BATCH_REQUESTS requests travel in one HTTP call.
+        Sub-requests that fail for a reason other than the item being
+        gone (e.g. rate limiting) are retried one by one afterwards.
+        
+        Args:
+            ids: Gmail message or thread IDs
+            make_request: Builds the (unexecuted) request for an ID
+            method: API method, for the quota
+            kind: "message" or "thread", for diagnostic messages
+            verbose_mode: Whether to print diagnostic messages
+        
+        Returns:
+            List with the response (or None for deleted items) for each ID, in order
+        """
+        responses = {}
+        failed = []
+        
+        def collect(request_id, response, exception):
+            if exception is None:
+                responses[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                responses[request_id] = None
             else:
-                # Re-raise other HTTP errors
-                raise
+                failed.append(request_id)
+        
+        for start in range(0, len(ids), MAX_BATCH_REQUESTS):
+            batch = self.service.new_batch_http_request(callback=collect)
+            chunk = ids[start:start + MAX_BATCH_REQUESTS]
+            for item_id in chunk:
+                batch.add(make_request(item_id), request_id=item_id)
+            self._execute(batch, method, count=len(chunk))
+        
+        if failed and verbose_mode:
+            print(f"GmailClient: Retrying {len(failed)} failed batch requests individually")
+        for item_id in failed:
+            try:
+                responses[item_id] = self._execute(make_request(item_id), method)
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                responses[item_id] = None
+        
+        if verbose_mode:
+            for item_id in ids:
+                if responses.get(item_id) is None:
+                    print(f"GmailClient: Skipping {kind} {item_id} - not found (may have been deleted)")
+        return [responses.get(item_id) for item_id in ids]
+    
+    def _parsed_emails_from_metadata(self, found: Iterable[Tuple[str, dict]]) -> Generator[ParsedEmail, None, None]:
+        """
+        Yield a ParsedEmail for each (message ID, metadata response), in order.
+        
+        With prefetch_bodies, bodies are downloaded by a pool of worker
+        threads (each with its own service) a bounded number of messages
+        ahead of the consumer. A prefetched body is handed to the first
+        body access and then released; later accesses refetch. found is
+        consumed lazily, so pass the whole listing as one stream: the pool
+        and its services then last for the whole listing and prefetching
+        runs ahead across pages.
+        """
+        if not self.prefetch_bodies:
+            for msg_id, msg in found:
+                yield self._parsed_email_from_metadata(msg_id, msg)
+            return
+        
+        def fetch(item):
+            return self._fetch_full_message(item[0], service=self._thread_service())
+        
+        for (msg_id, msg), raw in ordered_prefetch(found, fetch, workers=self.workers):
+            yield self._parsed_email_from_metadata(msg_id, msg, prefetched=raw)
+    
+    def _parsed_email_from_metadata(self, msg_id: str, msg: dict, prefetched: bytes = None) -> ParsedEmail:
+        """Create a ParsedEmail from a format='metadata' API response (and optionally its prefetched body)"""
+        # Extract headers
+        headers = msg.get('payload', {}).get('headers', [])
+        header_dict = {h['name']: h['value'] for h in headers}
+        
+        # Debug: Check if this is a problematic email (empty date but matches date filter)
+        date_header = header_dict.get('Date', '')
+        if not date_header and self.verbose:
+            print(f"GmailClient: DEBUG - Message {msg_id} has empty Date header")
+            print(f"GmailClient: DEBUG - Full Gmail API response keys: {list(msg.keys())}")
+            if 'internalDate' in msg:
+                print(f"GmailClient: DEBUG - Internal date: {msg['internalDate']}")
+            print(f"GmailClient: DEBUG - Headers found: {list(header_dict.keys())}")
+        
+        # Create envelope dict similar to IMAP format
+        envelope = {
+            "sender": header_dict.get('From', ''),
+            "from": header_dict.get('From', ''),  # Alias for consistency
+            "sender_header": header_dict.get('Sender', ''),  # Separate Sender header
+            "subject": header_dict.get('Subject', ''),
+            "date": header_dict.get('Date', ''),
+            "message_id": header_dict.get('Message-ID', ''),
+            "reply_to": header_dict.get('Reply-To', ''),
+            "to": header_dict.get('To', ''),
+            "cc": header_dict.get('Cc', ''),
+            "bcc": header_dict.get('Bcc', ''),
+        }
+        if 'threadId' in msg:
+            envelope["thread_id"] = msg['threadId']
+        if 'internalDate' in msg:
+            envelope["internal_date"] = int(msg['internalDate'])  # Receipt time, epoch milliseconds
+        if 'sizeEstimate' in msg:
+            envelope["size"] = msg['sizeEstimate']
+        if 'labelIds' in msg:
+            names = self._label_names()
+            envelope["labels"] = [names.get(label_id, label_id) for label_id in msg['labelIds']]
+        
+        # Use Gmail's internal date as fallback if email header date is empty
+        if not envelope["date"] and 'internalDate' in msg:
+            try:
+                # Convert milliseconds to datetime
+                internal_timestamp = int(msg['internalDate']) / 1000  # Convert to seconds
+                internal_date = datetime.fromtimestamp(internal_timestamp)
+                # Format as RFC 2822 string
+                envelope["date"] = internal_date.strftime("%a, %d %b %Y %H:%M:%S +0000")
+                if self.verbose:
+                    print(f"GmailClient: Using internal date for message {msg_id}: {envelope['date']}")
+            except Exception as e:
+                if self.verbose:
+                    print(f"GmailClient: Failed to convert internal date for message {msg_id}: {e}")
+        
+        # Create lazy body fetcher
+        def make_body_fetcher(msg_id=msg_id, prefetched=[] if prefetched is None else [prefetched]):
+            def fetch_body():
+                if prefetched:
+                    return prefetched.pop()
+                return self._fetch_full_message(msg_id)
+            return fetch_body
+        
+        return ParsedEmail(msg_id, envelope, make_body_fetcher())
     
     def list_messages(self, mailbox: str = "INBOX", filters: list = None, verbose: bool = None) -> Generator[ParsedEmail, None, None]:
         """
         List all messages in the mailbox, yielding ParsedEmail objects
         
         This fetches headers only initially. Body is fetched lazily when needed.
-        The number of messages returned is limited by self.fetch_limit.
+        The number of messages returned is limited by self.fetch_limit (the
+        number of threads, in thread mode).
         
         Args:
             mailbox: Mailbox name (Gmail API doesn't use this, but keeping interface consistent)
@@ -216,6 +531,12 @@ class GmailClient:
         # Use passed verbose parameter or fall back to instance setting
         verbose_mode = verbose if verbose is not None else self.verbose
         
+        if self.threads:
+            # list_threads applies fetch_limit to whole threads
+            for thread in self.list_threads(mailbox, filters, verbose_mode):
+                yield from thread
+            return
+        
         limit = self.fetch_limit
         
         # Build server-side query from filters if provided
@@ -225,134 +546,298 @@ class GmailClient:
             print(f"GmailClient: Using fetch_limit: {limit}")
         
         try:
+            sync = self._begin_sync(query, verbose_mode) if self.sync_state is not None else None
+            if sync and sync["msg_ids"] is not None:
+                yield from self._list_changed(sync, verbose_mode)
+                return
+            
             count = 0
-            page_token = None
             date_range = {'earliest': None, 'latest': None}
             
-            while True:
-                # Calculate batch size
-                if self.fetch_limit:
-                    remaining = self.fetch_limit - count
-                    if remaining <= 0:
-                        break
-                    batch_size = min(self.batch_size, remaining)  # Use configured batch size
-                else:
-                    batch_size = self.batch_size
+            for parsed_email in self._parsed_emails_from_metadata(self._list_metadata(query, verbose_mode)):
+                count += 1
                 
-                # Get batch of message IDs
-                #print(f"GmailClient: Making API call with query='{query}', maxResults={batch_size}")
-                results = self.service.users().messages().list(
-                    userId='me', 
-                    pageToken=page_token,
-                    maxResults=batch_size,
-                    q=query
-                ).execute()
+                # Track date range for verbose output
+                _track_date(date_range, parsed_email.envelope.get("internal_date"))
                 
-                batch_messages = results.get('messages', [])
-                result_size_estimate = results.get('resultSizeEstimate', 'unknown')
-                if verbose_mode:
-                    print(f"GmailClient: Got {len(batch_messages)} messages from API (total estimate: {result_size_estimate})")
-                    
-                    # Peek at the first message in this batch to show date range
-                    if batch_messages:
-                        try:
-                            first_msg_id = batch_messages[0]['id']
-                            # Get just the headers for the first message (fast operation)
-                            first_msg = self.service.users().messages().get(
-                                userId='me', id=first_msg_id, format='metadata', 
-                                metadataHeaders=['Date']
-                            ).execute()
-                            
-                            # Extract date from headers
-                            headers = first_msg.get('payload', {}).get('headers', [])
-                            date_header = next((h['value'] for h in headers if h['name'].lower() == 'date'), None)
-                            
-                            if date_header:
-                                print(f"GmailClient: First message in this batch dated: {date_header}")
-                            else:
-                                print("GmailClient: Could not determine date of first message in batch")
-                        except Exception as e:
-                            if verbose_mode:
-                                print(f"GmailClient: Could not peek at first message date: {e}")
+                yield parsed_email
                 
-                if not batch_messages:
+                if self.fetch_limit and count >= self.fetch_limit:
                     break
+            
+            # Only a listing that ran to the end moves the sync marker forward
+            if sync and not (self.fetch_limit and count >= self.fetch_limit):
+                self.sync_state.set(sync["key"], sync["state"])
+                if verbose_mode:
+                    print(f"GmailClient: Saved sync state for {sync['key']}")
+            
+            # Print final summary with date range
+            if verbose_mode:
+                print(f"GmailClient: {_describe_date_range(date_range)}")
                 
-                # Create ParsedEmail objects for this batch
-                for msg in batch_messages:
-                    parsed_email = self._create_parsed_email(msg['id'])
-                    if parsed_email is not None:
-                        count += 1
-                        
-                        # Track date range for verbose output
-                        if verbose_mode and 'date' in parsed_email.envelope and parsed_email['date']:
-                            try:
-                                from datetime import datetime
-                                # Try to parse the date
-                                date_str = parsed_email['date']
-                                # Handle various date formats
-                                email_date = None
-                                
-                                # Try multiple date formats
-                                for fmt in [
-                                    "%a, %d %b %Y %H:%M:%S %z",
-                                    "%a, %d %b %Y %H:%M:%S",
-                                    "%d %b %Y %H:%M:%S %z",
-                                    "%d %b %Y %H:%M:%S"
-                                ]:
-                                    try:
-                                        email_date = datetime.strptime(date_str, fmt)
-                                        break
-                                    except ValueError:
-                                        continue
-                                
-                                if email_date:
-                                    if date_range['earliest'] is None or email_date < date_range['earliest']:
-                                        date_range['earliest'] = email_date
-                                    if date_range['latest'] is None or email_date > date_range['latest']:
-                                        date_range['latest'] = email_date
-                            except Exception:
-                                # Skip date parsing errors
-                                pass
-                        
-                        yield parsed_email
-                        
-                        if self.fetch_limit and count >= self.fetch_limit:
-                            # Print date range summary when we hit the limit
-                            if verbose_mode:
-                                if date_range['earliest'] and date_range['latest']:
-                                    print(f"GmailClient: Date range of fetched emails: {date_range['earliest'].strftime('%Y-%m-%d %H:%M')} to {date_range['latest'].strftime('%Y-%m-%d %H:%M')}")
-                                elif date_range['earliest']:
-                                    print(f"GmailClient: Earliest email date: {date_range['earliest'].strftime('%Y-%m-%d %H:%M')}")
-                                elif date_range['latest']:
-                                    print(f"GmailClient: Latest email date: {date_range['latest'].strftime('%Y-%m-%d %H:%M')}")
-                                else:
-                                    print("GmailClient: Could not determine date range of fetched emails")
-                            break
-                
-                # Check if there are more pages
-                page_token = results.get('nextPageToken')
-                if not page_token:
+        except HttpError as error:
+            raise RuntimeError(f"Gmail API error: {error}")
+    
+    def _list_metadata(self, query: Optional[str], verbose_mode: bool) -> Generator[Tuple[str, dict], None, None]:
+        """
+        Page through messages.list, yielding (message ID, metadata response) pairs.
+        
+        Each page's metadata is fetched with batch requests, and the next
+        page is only requested when the consumer gets to it. Deleted
+        messages are skipped.
+        """
+        count = 0
+        page_token = None
+        
+        while True:
+            # Calculate batch size
+            if self.fetch_limit:
+                remaining = self.fetch_limit - count
+                if remaining <= 0:
+                    return
+                batch_size = min(self.batch_size, remaining)  # Use configured batch size
+            else:
+                batch_size = self.batch_size
+            
+            # Get batch of message IDs
+            results = self._execute(self.service.users().messages().list(
+                userId='me', 
+                pageToken=page_token,
+                maxResults=batch_size,
+                q=query,
+                fields=LIST_FIELDS
+            ), 'messages.list')
+            
+            batch_messages = results.get('messages', [])
+            result_size_estimate = results.get('resultSizeEstimate', 'unknown')
+            if verbose_mode:
+                print(f"GmailClient: Got {len(batch_messages)} messages from API (total estimate: {result_size_estimate})")
+            
+            if not batch_messages:
+                return
+            
+            msg_ids = [msg['id'] for msg in batch_messages]
+            for msg_id, msg in zip(msg_ids, self._fetch_metadata(msg_ids, verbose_mode)):
+                if msg is not None:
+                    count += 1
+                    yield msg_id, msg
+            
+            # Check if there are more pages
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def list_threads(self, mailbox: str = "INBOX", filters: list = None,
+                     verbose: bool = None) -> Generator[List[ParsedEmail], None, None]:
+        """
+        List the threads matching the filters, yielding the messages of each thread
+        
+        Threads are listed with threads.list, and each thread's messages,
+        with metadata, come from a single threads.get (batched like message
+        metadata), instead of one messages.get per message. A thread matches
+        when any of its messages matches the server query, and all of its
+        messages are returned, oldest first; client-side filters still apply
+        per message. The number of threads is limited by self.fetch_limit.
+        
+        Args:
+            mailbox: Mailbox name (Gmail API doesn't use this, but keeping interface consistent)
+            filters: Optional list of filter objects for server-side optimization
+            verbose: Whether to print diagnostic messages (overrides self.verbose if provided)
+        
+        Returns:
+            Generator of lists of ParsedEmail objects, one list per thread
+        """
+        if not self.connected:
+            self.connect()
+        
+        verbose_mode = verbose if verbose is not None else self.verbose
+        query = self._build_server_query(filters, verbose_mode) if filters else None
+        if verbose_mode:
+            print(f"GmailClient: Listing threads with query: {query}")
+        
+        try:
+            count = 0
+            messages = 0
+            sizes = deque()  # Message counts of the threads streamed so far, in order
+            
+            def thread_messages():
+                for thread in self._list_thread_metadata(query, verbose_mode):
+                    sizes.append(len(thread['messages']))
+                    for msg in thread['messages']:
+                        yield msg['id'], msg
+            
+            # Build the emails of the whole listing in one stream, so body
+            # prefetching runs ahead across thread and page boundaries
+            emails = self._parsed_emails_from_metadata(thread_messages())
+            for first in emails:
+                thread_emails = [first] + list(itertools.islice(emails, sizes.popleft() - 1))
+                count += 1
+                messages += len(thread_emails)
+                yield thread_emails
+                if self.fetch_limit and count >= self.fetch_limit:
                     break
             
-            # Print final summary with date range
             if verbose_mode:
-                if date_range['earliest'] and date_range['latest']:
-                    print(f"GmailClient: Date range of fetched emails: {date_range['earliest'].strftime('%Y-%m-%d %H:%M')} to {date_range['latest'].strftime('%Y-%m-%d %H:%M')}")
-                elif date_range['earliest']:
-                    print(f"GmailClient: Earliest email date: {date_range['earliest'].strftime('%Y-%m-%d %H:%M')}")
-                elif date_range['latest']:
-                    print(f"GmailClient: Latest email date: {date_range['latest'].strftime('%Y-%m-%d %H:%M')}")
-                else:
-                    print("GmailClient: Could not determine date range of fetched emails")
+                print(f"GmailClient: Listed {count} threads with {messages} messages")
                 
         except HttpError as error:
             raise RuntimeError(f"Gmail API error: {error}")
     
+    def _list_thread_metadata(self, query: Optional[str], verbose_mode: bool) -> Generator[dict, None, None]:
+        """
+        Page through threads.list, yielding each thread's threads.get response.
+        
+        Each page's threads are fetched with batch requests, and the next
+        page is only requested when the consumer gets to it. Deleted and
+        empty threads are skipped.
+        """
+        count = 0
+        page_token = None
+        
+        while True:
+            if self.fetch_limit:
+                remaining = self.fetch_limit - count
+                if remaining <= 0:
+                    return
+                batch_size = min(self.batch_size, remaining)
+            else:
+                batch_size = self.batch_size
+            
+            results = self._execute(self.service.users().threads().list(
+                userId='me',
+                pageToken=page_token,
+                maxResults=batch_size,
+                q=query,
+                fields=THREAD_LIST_FIELDS
+            ), 'threads.list')
+            
+            thread_ids = [thread['id'] for thread in results.get('threads', [])]
+            if verbose_mode:
+                print(f"GmailClient: Got {len(thread_ids)} threads from API "
+                      f"(total estimate: {results.get('resultSizeEstimate', 'unknown')})")
+            if not thread_ids:
+                return
+            
+            for thread in self._batch_get(thread_ids, self._thread_request, 'threads.get', 'thread', verbose_mode):
+                if thread is not None and thread.get('messages'):
+                    count += 1
+                    yield thread
+            
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def _begin_sync(self, query: Optional[str], verbose_mode: bool) -> Dict[str, Any]:
+        """
+        Work out which messages changed since the stored historyId.
+        
+        The current historyId is read before listing, so changes made during
+        the listing are picked up (again) by the next run. If there is no
+        stored state, or it is too old for the History API, msg_ids is None
+        and the caller lists everything.
+        
+        Returns:
+            Dict with the state key, the state to store once the listing is
+            complete, and the changed message IDs (or None)
+        """
+        profile = self._execute(self.service.users().getProfile(userId='me'), 'getProfile')
+        key = f"gmail:{profile.get('emailAddress')}"
+        if query:
+            key += f"?{query}"
+        state = {"history_id": profile['historyId']}
+        previous = self.sync_state.get(key)
+        self.deleted_ids = []
+        
+        msg_ids = None
+        if previous:
+            changes = self._history_changes(previous["history_id"], verbose_mode)
+            if changes is not None:
+                msg_ids, self.deleted_ids = changes
+                if verbose_mode:
+                    print(f"GmailClient: {len(msg_ids)} new or changed and {len(self.deleted_ids)} deleted messages since last sync")
+        return {"key": key, "state": state, "msg_ids": msg_ids}
+    
+    def _history_changes(self, start_history_id: str, verbose_mode: bool) -> Optional[Tuple[List[str], List[str]]]:
+        """
+        Page through users.history.list from start_history_id.
+        
+        Returns:
+            (changed message IDs, deleted message IDs), or None if the
+            history is no longer available (404) and a full listing is needed
+        """
+        changed = {}
+        deleted = {}
+        page_token = None
+        
+        while True:
+            try:
+                results = self._execute(self.service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=HISTORY_TYPES,
+                    pageToken=page_token,
+                    fields=HISTORY_FIELDS
+                ), 'history.list')
+            except HttpError as error:
+                if error.resp.status == 404:
+                    if verbose_mode:
+                        print(f"GmailClient: History {start_history_id} has expired, listing everything")
+                    return None
+                raise
+            
+            for record in results.get('history', []):
+                for kind in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for item in record.get(kind, []):
+                        changed[item['message']['id']] = True
+                for item in record.get('messagesDeleted', []):
+                    deleted[item['message']['id']] = True
+            
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        return [msg_id for msg_id in changed if msg_id not in deleted], list(deleted)
+    
+    def _list_changed(self, sync: Dict[str, Any], verbose_mode: bool) -> Generator[ParsedEmail, None, None]:
+        """
+        Yield the messages found by _begin_sync and save the new state if all were listed.
+        
+        The history covers every folder, so messages now in spam or trash
+        (which a full listing leaves out) or gone since are added to
+        deleted_ids instead of being yielded.
+        """
+        msg_ids = sync["msg_ids"]
+        
+        def changed():
+            for start in range(0, len(msg_ids), self.batch_size):
+                chunk = msg_ids[start:start + self.batch_size]
+                for msg_id, msg in zip(chunk, self._fetch_metadata(chunk, verbose_mode)):
+                    if msg is None or HIDDEN_LABELS & set(msg.get('labelIds', [])):
+                        self.deleted_ids.append(msg_id)
+                    else:
+                        yield msg_id, msg
+        
+        count = 0
+        for parsed_email in self._parsed_emails_from_metadata(changed()):
+            count += 1
+            yield parsed_email
+            if self.fetch_limit and count >= self.fetch_limit:
+                return
+        
+        self.sync_state.set(sync["key"], sync["state"])
+        if verbose_mode:
+            print(f"GmailClient: Saved sync state for {sync['key']}")
+    
     def _build_server_query(self, filters: list, verbose: bool = None) -> str:
         """
         Build Gmail API query string from filter list
         
+        Every filter that Gmail search can express, including ANY/NOT trees
+        of predicates, becomes one term, and the terms are ANDed like the
+        filters themselves. Other filters are only applied client-side,
+        and so are the NOTs of terms that Gmail doesn't evaluate exactly
+        like the client (see _gmail_exact).
+        
         Args:
             filters: List of filter objects (functions and Predicate instances)
             verbose: Whether to print diagnostic messages (overrides self.verbose if provided)
@@ -369,535 +854,85 @@ class GmailClient:
         if verbose_mode:
             print(f"GmailClient: Building query from {len(filters)} filters")
         
-        # Group predicates by type for OR handling
-        from_predicates = []
-        to_predicates = []
-        involves_predicates = []
-        date_predicates = []
-        
+        query_parts = []
         for i, filter_obj in enumerate(filters):
             if verbose_mode:
                 print(f"GmailClient: Filter {i}: {type(filter_obj).__name__} = {filter_obj}")
             
-            # Group predicates by type
-            if hasattr(filter_obj, '__class__'):
-                class_name = filter_obj.__class__.__name__
-                if class_name == 'FROM':
-                    from_predicates.append(filter_obj)
-                elif class_name == 'TO':
-                    to_predicates.append(filter_obj)
-                elif class_name == 'INVOLVES':
-                    involves_predicates.append(filter_obj)
-                elif class_name in ['BEFORE', 'AFTER']:
-                    date_predicates.append(filter_obj)
-        
-        # Build query parts
-        query_parts = []
-        
-        # Handle FROM predicates (support multiple senders with OR)
-        if from_predicates:
-            if len(from_predicates) == 1 and len(from_predicates[0].senders) == 1:
-                # Single sender
-                query_parts.append(f"from:{from_predicates[0].senders[0]}")
+            term = _gmail_term(filter_obj)
+            if term:
+                query_parts.append(term)
                 if verbose_mode:
-                    print(f"GmailClient: Added 'from:{from_predicates[0].senders[0]}' to query")
-            else:
-                # Multiple senders - combine with OR
-                all_senders = []
-                for pred in from_predicates:
-                    all_senders.extend(pred.senders)
-                from_conditions = [f"from:{sender}" for sender in all_senders]
-                from_query = " OR ".join(from_conditions)
-                query_parts.append(f"({from_query})")
-                if verbose_mode:
-                    print(f"GmailClient: Added OR from query: '({from_query})'")
-        
-        # Handle TO predicates (support multiple recipients with OR)
-        if to_predicates:
-            if len(to_predicates) == 1 and len(to_predicates[0].recipients) == 1:
-                # Single recipient
-                query_parts.append(f"to:{to_predicates[0].recipients[0]}")
-                if verbose_mode:
-                    print(f"GmailClient: Added 'to:{to_predicates[0].recipients[0]}' to query")
-            else:
-                # Multiple recipients - combine with OR
-                all_recipients = []
-                for pred in to_predicates:
-                    all_recipients.extend(pred.recipients)
-                to_conditions = [f"to:{recipient}" for recipient in all_recipients]
-                to_query = " OR ".join(to_conditions)
-                query_parts.append(f"({to_query})")
-                if verbose_mode:
-                    print(f"GmailClient: Added OR to query: '({to_query})'")
-        
-        # Handle INVOLVES predicates (convert to from: OR to: queries)
-        if involves_predicates:
-            all_persons = []
-            for pred in involves_predicates:
-                all_persons.extend(pred.persons)
-            
-            # Create conditions for each person: from:person OR to:person
-            involves_conditions = []
-            for person in all_persons:
-                involves_conditions.append(f"from:{person} OR to:{person}")
-            
-            # Combine all conditions with OR
-            involves_query = " OR ".join(involves_conditions)
-            query_parts.append(f"({involves_query})")
-            if verbose_mode:
-                print(f"GmailClient: Added INVOLVES query: '({involves_query})'")
-        
-        # Handle date predicates (these are ANDed together)
-        for pred in date_predicates:
-            if pred.__class__.__name__ == 'BEFORE':
-                date_str = pred.date_str.replace('-', '/')
-                query_parts.append(f"before:{date_str}")
-                if verbose_mode:
-                    print(f"GmailClient: Added 'before:{date_str}' to query")
-            elif pred.__class__.__name__ == 'AFTER':
-                date_str = pred.date_str.replace('-', '/')
-                query_parts.append(f"after:{date_str}")
-                if verbose_mode:
-                    print(f"GmailClient: Added 'after:{date_str}' to query")
+                    print(f"GmailClient: Added '{term}' to query")
         
         final_query = ' '.join(query_parts) if query_parts else None
         if verbose_mode:
             print(f"GmailClient: Final query: '{final_query}'")
         return final_query
     
-    def _fetch_full_message(self, msg_id: str) -> bytes:
-        """Fetch the full message body for a given message ID"""
+    def _fetch_full_message(self, msg_id: str, service=None) -> bytes:
+        """Fetch the full message body for a given message ID (on service, default self.service)"""
         if not self.connected:
             self.connect()
         
         try:
-            # Get full message
-            msg = self.service.users().messages().get(
-                userId='me', id=msg_id, format='full'
-            ).execute()
-            
-            # Convert Gmail API format to raw email bytes
-            return self._gmail_to_raw_email(msg)
+            # format='raw' returns the original RFC 822 message, base64url-encoded
+            msg = self._execute((service or self.service).users().messages().get(
+                userId='me', id=msg_id, format='raw', fields='raw'
+            ), 'messages.get')
+            raw = msg['raw']
+            return base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4))
             
         except HttpError as error:
             raise RuntimeError(f"Failed to fetch message {msg_id}: {error}")
     
-    def _gmail_to_raw_email(self, msg: dict) -> bytes:
-        """Convert Gmail API message format to raw email bytes"""
-        try:
-            # Add headers
-            headers = msg.get('payload', {}).get('headers', [])
-            
-            # Add body content
-            payload = msg.get('payload', {})
-            mime_type = payload.get('mimeType', 'unknown')
-            
-            # Create email message and add headers
-            email_msg = email.message.EmailMessage()
-            for header in headers:
-                email_msg[header['name']] = header['value']
-            
-            # Add body content based on type
-            if mime_type.startswith('multipart/'):
-                # For multipart messages, add parts
-                self._add_multipart_parts(email_msg, payload)
-            else:
-                # For single part messages, add body content
-                self._add_body_parts(email_msg, payload)
-            
-            # Convert to bytes
-            return email_msg.as_bytes(policy=email.policy.default)
-            
-        except AttributeError as e:
-            if "'list' object has no attribute 'encode'" in str(e):
-                # Handle list payload error by creating a minimal email
-                print(f"Warning: Gmail message has list payload, creating minimal email")
-                print(f"Diagnostic: Payload structure: {self._diagnose_payload_structure(msg)}")
-                print("Debug: Detailed part structure:")
-                payload = msg.get('payload', {})
-                if 'parts' in payload:
-                    for i, part in enumerate(payload['parts']):
-                        print(f"  Top-level part {i+1}:")
-                        self._debug_part_structure(part, 2)
-                return self._create_minimal_email_from_gmail(msg)
-            else:
-                raise
-        except Exception as e:
-            print(f"Warning: Error converting Gmail message to raw email: {e}")
-            return self._create_minimal_email_from_gmail(msg)
-    
-    def _create_minimal_email_from_gmail(self, msg: dict) -> bytes:
-        """Create a minimal email when the original conversion fails"""
-        # Extract basic headers
-        headers = msg.get('payload', {}).get('headers', [])
-        payload = msg.get('payload', {})
+    def delete_messages(self, msg_ids: List[str], batch_size: int = 1000) -> Dict[str, bool]:
+        """
+        Delete several messages with one API call per batch_size IDs.
         
-        # Create email message
-        email_msg = email.message.EmailMessage()
+        Uses users.messages.batchDelete, or batchModify adding the TRASH
+        label when trash_on_delete is set. Both calls succeed or fail as a
+        whole, so every ID in a failed call is reported as not deleted.
         
-        # Add headers
-        for header in headers:
-            email_msg[header['name']] = header['value']
+        Args:
+            msg_ids: IDs of the messages to delete
+            batch_size: Maximum number of IDs per call (the API allows 1000)
+            
+        Returns:
+            Dictionary mapping each ID to True if it was deleted
+        """
+        results = {msg_id: False for msg_id in msg_ids}
+        if not self.connected:
+            self.connect()
         
-        # Check if this is a multipart message
-        mime_type = payload.get('mimeType', 'text/plain')
-        if mime_type.startswith('multipart/'):
-            # Handle multipart by creating parts
-            self._create_multipart_from_problematic_payload(email_msg, payload)
-        else:
-            # Single part - try to extract content
-            body_content = self._extract_content_from_problematic_payload(msg)
-            email_msg.set_content(body_content)
+        if not self.allow_delete:
+            print(f"Skipping deletion of {len(results)} messages due to allow_delete=False")
+            return results
         
-        return email_msg.as_bytes(policy=email.policy.default)
-    
-    def _create_multipart_from_problematic_payload(self, email_msg: email.message.EmailMessage, payload: dict):
-        """Create a multipart email from problematic payload"""
-        try:
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    part_mime_type = part.get('mimeType', 'text/plain')
-                    
-                    # Check if this part is itself multipart
-                    if part_mime_type.startswith('multipart/') and 'parts' in part:
-                        # Handle nested multipart - extract content from nested parts
-                        nested_content = self._extract_nested_multipart_content(part)
-                        if nested_content:
-                            # Create a text part with the extracted content
-                            part_msg = email.message.EmailMessage()
-                            part_msg.set_content(nested_content)
-                            email_msg.attach(part_msg)
-                    else:
-                        # Regular part
-                        part_msg = email.message.EmailMessage()
-                        part_content = self._extract_part_content(part)
-                        if part_content:
-                            part_msg.set_content(part_content)
-                        else:
-                            part_msg.set_content("[Part content could not be extracted]")
-                        
-                        # Add the part to the main message
-                        email_msg.attach(part_msg)
-            else:
-                # No parts found, add a placeholder
-                email_msg.set_content("[Multipart email with no extractable parts]")
-                
-        except Exception as e:
-            print(f"Warning: Error creating multipart from problematic payload: {e}")
-            # Fallback to simple text
-            email_msg.set_content("[Multipart email could not be reconstructed]")
-    
-    def _extract_nested_multipart_content(self, multipart_part: dict) -> str:
-        """Extract content from nested multipart parts, preferring text/plain"""
-        try:
-            if 'parts' not in multipart_part:
-                return ""
-            
-            # First, try to find text/plain content
-            for part in multipart_part['parts']:
-                mime_type = part.get('mimeType', 'text/plain')
-                if mime_type == 'text/plain':
-                    content = self._extract_part_content(part)
-                    if content:
-                        return content
-            
-            # If no text/plain found, try text/html
-            for part in multipart_part['parts']:
-                mime_type = part.get('mimeType', 'text/html')
-                if mime_type == 'text/html':
-                    content = self._extract_part_content(part)
-                    if content:
-                        return content
-            
-            # If still nothing, try any text content
-            for part in multipart_part['parts']:
-                mime_type = part.get('mimeType', '')
-                if mime_type.startswith('text/'):
-                    content = self._extract_part_content(part)
-                    if content:
-                        return content
-            
-            return ""
-            
-        except Exception as e:
-            print(f"Warning: Error extracting nested multipart content: {e}")
-            return ""
-    
-    def _extract_content_from_problematic_payload(self, msg: dict) -> str:
-        """Try to extract useful content from a problematic Gmail payload"""
-        try:
-            payload = msg.get('payload', {})
-            
-            # Strategy 1: Try to get content from body.data if it exists
-            if 'body' in payload and payload['body'].get('data'):
-                try:
-                    content = base64.urlsafe_b64decode(payload['body']['data'])
-                    if isinstance(content, list):
-                        # Try different ways to convert list to string
-                        return self._convert_list_to_string(content)
-                    elif isinstance(content, bytes):
-                        return content.decode('utf-8', errors='replace')
-                    else:
-                        return str(content)
-                except Exception as e:
-                    pass
-            
-            # Strategy 2: Try to extract from parts if it's multipart
-            if 'parts' in payload:
-                parts_content = []
-                for part in payload['parts']:
-                    part_content = self._extract_part_content(part)
-                    if part_content:
-                        parts_content.append(part_content)
-                
-                if parts_content:
-                    return '\n\n---\n\n'.join(parts_content)
-            
-            # Strategy 3: Try to get any text from the payload structure
-            return self._extract_text_from_payload_structure(payload)
-            
-        except Exception as e:
-            return f"[Content extraction failed: {str(e)}]"
-    
-    def _convert_list_to_string(self, content_list: list) -> str:
-        """Convert a list to a string using various strategies"""
-        try:
-            # Strategy 1: Join with newlines
-            if all(isinstance(item, str) for item in content_list):
-                return '\n'.join(content_list)
-            
-            # Strategy 2: Join with spaces
-            if all(isinstance(item, (str, int, float)) for item in content_list):
-                return ' '.join(str(item) for item in content_list)
-            
-            # Strategy 3: Format each item with %s
-            formatted_items = []
-            for item in content_list:
-                try:
-                    formatted_items.append("%s" % item)
-                except:
-                    formatted_items.append(str(item))
-            return '\n'.join(formatted_items)
-            
-        except Exception as e:
-            return f"[List conversion failed: {str(e)}]"
-    
-    def _extract_part_content(self, part: dict) -> str:
-        """Extract content from a single part"""
-        try:
-            if part.get('body', {}).get('data'):
-                data = part['body']['data']
-                
-                # If data is already a string, use it directly
-                if isinstance(data, str):
-                    try:
-                        content = base64.urlsafe_b64decode(data)
-                        if isinstance(content, list):
-                            return self._convert_list_to_string(content)
-                        elif isinstance(content, bytes):
-                            return content.decode('utf-8', errors='replace')
-                        else:
-                            return str(content)
-                    except Exception as decode_error:
-                        # If base64 decode fails, try using the string directly
-                        return data
-                else:
-                    # Handle non-string data
-                    if isinstance(data, list):
-                        return self._convert_list_to_string(data)
-                    else:
-                        return str(data)
-            
-            # Try nested parts
-            if 'parts' in part:
-                nested_content = []
-                for nested_part in part['parts']:
-                    nested_text = self._extract_part_content(nested_part)
-                    if nested_text:
-                        nested_content.append(nested_text)
-                return '\n'.join(nested_content)
-            
-            return ""
-            
-        except Exception as e:
-            return f"[Part extraction failed: {str(e)}]"
-    
-    def _debug_part_structure(self, part: dict, depth: int = 0):
-        """Debug helper to print part structure"""
-        indent = "  " * depth
-        mime_type = part.get('mimeType', 'unknown')
-        has_data = 'body' in part and part['body'].get('data')
-        has_parts = 'parts' in part
-        
-        print(f"{indent}Part: {mime_type} | has_data: {has_data} | has_parts: {has_parts}")
-        
-        if has_data:
-            data = part['body']['data']
-            print(f"{indent}  Data type: {type(data)}")
-            if isinstance(data, str):
-                print(f"{indent}  Data length: {len(data)}")
-                print(f"{indent}  Data preview: {data[:100]}...")
-        
-        if has_parts:
-            print(f"{indent}  Nested parts count: {len(part['parts'])}")
-            for i, nested_part in enumerate(part['parts']):
-                print(f"{indent}  Nested part {i+1}:")
-                self._debug_part_structure(nested_part, depth + 2)
-    
-    def _extract_text_from_payload_structure(self, payload: dict) -> str:
-        """Extract any text content from the payload structure"""
-        try:
-            # Look for any text-like fields in the payload
-            text_parts = []
-            
-            # Check for body data
-            if 'body' in payload and payload['body'].get('data'):
-                text_parts.append("Body data present but could not decode")
-            
-            # Check for parts
-            if 'parts' in payload:
-                text_parts.append(f"Multipart message with {len(payload['parts'])} parts")
-                
-                # Try to describe each part
-                for i, part in enumerate(payload['parts']):
-                    mime_type = part.get('mimeType', 'unknown')
-                    has_data = 'body' in part and part['body'].get('data')
-                    text_parts.append(f"Part {i+1}: {mime_type} {'(has data)' if has_data else '(no data)'}")
-            
-            # Check for headers
-            if 'headers' in payload:
-                text_parts.append("Headers present")
-            
-            if text_parts:
-                return '\n'.join(text_parts)
-            else:
-                return "[No extractable content found]"
-                
-        except Exception as e:
-            return f"[Structure extraction failed: {str(e)}]"
-    
-    def _diagnose_payload_structure(self, msg: dict) -> str:
-        """Create a diagnostic summary of the problematic payload structure"""
-        try:
-            payload = msg.get('payload', {})
-            diagnosis = []
-            
-            # Basic structure
-            diagnosis.append(f"Payload keys: {list(payload.keys())}")
-            
-            # Headers info
-            headers = payload.get('headers', [])
-            diagnosis.append(f"Headers count: {len(headers)}")
-            if headers:
-                header_names = [h.get('name', 'unknown') for h in headers[:5]]  # First 5 headers
-                diagnosis.append(f"Header names: {header_names}")
-            
-            # Body info
-            if 'body' in payload:
-                body = payload['body']
-                diagnosis.append(f"Body keys: {list(body.keys())}")
-                if 'data' in body:
-                    data = body['data']
-                    diagnosis.append(f"Body data type: {type(data)}")
-                    if isinstance(data, str):
-                        diagnosis.append(f"Body data length: {len(data)}")
-                        diagnosis.append(f"Body data preview: {data[:100]}...")
-            
-            # Parts info
-            if 'parts' in payload:
-                parts = payload['parts']
-                diagnosis.append(f"Parts count: {len(parts)}")
-                for i, part in enumerate(parts[:3]):  # First 3 parts
-                    part_keys = list(part.keys())
-                    mime_type = part.get('mimeType', 'unknown')
-                    diagnosis.append(f"Part {i+1} keys: {part_keys}, mimeType: {mime_type}")
-                    
-                    if 'body' in part and part['body'].get('data'):
-                        data = part['body']['data']
-                        diagnosis.append(f"Part {i+1} data type: {type(data)}")
-                        if isinstance(data, str):
-                            diagnosis.append(f"Part {i+1} data length: {len(data)}")
-            
-            return ' | '.join(diagnosis)
-            
-        except Exception as e:
-            return f"Diagnosis failed: {str(e)}"
-    
-    def _add_body_parts(self, email_msg: email.message.EmailMessage, payload: dict):
-        """Add body parts to single-part email message"""
-        if 'body' in payload and payload['body'].get('data'):
-            # Single part message
+        ids = list(results)
+        messages = self.service.users().messages()
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
             try:
-                content = base64.urlsafe_b64decode(payload['body']['data'])
-                # Ensure content is a string, not a list
-                if isinstance(content, list):
-                    content = ' '.join(str(item) for item in content)
-                elif not isinstance(content, (str, bytes)):
-                    content = str(content)
-                
-                content_type = payload.get('mimeType', 'text/plain')
-                if '/' in content_type:
-                    maintype, subtype = content_type.split('/', 1)
-                    email_msg.set_content(content, maintype=maintype, subtype=subtype)
+                if self.trash_on_delete:
+                    self._execute(messages.batchModify(userId='me', body={'ids': batch, 'addLabelIds': ['TRASH']}),
+                                  'messages.batchModify')
                 else:
-                    email_msg.set_content(content, maintype=content_type)
-            except Exception as e:
-                print(f"Warning: Error adding body part: {e}")
-                email_msg.set_content("[Body content could not be parsed]")
-    
-    def _add_multipart_parts(self, email_msg: email.message.EmailMessage, payload: dict):
-        """Add parts to multipart email message"""
-        if 'parts' in payload:
-            for part in payload['parts']:
-                try:
-                    part_msg = email.message.EmailMessage()
-                    part_mime_type = part.get('mimeType', 'text/plain')
-                    
-                    if part.get('body', {}).get('data'):
-                        # Part has content
-                        content = base64.urlsafe_b64decode(part['body']['data'])
-                        # Ensure content is a string, not a list
-                        if isinstance(content, list):
-                            content = ' '.join(str(item) for item in content)
-                        elif not isinstance(content, (str, bytes)):
-                            content = str(content)
-                        
-                        if '/' in part_mime_type:
-                            maintype, subtype = part_mime_type.split('/', 1)
-                            part_msg.set_content(content, maintype=maintype, subtype=subtype)
-                        else:
-                            part_msg.set_content(content, maintype=part_mime_type)
-                    elif part.get('parts'):
-                        # Part has nested parts - recurse
-                        self._add_multipart_parts(part_msg, part)
-                    
-                    # Add the part to the main message
-                    email_msg.attach(part_msg)
-                except Exception as e:
-                    print(f"Warning: Error adding multipart part: {e}")
-                    # Create a placeholder part
-                    placeholder_msg = email.message.EmailMessage()
-                    placeholder_msg.set_content("[Part content could not be parsed]")
-                    email_msg.attach(placeholder_msg)
-    
-
+                    self._execute(messages.batchDelete(userId='me', body={'ids': batch}), 'messages.batchDelete')
+            except HttpError as error:
+                print(f"Error deleting {len(batch)} messages: {error}")
+                continue
+            for msg_id in batch:
+                results[msg_id] = True
+        
+        if self.verbose:
+            action = "Trashed" if self.trash_on_delete else "Deleted"
+            print(f"GmailClient: {action} {sum(results.values())} of {len(results)} messages")
+        return results
     
     def delete_message(self, msg_id: str) -> bool:
         """Delete a message by ID"""
-        if not self.connected:
-            self.connect()
-        
-        if not self.allow_delete:
-            print(f"Skipping deletion of message {msg_id} due to allow_delete=False")
-            return False
-
-        try:
-            result = self.service.users().messages().delete(userId='me', id=msg_id).execute()
-            return True
-            
-        except HttpError as error:
-            print(f"Error deleting message {msg_id}: {error}")
-            return False
+        return self.delete_messages([msg_id])[msg_id]
     
     def check_scopes(self):
         """Check what scopes the current token has"""
@@ -1,7 +1,8 @@
 from typing import Iterable, Callable, List, Any
 from abc import ABC, abstractmethod
 from .parsed_email import ParsedEmail
-from .predicates import BEFORE, AFTER, FROM, TO, INVOLVES, OR
+from .predicates import (Predicate, BEFORE, AFTER, FROM, TO, INVOLVES, SUBJECT, BODY, LARGER, SMALLER,
+                         HAS_ATTACHMENT, LABEL, NOT, OR)
 from datetime import datetime, timedelta
 
 
@@ -88,22 +89,48 @@ class FilterableMailbox(ABC):
 
     def exclude_when(self, predicate: Callable[[ParsedEmail], bool]):
         """Add a filter that excludes emails when predicate returns True"""
-        self._filters.append(lambda m: not predicate(m))
+        if isinstance(predicate, Predicate):
+            # Kept as a predicate so clients can push the negation to the server
+            self._filters.append(NOT(predicate))
+        else:
+            self._filters.append(lambda m: not predicate(m))
         return self
 
     def from_(self, sender, verbose: bool = True):
         """Filter by sender (server-side optimized)"""
         return self.include_when(FROM(sender, self))
 
-    @INCLUDE_OR
-    def body_contains(self, text: str, e):
-        """Filter by text in email body"""
-        return text.lower() in e.get_plain_text_body().lower()
+    def body_contains(self, text, verbose: bool = True, prefix: int = None):
+        """
+        Filter by text in email body (server-side optimized)
+        
+        With prefix, only the first `prefix` characters of the body are
+        searched, which avoids downloading whole messages on clients that
+        support partial fetches.
+        """
+        return self.include_when(BODY(text, self, prefix=prefix))
 
-    @INCLUDE_OR
-    def subject_contains(self, text: str, e):
-        """Filter by text in email subject"""
-        return e["subject"] and text.lower() in e["subject"].lower()
+    def subject_contains(self, text, verbose: bool = True):
+        """
+        Filter by text in email subject (server-side optimized)
+        """
+        return self.include_when(SUBJECT(text, self))
+
+    def larger(self, size: int, verbose: bool = True):
+        """Filter emails larger than size bytes (server-side optimized)"""
+        return self.include_when(LARGER(size, self))
+
+    def smaller(self, size: int, verbose: bool = True):
+        """Filter emails smaller than size bytes (server-side optimized)"""
+        return self.include_when(SMALLER(size, self))
+
+    def has_attachment(self, verbose: bool = True):
+        """Filter emails with attachments (server-side optimized)"""
+        return self.include_when(HAS_ATTACHMENT(self))
+
+    def label(self, name, verbose: bool = True):
+        """Filter emails by Gmail label name (server-side optimized)"""
+        return self.include_when(LABEL(name, self))
 
     @INCLUDE_OR
     def reply_to(self, email_address: str, e):
@@ -277,25 +304,59 @@ class FilterableMailbox(ABC):
         pass
 
     def delete(self, verbose=True):
-        """Delete all matching emails from the server"""
+        """
+        Delete all matching emails from the server.
+        
+        Clients with supports_bulk_delete get the matching emails in one
+        delete_messages(uids) call once the iteration has finished, so they
+        can delete them in bulk. A following mailbox never finishes, so
+        there each email is deleted as it arrives.
+        """
         deleted_count = 0
+        client = self._get_client()
+        bulk_delete = client.delete_messages if getattr(client, "supports_bulk_delete", False) else None
+        following = self._is_following()
+        pending = []
+        
+        def delete_pending():
+            results = bulk_delete([email.uid for email in pending])
+            count = 0
+            for email in pending:
+                if results.get(email.uid):
+                    email.deleted_on_server = True
+                    count += 1
+            pending.clear()
+            return count
         
         with EmailIterator(self, verbose) as iterator:
             for email in iterator:
                 if verbose:
                     print("Deleting : %s" % email.envelope)
                 
-                success = self._get_client().delete_message(email.uid)
+                if bulk_delete:
+                    pending.append(email)
+                    if following:
+                        deleted_count += delete_pending()
+                    continue
+                
+                success = client.delete_message(email.uid)
                 if success:
                     # Mark as deleted on server instead of removing from cache
                     email.deleted_on_server = True
                     deleted_count += 1
         
+        if pending:
+            deleted_count += delete_pending()
+        
         if verbose:
             print(f"Successfully deleted {deleted_count} emails")
         
         return self
 
+    def _is_following(self) -> bool:
+        """Whether iterating this mailbox waits for new mail instead of ending"""
+        return False
+
     def list_all(self, limit: int = None, verbose: bool = True):
         """List all matching emails with formatted output"""
         # Set verbose mode for this operation
@@ -400,6 +461,7 @@ class Mailbox(FilterableMailbox):
         self._cached_emails = {}  # Cache for ParsedEmail objects
         self._message_ids_fetched = False  # Track if we've already fetched message IDs
         self._verbose = True  # Default verbose setting
+        self._follow_interval = None  # Poll interval when following new mail
 
     def fetch(self) -> Iterable[ParsedEmail]:
         """Apply filters and return matching emails"""
@@ -415,6 +477,10 @@ class Mailbox(FilterableMailbox):
     
     def _get_emails(self) -> Iterable[ParsedEmail]:
         """Get emails from cache or fetch from client"""
+        if self._follow_interval is not None:
+            # Following never ends, so nothing is cached
+            return self.client.follow(poll_interval=self._follow_interval,
+                                      filters=self._filters, verbose=self._verbose)
         if self._message_ids_fetched:
             # Use cached emails
             return self._cached_emails.values()
@@ -431,10 +497,33 @@ class Mailbox(FilterableMailbox):
         """Get the client for operations like delete"""
         return self.client
 
+    def _is_following(self) -> bool:
+        """Whether iterating this mailbox waits for new mail instead of ending"""
+        return self._follow_interval is not None
+
     def _set_verbose(self, verbose: bool):
         """Set verbose mode for this mailbox"""
         self._verbose = verbose
 
+    def follow(self, poll_interval: float = 1.0):
+        """
+        Keep yielding new emails as they arrive instead of stopping at the end.
+        
+        Iterating the mailbox first yields the existing emails, then waits
+        for new ones. Filters are applied to every email as usual.
+        
+        Args:
+            poll_interval: Seconds between checks for new mail (clients that
+                are pushed new mail, like IMAP with IDLE, ignore it)
+            
+        Returns:
+            self for method chaining
+        """
+        if not hasattr(self.client, "follow"):
+            raise ValueError(f"{type(self.client).__name__} does not support following new mail")
+        self._follow_interval = poll_interval
+        return self
+
     def clear_cache(self):
         """Clear the email cache"""
         self._cached_emails.clear()
@@ -463,6 +552,10 @@ class SubqueryMailbox(FilterableMailbox):
         """Get the client for operations like delete"""
         return self.parent.client
 
+    def _is_following(self) -> bool:
+        """Whether iterating this mailbox waits for new mail instead of ending"""
+        return self.parent._is_following()
+
     def _set_verbose(self, verbose: bool):
         """Set verbose mode for this mailbox"""
         self.parent._verbose = verbose
@@ -28,14 +28,16 @@ class TriagePredicate:
     It handles early termination internally when the limit is reached or user quits.
     """
     
-    def __init__(self, limit: int = 10):
+    def __init__(self, limit: int = 10, preview_chars: int = 2000):
         """
         Initialize the triage predicate.
         
         Args:
             limit: Maximum number of emails to process before stopping
+            preview_chars: Length of the body preview shown before the full body is loaded
         """
         self.limit = limit
+        self.preview_chars = preview_chars
         self.processed_count = 0
         self.console = Console()
         self.replies: List[Dict[str, Any]] = []  # Store replies for later processing
@@ -76,13 +78,14 @@ class TriagePredicate:
         
         return key.lower()
     
-    def format_email_display(self, email: ParsedEmail, scroll_offset: int = 0) -> Layout:
+    def format_email_display(self, email: ParsedEmail, scroll_offset: int = 0, full_body: bool = False) -> Layout:
         """
         Create a formatted display of the email with headers and body.
         
         Args:
             email: The email to display
             scroll_offset: Number of lines to scroll down in the body
+            full_body: Show the whole body rather than a preview of its start
             
         Returns:
             Rich Layout object containing the formatted email
@@ -108,8 +111,13 @@ class TriagePredicate:
         layout["header"].update(Panel(header_text, border_style="cyan"))
         
         # Body section with scrolling
+        preview = not full_body
         try:
-            body_text = email.get_plain_text_body()
+            if preview:
+                # A preview only needs the start of the message, so it shows up quickly
+                body_text = email.get_plain_text_preview(self.preview_chars)
+            else:
+                body_text = email.get_plain_text_body()
             if not body_text.strip():
                 body_text = "[italic]No body content available[/italic]"
         except Exception as e:
@@ -133,10 +141,10 @@ class TriagePredicate:
         visible_body_lines = body_lines[start_line:end_line]
         
         # Add scroll indicators
-        scroll_info = ""
+        scroll_info = " (preview, scroll for more)" if preview and len(body_text) >= self.preview_chars else ""
         if len(body_lines) > visible_lines:
             total_lines = len(body_lines)
-            scroll_info = f" (Line {start_line + 1}-{min(end_line, total_lines)} of {total_lines})"
+            scroll_info += f" (Line {start_line + 1}-{min(end_line, total_lines)} of {total_lines})"
         
         body_panel = Panel(
             '\n'.join(visible_body_lines),
@@ -183,11 +191,12 @@ class TriagePredicate:
             User's choice: 'd' for delete, 'keep' for keep, 'r' for reply, 'q' for quit
         """
         scroll_offset = 0
+        full_body = False
         
         with Live(auto_refresh=False) as live:
             while True:
                 # Update display
-                layout = self.format_email_display(email, scroll_offset)
+                layout = self.format_email_display(email, scroll_offset, full_body)
                 live.update(layout)
                 live.refresh()
                 
@@ -206,6 +215,7 @@ class TriagePredicate:
                     scroll_offset = max(0, scroll_offset - 1)
                 elif key == 'down':
                     scroll_offset += 1
+                    full_body = True  # Load the rest of the message once the user reads on
                 # Invalid key - continue loop
     
     def __call__(self, email: ParsedEmail) -> bool:
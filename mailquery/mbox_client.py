@@ -4,16 +4,315 @@ Mbox Client - Parse and process mbox format email files
 
 This module provides an MboxClient that can read mbox format files (used by
 Pine, Thunderbird, and other email clients) and integrate with the MailQuery
-library's fluent interface.
+library's fluent interface. gzip, xz, bz2 and zstd compressed archives are
+read directly (see mbox_compression).
 """
 
 import os
 import re
+import shutil
+import time
 import email
+import email.parser
 import email.policy
-from typing import Generator, Optional, Dict, Any
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, Optional, Dict, Any, Tuple, List, Iterable
 from datetime import datetime
 from .parsed_email import ParsedEmail, parse_envelope
+from .mbox_index import MboxIndex, header_digest, file_state
+from .mbox_compression import (
+    detect_compression, open_decompressed, read_zstd_seek_table,
+    DecompressedRangeReader, ZstdFrameReader
+)
+
+
+# Read size used by the streaming separator scanner
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Target size of the byte ranges handed to worker processes in parallel mode
+PARALLEL_RANGE_SIZE = 32 * 1024 * 1024
+
+
+def _is_separator_line(line: bytes) -> bool:
+    """
+    Check whether a line is an mbox "From " separator.
+    
+    Mirrors MboxClient._parse_mbox_separator: the line must start with
+    "From " and carry at least a sender and a timestamp token.
+    """
+    return line.startswith(b"From ") and len(line[5:].split()) >= 2
+
+
+def _header_end(raw: bytes) -> int:
+    """Return the offset of the blank line ending the header block (or len(raw))"""
+    ends = [i for i in (raw.find(b"\n\n"), raw.find(b"\r\n\r\n")) if i >= 0]
+    return min(ends) if ends else len(raw)
+
+
+def _header_block_end(buf, end: int) -> int:
+    """
+    Find the end of the header block within buf[:end].
+    
+    Returns:
+        Offset just past the blank line terminating the headers, or -1 if the
+        blank line is not (entirely) within buf[:end]
+    """
+    found = [(i, n) for i, n in ((buf.find(b"\n\n", 0, end), 2), (buf.find(b"\r\n\r\n", 0, end), 4)) if i >= 0]
+    if not found:
+        return -1
+    i, n = min(found)
+    return i + n
+
+
+def iter_mbox_messages(f, offset: int = 0, limit: Optional[int] = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       at_line_start: bool = True,
+                       headers_only: bool = False,
+                       stats: Optional[Dict[str, int]] = None) -> Generator[Tuple[int, int, int, bytes], None, None]:
+    """
+    Stream messages out of a binary mbox file object in a single linear pass.
+    
+    The file is read in fixed-size chunks and searched for "\nFrom " separators,
+    so only the message currently being assembled is held in memory. Anything
+    before the first separator is skipped, as with the line-based reader.
+    
+    With headers_only, each message's header block is kept and body bytes are
+    discarded as soon as they have been searched for separators, so memory use
+    no longer depends on message size.
+    
+    Args:
+        f: Binary file object positioned at the start of a line
+        offset: Absolute byte offset of the current position of f
+        limit: Maximum number of bytes to read from f (None reads to EOF)
+        chunk_size: Number of bytes read per step
+        at_line_start: Whether the current position of f is the start of a line
+            (if not, a separator is only recognised after the next newline)
+        headers_only: Yield only the header block (up to and including the
+            blank line) instead of the whole message
+        stats: Optional dict that receives "end" (absolute offset where
+            reading stopped) and "lines" (newlines read) once the scan ends
+        
+    Yields:
+        (offset, line_number, length, data) for each message, where offset is
+        the absolute byte offset of the separator line, line_number is 1-based
+        and relative to the starting position, length is the message size in
+        bytes and data is the raw message (or its header block)
+    """
+    buf = bytearray()
+    buf_offset = offset   # absolute offset of buf[0]
+    buf_line = 1          # line number of buf[0]
+    msg = None            # [offset, line_number, header block] of the current message
+    check_head = at_line_start  # the very first line may be a separator too
+    pos = 0               # where to resume searching for "\nFrom "
+    consumed = 0
+    eof = False
+    
+    def finish(end):
+        """Build the yielded tuple for the current message ending at buf[end]"""
+        length = buf_offset + end - msg[0]
+        if not headers_only:
+            return msg[0], msg[1], length, bytes(buf[:end])
+        head = msg[2]
+        if head is None:
+            # Nothing has been dropped yet, so buf[0] is still the message start
+            block_end = _header_block_end(buf, end)
+            head = bytes(buf[:block_end if block_end >= 0 else end])
+        return msg[0], msg[1], length, head
+    
+    while True:
+        want = chunk_size if limit is None else min(chunk_size, limit - consumed)
+        chunk = f.read(want) if want > 0 else b""
+        if chunk:
+            buf += chunk
+            consumed += len(chunk)
+        else:
+            eof = True
+        
+        while True:
+            if check_head:
+                if len(buf) < 5 and not eof:
+                    break
+                if not buf.startswith(b"From "):
+                    check_head = False
+                    continue
+                cand = 0
+            else:
+                i = buf.find(b"\nFrom ", pos)
+                if i < 0:
+                    # Keep enough tail to catch a separator split across chunks
+                    pos = max(pos, len(buf) - 5)
+                    break
+                cand = i + 1
+            
+            eol = buf.find(b"\n", cand)
+            if eol < 0 and not eof:
+                # Need the rest of the separator line before deciding
+                if not check_head:
+                    pos = cand - 1
+                break
+            line_end = len(buf) if eol < 0 else eol
+            
+            if not _is_separator_line(bytes(buf[cand:line_end])):
+                if check_head:
+                    check_head = False
+                else:
+                    pos = cand
+                continue
+            check_head = False
+            
+            if msg is not None:
+                yield finish(cand)
+            
+            buf_line += buf.count(b"\n", 0, cand)
+            buf_offset += cand
+            del buf[:cand]
+            msg = [buf_offset, buf_line, None]
+            pos = 0
+        
+        if headers_only and msg is not None and msg[2] is None and pos > 0:
+            # buf[:pos] holds no separator, so a blank line in it ends the headers
+            block_end = _header_block_end(buf, pos)
+            if block_end >= 0:
+                msg[2] = bytes(buf[:block_end])
+        
+        if pos > 0 and (msg is None or msg[2] is not None):
+            # Drop leading garbage, or body bytes already searched for separators
+            buf_line += buf.count(b"\n", 0, pos)
+            buf_offset += pos
+            del buf[:pos]
+            pos = 0
+        
+        if eof:
+            if msg is not None:
+                yield finish(len(buf))
+            if stats is not None:
+                stats["end"] = buf_offset + len(buf)
+                stats["lines"] = buf_line - 1 + buf.count(b"\n")
+            return
+
+
+def parse_mbox_envelope(header_text: str) -> Dict[str, str]:
+    """
+    Parse the envelope fields of one mbox message.
+    
+    Only the header block is parsed; the body is never looked at.
+    
+    Args:
+        header_text: Separator line and headers of the message (a whole
+            message also works, the body is ignored)
+        
+    Returns:
+        Envelope dictionary with plain string values (so it can be indexed
+        and sent between processes)
+    """
+    # Parse using Python's email module with more lenient encoding handling
+    parser = email.parser.HeaderParser(policy=email.policy.default)
+    try:
+        email_message = parser.parsestr(header_text)
+    except UnicodeDecodeError:
+        # If the header has encoding issues, retry with replacement characters
+        header_text = header_text.encode('utf-8', errors='replace').decode('utf-8')
+        email_message = parser.parsestr(header_text)
+    
+    # policy.default parses each header on access, so only fetch From once
+    from_header = str(email_message.get('From', ''))
+    return {
+        "sender": from_header,
+        "from": from_header,  # Alias for consistency
+        "sender_header": str(email_message.get('Sender', '')),  # Separate Sender header
+        "subject": str(email_message.get('Subject', '')),
+        "date": str(email_message.get('Date', '')),
+        "message_id": str(email_message.get('Message-ID', '')),
+        "reply_to": str(email_message.get('Reply-To', '')),
+        "to": str(email_message.get('To', '')),
+        "cc": str(email_message.get('Cc', '')),
+        "bcc": str(email_message.get('Bcc', '')),
+    }
+
+
+def _uid_line(uid: str) -> int:
+    """Return the separator line number encoded in an mbox_<line> UID"""
+    return int(uid.rsplit("_", 1)[1])
+
+
+def _make_entry(uid: str, offset: int, length: int, head: bytes, envelope: Dict[str, str]) -> Dict[str, Any]:
+    """Build the index entry describing one message from its header block"""
+    return {
+        "uid": uid,
+        "offset": offset,
+        "length": length,
+        "body_offset": offset + len(head),
+        "digest": header_digest(head[:_header_end(head)]),
+        "envelope": envelope,
+    }
+
+
+def _align_to_separator(f, pos: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[int]:
+    """
+    Find the first separator line starting at or after byte offset pos.
+    
+    Returns:
+        Offset of the separator, or None if there is none before EOF
+    """
+    if pos <= 0:
+        return 0
+    # Start one byte early so a separator exactly at pos is seen after its newline
+    f.seek(pos - 1)
+    for offset, _, _, _ in iter_mbox_messages(f, offset=pos - 1, chunk_size=chunk_size,
+                                              at_line_start=False, headers_only=True):
+        return offset
+    return None
+
+
+def split_mbox_ranges(path: str, parts: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    Split an mbox file into at most `parts` byte ranges aligned on separators.
+    
+    Returns:
+        List of (start, end) offsets covering the whole file
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for k in range(1, parts):
+            bound = _align_to_separator(f, size * k // parts, chunk_size)
+            if bound is None:
+                break
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _scan_mbox_range(args) -> Tuple[int, List[Tuple[int, Dict[str, Any]]], List[Tuple[int, str]]]:
+    """
+    Worker: parse the envelopes of every message in one byte range.
+    
+    Args:
+        args: (path, start, end, chunk_size) tuple
+        
+    Returns:
+        (line_count, entries, failures) where entries is a list of
+        (relative_line, entry) pairs with the entry's uid left unset, and
+        failures is a list of (relative_line, error message) pairs
+    """
+    path, start, end, chunk_size = args
+    entries = []
+    failures = []
+    stats = {}
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for offset, line_num, length, head in iter_mbox_messages(
+                f, offset=start, limit=end - start, chunk_size=chunk_size, headers_only=True, stats=stats):
+            try:
+                envelope = parse_mbox_envelope(head.decode('utf-8', errors='replace'))
+            except Exception as e:
+                failures.append((line_num, str(e)))
+                continue
+            entries.append((line_num, _make_entry(None, offset, length, head, envelope)))
+    return stats["lines"], entries, failures
 
 
 class MboxClient:
@@ -25,7 +324,12 @@ class MboxClient:
     files and provides emails in the same format as other MailQuery clients.
     """
     
-    def __init__(self, mbox_file_path: str, verbose: bool = True, allow_delete: bool = False):
+    # Mailbox.delete passes all matching UIDs to delete_messages at once
+    supports_bulk_delete = True
+    
+    def __init__(self, mbox_file_path: str, verbose: bool = True, allow_delete: bool = False,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, use_index: bool = True, index_path: str = None,
+                 workers: int = 1, incremental: bool = False, settle_time: float = 2.0):
         """
         Initialize the mbox client.
         
@@ -33,21 +337,51 @@ class MboxClient:
             mbox_file_path: Path to the mbox file to read
             verbose: Whether to print progress information
             allow_delete: Whether to allow actual deletion of emails (default False for safety)
+            chunk_size: Number of bytes read from the file per scanner step
+            use_index: Whether to keep a sidecar byte-offset index next to the mbox file
+            index_path: Path of the sidecar index (default: mbox_file_path + ".idx")
+            workers: Number of processes used to parse headers (1 parses in-process)
+            incremental: Make list_messages yield only messages appended since its previous call
+            settle_time: Seconds without modification after which a trailing message
+                lacking the terminating blank line is considered complete
         """
         self.mbox_path = mbox_file_path
         self.verbose = verbose
         self.allow_delete = allow_delete
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.incremental = incremental
+        self.settle_time = settle_time
         self.connected = False
         self.fetch_limit = None  # Will be set by factory function
         
         # Verify file exists
         if not os.path.exists(mbox_file_path):
             raise FileNotFoundError(f"Mbox file not found: {mbox_file_path}")
+        
+        self.index = MboxIndex(mbox_file_path, index_path) if use_index else None
+        
+        # Compressed archives are decompressed on the fly; for zstd, a frame
+        # index lets body fetches seek (from the seek table if the file has one)
+        self.compression = detect_compression(mbox_file_path)
+        self._zstd_frames = read_zstd_seek_table(mbox_file_path) if self.compression == "zstd" else None
+        self._body_reader = DecompressedRangeReader(mbox_file_path, self.compression) if self.compression else None
+        
+        # Where the last complete scan ended, and where incremental reading resumes
+        self._scan_end: Optional[Dict[str, int]] = None
+        self._tail: Optional[Dict[str, int]] = None
+        
+        # Deletes are recorded as tombstones and applied by one compaction pass.
+        # Each compaction is remembered so bodies of emails listed before it
+        # can still be located in the rewritten file.
+        self._listed_state: Optional[Tuple[int, int]] = None
+        self._tombstones: set = set()
+        self._compactions: List[Tuple[List[int], List[int], List[int]]] = []
     
     def connect(self) -> None:
         """Establish connection to the mbox file (just verify it's readable)"""
         try:
-            with open(self.mbox_path, 'r', encoding='utf-8', errors='ignore') as f:
+            with open(self.mbox_path, 'rb') as f:
                 # Just read first few bytes to verify file is readable
                 f.read(1024)
             self.connected = True
@@ -57,6 +391,8 @@ class MboxClient:
     
     def disconnect(self) -> None:
         """Close the mbox file connection"""
+        if self._body_reader is not None:
+            self._body_reader.close()
         self.connected = False
     
     def select_mailbox(self, mailbox: str = "INBOX") -> None:
@@ -114,80 +450,246 @@ class MboxClient:
             'timestamp': timestamp
         }
     
-    def _parse_email_from_mbox(self, email_content: str, email_id: str) -> Optional[ParsedEmail]:
+    def _parse_envelope_from_mbox(self, email_content: str, email_id: str) -> Optional[Dict[str, str]]:
         """
-        Parse a single email from mbox content.
+        Parse the envelope of a single email from mbox content.
         
         Args:
             email_content: Raw email content (headers + body)
             email_id: Unique identifier for this email
             
         Returns:
-            ParsedEmail object or None if parsing failed
+            Envelope dictionary or None if parsing failed
         """
         try:
-            # Parse using Python's email module with more lenient encoding handling
-            # First, try to clean up the email content to handle encoding issues
-            try:
-                email_message = email.message_from_string(email_content, policy=email.policy.default)
-            except UnicodeDecodeError:
-                # If the email content has encoding issues, try to fix it
-                try:
-                    # Try to decode and re-encode with replacement characters
-                    if isinstance(email_content, str):
-                        # If it's already a string, try to encode it properly
-                        email_content = email_content.encode('utf-8', errors='replace').decode('utf-8')
-                    else:
-                        # If it's bytes, decode with replacement
-                        email_content = email_content.decode('utf-8', errors='replace')
-                    
-                    email_message = email.message_from_string(email_content, policy=email.policy.default)
-                except Exception as inner_e:
-                    if self.verbose:
-                        print(f"MboxClient: Could not parse email {email_id} due to encoding issues: {inner_e}")
-                    return None
-            
-            # Extract headers
-            envelope = {
-                "sender": email_message.get('From', ''),
-                "from": email_message.get('From', ''),  # Alias for consistency
-                "sender_header": email_message.get('Sender', ''),  # Separate Sender header
-                "subject": email_message.get('Subject', ''),
-                "date": email_message.get('Date', ''),
-                "message_id": email_message.get('Message-ID', ''),
-                "reply_to": email_message.get('Reply-To', ''),
-                "to": email_message.get('To', ''),
-                "cc": email_message.get('Cc', ''),
-                "bcc": email_message.get('Bcc', ''),
-            }
+            return parse_mbox_envelope(email_content)
+        except Exception as e:
+            self._report_parse_failure(email_id, e)
+            return None
+    
+    def _report_parse_failure(self, email_id: str, error) -> None:
+        """Print why a message was skipped"""
+        if self.verbose:
+            error_msg = str(error)
+            if "unknown encoding" in error_msg.lower():
+                print(f"MboxClient: Skipping email {email_id} due to encoding issues")
+            else:
+                print(f"MboxClient: Failed to parse email {email_id}: {error}")
+    
+    def _open_stream(self):
+        """Open the mbox file as a binary stream of (decompressed) mbox bytes"""
+        if self.compression:
+            return open_decompressed(self.mbox_path, self.compression, self.chunk_size)
+        return open(self.mbox_path, 'rb')
+    
+    def _read_range(self, offset: int, length: int) -> bytes:
+        """Read `length` bytes starting at `offset` from the (decompressed) mbox file"""
+        if self.compression:
+            return self._body_reader.read(offset, length, self._zstd_frames)
+        with open(self.mbox_path, 'rb') as f:
+            if hasattr(os, 'pread'):
+                return os.pread(f.fileno(), length, offset)
+            f.seek(offset)
+            return f.read(length)
+    
+    def _make_email(self, uid: str, envelope: Dict[str, str], offset: int, length: int) -> ParsedEmail:
+        """Create a ParsedEmail whose body is re-read from its byte range on demand"""
+        def make_body_fetcher(offset=offset, length=length, epoch=len(self._compactions)):
+            def fetch_body():
+                current = self._relocate(offset, epoch)
+                if current is None:
+                    return b""  # deleted by a compaction
+                return self._read_range(current, length)
+            return fetch_body
+        
+        return ParsedEmail(uid, envelope, make_body_fetcher())
+    
+    def _scan_entries(self, verbose_mode: bool, start: int = 0, line_base: int = 0,
+                      prior: Optional[Iterable[Dict[str, Any]]] = None) -> Generator[Dict[str, Any], None, None]:
+        """
+        Scan the mbox file, yielding one index entry per message.
+        
+        When indexing is enabled and the scan covers the whole file (it starts
+        at offset 0, or `prior` supplies the entries before `start`), the
+        entries are also streamed into a new sidecar index, which is installed
+        only if the scan runs to the end.
+        
+        Args:
+            verbose_mode: Whether to print progress information
+            start: Byte offset of the separator to start scanning at
+            line_base: Number of newlines before `start`
+            prior: Already known entries for the part of the file before `start`
+        """
+        writer = None
+        if self.index and (start == 0 or prior is not None):
+            writer = self.index.writer(self.index.file_state())
+        stats = {}
+        last = None
+        completed = False
+        try:
+            for entry in prior or ():
+                if writer:
+                    writer.add(entry)
+                last = entry
+                yield entry
             
-            # Create lazy body fetcher with encoding error handling
-            def make_body_fetcher(email_content=email_content):
-                def fetch_body():
-                    try:
-                        return email_content.encode('utf-8')
-                    except UnicodeEncodeError:
-                        # If the content can't be encoded as UTF-8, try with replacement characters
-                        return email_content.encode('utf-8', errors='replace')
-                return fetch_body
+            if start == 0 and self.workers > 1 and not self.compression:
+                entries = self._scan_entries_parallel(verbose_mode, stats)
+            else:
+                if self.workers > 1 and self.compression and verbose_mode:
+                    print(f"MboxClient: {self.compression} input can't be split into ranges, parsing serially")
+                entries = self._scan_entries_serial(stats, start, line_base)
+            for entry in entries:
+                if writer:
+                    writer.add(entry)
+                last = entry
+                yield entry
+            completed = True
+            self._scan_end = {"offset": stats["end"], "lines": stats["lines"]}
+        finally:
+            if writer:
+                trailer = {"lines": stats.get("lines"), "last": last}
+                if self._zstd_frames:
+                    trailer["frames"] = self._zstd_frames
+                if completed and writer.commit(trailer):
+                    if verbose_mode:
+                        print(f"MboxClient: Wrote index {self.index.index_path}")
+                else:
+                    writer.abort()
+    
+    def _scan_entries_serial(self, stats: Dict[str, int], start: int = 0,
+                             line_base: int = 0) -> Generator[Dict[str, Any], None, None]:
+        """Parse every message in a single pass over the (decompressed) file"""
+        scan_stats = {}
+        with self._open_stream() as f:
+            if start:
+                f.seek(start)
+            for offset, line_num, length, head in iter_mbox_messages(
+                    f, offset=start, chunk_size=self.chunk_size, headers_only=True, stats=scan_stats):
+                email_id = f"mbox_{line_base + line_num}"
+                envelope = self._parse_envelope_from_mbox(head.decode('utf-8', errors='replace'), email_id)
+                if envelope is not None:
+                    yield _make_entry(email_id, offset, length, head, envelope)
             
-            return ParsedEmail(email_id, envelope, make_body_fetcher())
+            if isinstance(f, ZstdFrameReader) and not self._zstd_frames:
+                # Remember where frames start so body fetches can seek
+                self._zstd_frames = f.frames
+        
+        stats["end"] = scan_stats["end"]
+        stats["lines"] = line_base + scan_stats["lines"]
+    
+    def _scan_entries_parallel(self, verbose_mode: bool, stats: Dict[str, int]) -> Generator[Dict[str, Any], None, None]:
+        """
+        Parse byte ranges of the file in worker processes, yielding entries in file order.
+        
+        The file is split into ranges aligned on separators. At most two ranges
+        per worker are in flight, so results don't pile up in the parent when
+        the consumer is slower than the workers.
+        """
+        size = os.path.getsize(self.mbox_path)
+        parts = max(self.workers, -(-size // PARALLEL_RANGE_SIZE))
+        ranges = split_mbox_ranges(self.mbox_path, parts, self.chunk_size)
+        if verbose_mode:
+            print(f"MboxClient: Parsing {len(ranges)} ranges with {self.workers} workers")
+        
+        tasks = iter(ranges)
+        pending = deque()
+        line_base = 0
+        
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            def submit_next():
+                task = next(tasks, None)
+                if task is not None:
+                    pending.append(executor.submit(
+                        _scan_mbox_range, (self.mbox_path, task[0], task[1], self.chunk_size)))
             
-        except Exception as e:
-            if self.verbose:
-                error_msg = str(e)
-                if "unknown encoding" in error_msg.lower():
-                    print(f"MboxClient: Skipping email {email_id} due to encoding issues")
-                else:
-                    print(f"MboxClient: Failed to parse email {email_id}: {e}")
+            try:
+                for _ in range(self.workers * 2):
+                    submit_next()
+                
+                while pending:
+                    line_count, entries, failures = pending.popleft().result()
+                    submit_next()
+                    
+                    for line_num, error in failures:
+                        self._report_parse_failure(f"mbox_{line_base + line_num}", error)
+                    for line_num, entry in entries:
+                        entry["uid"] = f"mbox_{line_base + line_num}"
+                        yield entry
+                    line_base += line_count
+            finally:
+                for future in pending:
+                    future.cancel()
+        
+        stats["end"] = ranges[-1][1] if ranges else 0
+        stats["lines"] = line_base
+    
+    def _index_resume_point(self) -> Optional[Dict[str, Any]]:
+        """
+        Check whether the file only grew since the sidecar index was written.
+        
+        Returns:
+            The last indexed entry if its header is still in place (so the
+            scan can resume there), otherwise None
+        """
+        if self.compression:
+            return None
+        header = self.index.header()
+        last = self.index.trailer().get("last")
+        if not header or not last or header.get("size", 0) > os.path.getsize(self.mbox_path):
             return None
+        head = self._read_range(last["offset"], last["body_offset"] - last["offset"])
+        if header_digest(head[:_header_end(head)]) != last["digest"]:
+            return None
+        return last
+    
+    def _iter_entries(self, verbose_mode: bool) -> Generator[Dict[str, Any], None, None]:
+        """
+        Yield index entries for the whole file.
+        
+        Entries come from the sidecar index if it is current. If the file has
+        only grown since it was indexed, the index is extended by scanning
+        from its last message onwards (that message is re-scanned in case it
+        was still being written). Otherwise the whole file is scanned.
+        """
+        self._listed_state = file_state(self.mbox_path)
+        if self.index and self.index.is_current():
+            if verbose_mode:
+                print(f"MboxClient: Using index {self.index.index_path}")
+            trailer = self.index.trailer()
+            if self.compression == "zstd" and not self._zstd_frames:
+                self._zstd_frames = trailer.get("frames")
+            yield from self.index.entries()
+            self._scan_end = {"offset": self.index.header()["size"], "lines": trailer.get("lines")}
+            return
+        
+        last = self._index_resume_point() if self.index else None
+        if last:
+            if verbose_mode:
+                print(f"MboxClient: Extending index {self.index.index_path} from offset {last['offset']}")
+            prior = (entry for entry in self.index.entries() if entry["offset"] < last["offset"])
+            yield from self._scan_entries(verbose_mode, start=last["offset"],
+                                          line_base=_uid_line(last["uid"]) - 1, prior=prior)
+        else:
+            yield from self._scan_entries(verbose_mode)
     
     def list_messages(self, mailbox: str = "INBOX", filters: list = None, verbose: bool = None) -> Generator[ParsedEmail, None, None]:
         """
         List all messages in the mbox file, yielding ParsedEmail objects
         
-        This parses the entire mbox file and yields emails one by one.
+        The file is scanned once, in binary mode and in fixed-size chunks, so
+        memory use is bounded by the largest single message rather than the
+        size of the archive. Bodies are re-read from disk by byte range when
+        they are actually needed. If the sidecar index matches the file, the
+        scan is skipped entirely.
+        
+        With incremental=True, only messages appended since the previous call
+        are listed (see list_new_messages).
         """
+        if self.incremental:
+            yield from self.list_new_messages(verbose=verbose)
+            return
+        
         if not self.connected:
             self.connect()
         
@@ -197,96 +699,286 @@ class MboxClient:
             print(f"MboxClient: Reading messages from {self.mbox_path}")
         
         try:
-            # Try to read the file with better encoding handling
-            try:
-                with open(self.mbox_path, 'r', encoding='utf-8', errors='replace') as f:
-                    lines = f.readlines()
-            except UnicodeDecodeError:
-                # Fallback to latin-1 if UTF-8 fails
-                with open(self.mbox_path, 'r', encoding='latin-1', errors='replace') as f:
-                    lines = f.readlines()
-            
-            current_email_content = []
-            current_email_id = None
             email_count = 0
             
-            for line_num, line in enumerate(lines, 1):
-                # Check if this is an mbox separator
-                separator_info = self._parse_mbox_separator(line)
-                
-                if separator_info and current_email_content:
-                    # We found a new email, process the previous one
-                    if current_email_id:
-                        try:
-                            email_content = ''.join(current_email_content)
-                        except UnicodeDecodeError:
-                            # Handle encoding issues in the joined content
-                            if verbose_mode:
-                                print(f"MboxClient: Skipping email {current_email_id} due to encoding issues in content")
-                            current_email_content = [line]
-                            current_email_id = f"mbox_{line_num}"
-                            continue
-                        
-                        email = self._parse_email_from_mbox(
-                            email_content, 
-                            current_email_id
-                        )
-                        if email:
-                            email_count += 1
-                            if verbose_mode:
-                                print(f"MboxClient: Parsed email {email_count}: {email.envelope.get('subject', 'No Subject')}")
-                            yield email
-                        
-                        # Check fetch limit
-                        if self.fetch_limit and email_count >= self.fetch_limit:
-                            if verbose_mode:
-                                print(f"MboxClient: Reached fetch limit of {self.fetch_limit}")
-                            break
-                    
-                    # Start new email
-                    current_email_content = [line]
-                    current_email_id = f"mbox_{line_num}"
-                
-                elif separator_info:
-                    # First email in file
-                    current_email_content = [line]
-                    current_email_id = f"mbox_{line_num}"
-                
-                else:
-                    # Regular line, add to current email
-                    current_email_content.append(line)
-                
-                # Process the last email
-                if current_email_content and current_email_id:
-                    try:
-                        email_content = ''.join(current_email_content)
-                    except UnicodeDecodeError:
-                        if verbose_mode:
-                            print(f"MboxClient: Skipping final email {current_email_id} due to encoding issues")
-                        email = None
-                    else:
-                        email = self._parse_email_from_mbox(
-                            email_content, 
-                            current_email_id
-                        )
-                    if email:
-                        email_count += 1
-                        if verbose_mode:
-                            print(f"MboxClient: Parsed email {email_count}: {email.envelope.get('subject', 'No Subject')}")
-                        yield email
+            for entry in self._iter_entries(verbose_mode):
+                email = self._make_email(entry["uid"], entry["envelope"], entry["offset"], entry["length"])
+                email_count += 1
+                if verbose_mode:
+                    print(f"MboxClient: Parsed email {email_count}: {email.envelope.get('subject', 'No Subject')}")
+                yield email
                 
+                # Check fetch limit
+                if self.fetch_limit and email_count >= self.fetch_limit:
+                    if verbose_mode:
+                        print(f"MboxClient: Reached fetch limit of {self.fetch_limit}")
+                    break
+            
+            if verbose_mode:
+                print(f"MboxClient: Total emails parsed: {email_count}")
+        
+        except Exception as e:
+            raise RuntimeError(f"Failed to read mbox file: {e}")
+    
+    def _is_complete(self, entry: Dict[str, Any]) -> bool:
+        """
+        Check whether the last message in the file has been completely written.
+        
+        Mbox writers terminate every message with a blank line. A message
+        without one is still accepted once the file has been left alone for
+        settle_time seconds.
+        """
+        end = entry["offset"] + entry["length"]
+        tail = self._read_range(max(entry["offset"], end - 3), min(3, entry["length"]))
+        if tail.endswith(b"\n\n") or tail.endswith(b"\n\r\n"):
+            return True
+        return time.time() - os.path.getmtime(self.mbox_path) >= self.settle_time
+    
+    def list_new_messages(self, verbose: bool = None) -> Generator[ParsedEmail, None, None]:
+        """
+        Yield only the messages appended since the previous call.
+        
+        The first call lists the whole file (using the sidecar index when it
+        is current). Later calls scan from the offset where the previous call
+        stopped. A trailing message that still looks incomplete is held back
+        and listed by a later call. If the file shrank (e.g. it was rewritten),
+        the next call lists the whole file again.
+        """
+        if self.compression:
+            raise ValueError(f"Incremental reading needs an uncompressed mbox file, not {self.compression}")
+        if not self.connected:
+            self.connect()
+        
+        verbose_mode = verbose if verbose is not None else self.verbose
+        
+        try:
+            size = os.path.getsize(self.mbox_path)
+            if self._tail and size < self._tail["offset"]:
                 if verbose_mode:
-                    print(f"MboxClient: Total emails parsed: {email_count}")
+                    print(f"MboxClient: {self.mbox_path} shrank, reading it from the start")
+                self._tail = None
+            
+            if self._tail is None:
+                entries = self._iter_entries(verbose_mode)
+            elif size > self._tail["offset"]:
+                self._listed_state = file_state(self.mbox_path)
+                entries = self._scan_entries(verbose_mode, start=self._tail["offset"],
+                                             line_base=self._tail["lines"])
+            else:
+                return
+            
+            # Look one entry ahead so the last message can be checked for completeness
+            count = 0
+            pending = None
+            for entry in entries:
+                if pending is not None:
+                    count += 1
+                    yield self._make_email(pending["uid"], pending["envelope"], pending["offset"], pending["length"])
+                pending = entry
+            
+            tail = self._scan_end
+            if pending is not None:
+                if self._is_complete(pending):
+                    count += 1
+                    yield self._make_email(pending["uid"], pending["envelope"], pending["offset"], pending["length"])
+                else:
+                    tail = {"offset": pending["offset"], "lines": _uid_line(pending["uid"]) - 1}
+            self._tail = tail
+            
+            if verbose_mode and count:
+                print(f"MboxClient: {count} new emails in {self.mbox_path}")
         
+        except ValueError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Failed to read mbox file: {e}")
     
+    def follow(self, poll_interval: float = 1.0, filters: list = None, verbose: bool = None) -> Generator[ParsedEmail, None, None]:
+        """
+        Yield messages as they are appended to the mbox file, indefinitely.
+        
+        Starts with the messages already in the file, then polls the file
+        size every poll_interval seconds. Stop by closing the generator (or
+        with Ctrl-C).
+        
+        Args:
+            poll_interval: Seconds to wait between checks for new messages
+            filters: Accepted for interface consistency with list_messages
+            verbose: Whether to print diagnostic messages
+        """
+        while True:
+            yield from self.list_new_messages(verbose=verbose)
+            time.sleep(poll_interval)
+    
+    def _relocate(self, offset: int, epoch: int) -> Optional[int]:
+        """
+        Map a byte offset recorded before compaction number `epoch` to the current file.
+        
+        Returns:
+            The current offset, or None if the message at offset was deleted
+        """
+        for starts, ends, removed_before in self._compactions[epoch:]:
+            i = bisect_right(starts, offset) - 1
+            if i >= 0 and offset < ends[i]:
+                return None
+            offset -= removed_before[i + 1]
+        return offset
+    
+    def _copy_range(self, src, dst, length: int) -> int:
+        """Copy length bytes from src to dst (all remaining bytes if length < 0)"""
+        copied = 0
+        while length < 0 or copied < length:
+            step = self.chunk_size if length < 0 else min(self.chunk_size, length - copied)
+            data = src.read(step)
+            if not data:
+                break
+            dst.write(data)
+            copied += len(data)
+        return copied
+    
+    def _count_newlines(self, src, length: int) -> int:
+        """Skip over length bytes of src, returning the number of newlines in them"""
+        count = 0
+        while length > 0:
+            data = src.read(min(self.chunk_size, length))
+            if not data:
+                break
+            count += data.count(b"\n")
+            length -= len(data)
+        return count
+    
+    def compact(self, verbose: bool = None) -> List[str]:
+        """
+        Rewrite the mbox file without the messages marked for deletion.
+        
+        Surviving byte ranges are streamed into a temporary file next to the
+        mbox, which then atomically replaces it, so the archive is rewritten
+        once however many messages are removed. The sidecar index is rewritten
+        with the new offsets instead of being rebuilt by a rescan.
+        
+        Messages after a deleted one get new UIDs (UIDs are line numbers), so
+        list the mailbox again before deleting more messages.
+        
+        Args:
+            verbose: Whether to print progress information
+            
+        Returns:
+            List of UIDs that were removed from the file
+        """
+        verbose_mode = verbose if verbose is not None else self.verbose
+        tombstones, self._tombstones = self._tombstones, set()
+        if not tombstones:
+            return []
+        
+        if self.compression:
+            print(f"MboxClient: Can't delete from {self.compression} compressed file {self.mbox_path}")
+            return []
+        if self._listed_state != file_state(self.mbox_path):
+            print(f"MboxClient: {self.mbox_path} changed since it was listed, not deleting {len(tombstones)} emails")
+            return []
+        
+        # Locate the doomed messages (from the index when it is current)
+        doomed = [(entry["offset"], entry["length"], entry["uid"])
+                  for entry in self._iter_entries(False) if entry["uid"] in tombstones]
+        if not doomed:
+            return []
+        state = file_state(self.mbox_path)
+        index_current = self.index is not None and self.index.is_current(state)
+        
+        if verbose_mode:
+            print(f"MboxClient: Removing {len(doomed)} emails from {self.mbox_path}")
+        
+        tmp_path = f"{self.mbox_path}.compact.tmp.{os.getpid()}"
+        removed_lines = [0]
+        removed_bytes = [0]
+        try:
+            with open(self.mbox_path, "rb") as src, open(tmp_path, "wb") as dst:
+                pos = 0
+                for offset, length, _ in doomed:
+                    self._copy_range(src, dst, offset - pos)
+                    removed_lines.append(removed_lines[-1] + self._count_newlines(src, length))
+                    removed_bytes.append(removed_bytes[-1] + length)
+                    pos = offset + length
+                self._copy_range(src, dst, -1)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copymode(self.mbox_path, tmp_path)
+            
+            if file_state(self.mbox_path) != state:
+                print(f"MboxClient: {self.mbox_path} changed during compaction, not deleting")
+                os.remove(tmp_path)
+                return []
+            os.replace(tmp_path, self.mbox_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        starts = [offset for offset, _, _ in doomed]
+        ends = [offset + length for offset, length, _ in doomed]
+        self._compactions.append((starts, ends, removed_bytes))
+        
+        def shift(entry):
+            i = bisect_right(starts, entry["offset"])
+            line = _uid_line(entry["uid"]) - removed_lines[i]
+            return dict(entry, uid=f"mbox_{line}", offset=entry["offset"] - removed_bytes[i],
+                        body_offset=entry["body_offset"] - removed_bytes[i])
+        
+        if index_current:
+            trailer = self.index.trailer()
+            writer = self.index.writer(file_state(self.mbox_path))
+            last = None
+            for entry in self.index.entries():
+                if entry["uid"] not in tombstones:
+                    last = shift(entry)
+                    writer.add(last)
+            if not writer.commit({"lines": trailer["lines"] - removed_lines[-1], "last": last}):
+                writer.abort()
+        
+        # UIDs listed before the compaction no longer match the file
+        self._listed_state = None
+        if self._tail:
+            i = bisect_right(starts, self._tail["offset"])
+            self._tail = {"offset": self._tail["offset"] - removed_bytes[i],
+                          "lines": self._tail["lines"] - removed_lines[i]}
+        self._scan_end = None
+        
+        return [uid for _, _, uid in doomed]
+    
+    def delete_messages(self, uids: List[str]) -> Dict[str, bool]:
+        """
+        Delete several messages from the mbox file with a single rewrite.
+        
+        Note: This is a destructive operation that modifies the original file.
+        Consider backing up the file before using this feature.
+        
+        Args:
+            uids: The email UIDs to delete, as listed by list_messages
+            
+        Returns:
+            Dictionary mapping each UID to True if it was deleted
+        """
+        results = {uid: False for uid in uids}
+        if not self.allow_delete:
+            print(f"MboxClient: Skipping deletion of {len(results)} messages due to allow_delete=False")
+            return results
+        
+        self._tombstones.update(uids)
+        try:
+            for uid in self.compact():
+                results[uid] = True
+        except Exception as e:
+            print(f"MboxClient: Failed to delete messages: {e}")
+        return results
+    
     def delete_message(self, uid: str) -> bool:
         """
         Delete a message from the mbox file.
         
         Note: This is a destructive operation that modifies the original file.
-        Consider backing up the file before using this feature.
+        Consider backing up the file before using this feature. Deleting many
+        messages one at a time rewrites the file each time; use
+        delete_messages (or Mailbox.delete) instead.
         
         Args:
             uid: The email UID to delete
@@ -294,15 +986,7 @@ class MboxClient:
         Returns:
             True if deletion was successful, False otherwise
         """
-        if not self.allow_delete:
-            print(f"MboxClient: Skipping deletion of message {uid} due to allow_delete=False")
-            return False
-        
-        # TODO: Implement mbox file modification
-        # This would require rewriting the file without the specified email
-        if self.verbose:
-            print(f"MboxClient: Delete not implemented yet for email {uid}")
-        return False
+        return self.delete_messages([uid])[uid]
 
 
 
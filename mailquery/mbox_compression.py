@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Mbox Compression - Transparent decompression of compressed mbox archives
+
+This module lets MboxClient read .mbox.gz, .mbox.xz, .mbox.bz2 and .mbox.zst
+files directly, streaming the decompressed bytes into the separator scanner
+instead of decompressing to disk first. Byte offsets used by the scanner and
+the sidecar index refer to positions in the decompressed stream.
+
+For zstd archives a frame index (compressed offset, decompressed offset of
+each frame) is recorded while scanning, or read from the seek table of files
+written in the zstd seekable format. Lazy body fetches then start decoding at
+the frame containing the message instead of at the start of the file.
+Without a frame index there's nothing to seek to, so body fetches keep the
+decompressed stream open and read on from where the previous fetch stopped:
+fetching bodies in file order decodes the file once, not once per message.
+
+zstd support needs the optional `zstandard` package (pip install zstandard).
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import struct
+import threading
+from bisect import bisect_right
+from typing import Optional, List, Tuple
+
+
+# Magic numbers used to recognise compressed files
+COMPRESSION_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"BZh", "bz2"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+
+# zstd seekable format: skippable frame magic and seek table footer magic
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+ZSTD_SEEKABLE_FOOTER_MAGIC = 0x8F92EAB1
+
+DEFAULT_READ_SIZE = 1024 * 1024
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """
+    Detect the compression format of a file from its magic number.
+
+    Returns:
+        "gzip", "xz", "bz2", "zstd", or None for an uncompressed file
+    """
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    for prefix, name in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return name
+    return None
+
+
+def _require_zstandard():
+    """Import the optional zstandard package"""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("Reading zstd compressed mbox files requires the 'zstandard' package "
+                          "(pip install zstandard)") from e
+    return zstandard
+
+
+class ZstdFrameReader:
+    """
+    Streaming zstd decompressor that records where each frame starts.
+
+    Behaves like a binary file opened for reading. After (or during) a read
+    through the stream, `frames` lists (compressed_offset, decompressed_offset)
+    for every frame seen, which is what DecompressedRangeReader needs to seek.
+    """
+
+    def __init__(self, fileobj, comp_offset: int = 0, decomp_offset: int = 0,
+                 read_size: int = DEFAULT_READ_SIZE):
+        """
+        Initialize the reader.
+
+        Args:
+            fileobj: Binary file object positioned at the start of a frame
+            comp_offset: Absolute compressed offset of the current position of fileobj
+            decomp_offset: Decompressed offset corresponding to comp_offset
+            read_size: Number of compressed bytes read per step
+        """
+        zstandard = _require_zstandard()
+        self._dctx = zstandard.ZstdDecompressor()
+        self._f = fileobj
+        self._read_size = read_size
+        self._obj = None            # decompressor for the frame in progress
+        self._input = b""           # compressed bytes not yet fed to a decompressor
+        self._pending = bytearray() # decompressed bytes not yet returned
+        self._comp_pos = comp_offset
+        self._decomp_pos = decomp_offset
+        self._eof = False
+        self.frames: List[Tuple[int, int]] = []
+
+    def _fill(self) -> None:
+        """Decompress the next piece of input into the pending buffer"""
+        if not self._input:
+            self._input = self._f.read(self._read_size)
+            if not self._input:
+                self._eof = True
+                return
+
+        if self._obj is None:
+            # A new frame starts at the current compressed position
+            self.frames.append((self._comp_pos, self._decomp_pos))
+            self._obj = self._dctx.decompressobj()
+
+        data, self._input = self._input, b""
+        out = self._obj.decompress(data)
+        consumed = len(data)
+        if self._obj.eof:
+            self._input = self._obj.unused_data
+            consumed -= len(self._input)
+            self._obj = None
+
+        self._comp_pos += consumed
+        self._decomp_pos += len(out)
+        self._pending += out
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size decompressed bytes (all remaining bytes if size < 0)"""
+        while (size < 0 or len(self._pending) < size) and not self._eof:
+            self._fill()
+        if size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def close(self) -> None:
+        """Close the underlying file"""
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_zstd_seek_table(path: str) -> Optional[List[Tuple[int, int]]]:
+    """
+    Read the frame index from a file written in the zstd seekable format.
+
+    Returns:
+        List of (compressed_offset, decompressed_offset) per frame, or None
+        if the file has no seek table
+    """
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        size = f.tell()
+        if size < 17:
+            return None
+        f.seek(size - 9)
+        num_frames, descriptor, magic = struct.unpack("<IBI", f.read(9))
+        if magic != ZSTD_SEEKABLE_FOOTER_MAGIC:
+            return None
+
+        entry_size = 12 if descriptor & 0x80 else 8
+        table_size = num_frames * entry_size + 9
+        if size < table_size + 8:
+            return None
+        f.seek(size - table_size - 8)
+        skippable_magic, frame_size = struct.unpack("<II", f.read(8))
+        if skippable_magic != ZSTD_SKIPPABLE_MAGIC or frame_size != table_size:
+            return None
+
+        table = f.read(num_frames * entry_size)
+
+    frames = []
+    comp = decomp = 0
+    for i in range(num_frames):
+        comp_size, decomp_size = struct.unpack_from("<II", table, i * entry_size)
+        frames.append((comp, decomp))
+        comp += comp_size
+        decomp += decomp_size
+    return frames
+
+
+def open_decompressed(path: str, compression: str, read_size: int = DEFAULT_READ_SIZE):
+    """
+    Open a compressed file as a stream of decompressed bytes.
+
+    For zstd the returned ZstdFrameReader records frame offsets as it goes.
+    """
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "xz":
+        return lzma.open(path, "rb")
+    if compression == "bz2":
+        return bz2.open(path, "rb")
+    if compression == "zstd":
+        return ZstdFrameReader(open(path, "rb"), read_size=read_size)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+class DecompressedRangeReader:
+    """
+    Reads byte ranges of the decompressed stream of a compressed file.
+
+    The stream stays open between reads, so ranges read in increasing order
+    cost one pass over the file in total. Reading before the current position
+    reopens the stream, starting at the frame containing the offset for zstd
+    when a frame index is available (also used to jump ahead past whole
+    frames). A change to the file reopens it too.
+    """
+
+    def __init__(self, path: str, compression: str):
+        """
+        Initialize the reader.
+
+        Args:
+            path: Path of the compressed file
+            compression: Compression format, as returned by detect_compression
+        """
+        self.path = path
+        self.compression = compression
+        self._stream = None
+        self._pos = 0        # decompressed offset of the stream's next byte
+        self._state = None   # (size, mtime) of the file when the stream was opened
+        self._lock = threading.Lock()
+
+    def _open(self, offset: int, frames: Optional[List[Tuple[int, int]]]) -> None:
+        """Open a stream positioned at or before decompressed offset"""
+        self.close()
+        if self.compression == "zstd":
+            comp_start, decomp_start = _frame_containing(frames, offset)
+            f = open(self.path, "rb")
+            f.seek(comp_start)
+            self._stream = ZstdFrameReader(f, comp_start, decomp_start)
+            self._pos = decomp_start
+        else:
+            self._stream = open_decompressed(self.path, self.compression)
+            self._pos = 0
+
+    def read(self, offset: int, length: int, frames: Optional[List[Tuple[int, int]]] = None) -> bytes:
+        """
+        Read `length` decompressed bytes starting at decompressed `offset`.
+
+        Args:
+            offset: Decompressed offset of the first byte
+            length: Number of bytes to read
+            frames: zstd frame index, (compressed_offset, decompressed_offset) per frame
+        """
+        with self._lock:
+            stat = os.stat(self.path)
+            state = (stat.st_size, stat.st_mtime)
+            if (self._stream is None or offset < self._pos or state != self._state
+                    or (self.compression == "zstd" and _frame_containing(frames, offset)[1] > self._pos)):
+                self._open(offset, frames)
+                self._state = state
+
+            skip = offset - self._pos
+            while skip > 0:
+                skipped = len(self._stream.read(min(skip, DEFAULT_READ_SIZE)))
+                if not skipped:
+                    break
+                skip -= skipped
+                self._pos += skipped
+            data = self._stream.read(length)
+            self._pos += len(data)
+            return data
+
+    def close(self) -> None:
+        """Close the open stream, if any"""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+def _frame_containing(frames: Optional[List[Tuple[int, int]]], offset: int) -> Tuple[int, int]:
+    """(compressed, decompressed) start of the zstd frame containing offset, (0, 0) if unknown"""
+    if frames:
+        i = bisect_right([decomp for _, decomp in frames], offset) - 1
+        if i >= 0:
+            return frames[i]
+    return 0, 0
+
+
+def read_decompressed_range(path: str, compression: str, offset: int, length: int,
+                            frames: Optional[List[Tuple[int, int]]] = None) -> bytes:
+    """
+    Read `length` decompressed bytes starting at decompressed `offset`.
+
+    zstd files start decoding at the frame containing the offset when a frame
+    index is available. Other formats have to decode from the start of the
+    file up to the offset; use a DecompressedRangeReader to read several
+    ranges in one pass.
+    """
+    reader = DecompressedRangeReader(path, compression)
+    try:
+        return reader.read(offset, length, frames)
+    finally:
+        reader.close()
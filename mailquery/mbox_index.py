@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Mbox Index - Persistent byte-offset index for mbox files
+
+This module maintains a sidecar file (e.g. archive.mbox.idx) next to an mbox
+file. The index records, for every message, its byte offset and length, a
+digest of its header block and its parsed envelope, together with the size
+and mtime of the mbox file it was built from. While the mbox file is
+unchanged, MboxClient can list messages straight from the index without
+scanning the archive, and fetch bodies by reading just their byte range.
+
+The index is stored as JSON lines: a header line followed by one line per
+message and an optional trailer line (e.g. the frame offsets of a zstd
+archive), so it can be written and read back in constant memory.
+"""
+
+import os
+import json
+import hashlib
+from typing import Generator, Optional, Dict, Any, Tuple
+
+
+INDEX_VERSION = 3
+INDEX_SUFFIX = ".idx"
+
+
+def file_state(path: str) -> Tuple[int, int]:
+    """Return the (size, mtime_ns) used to tell whether a file has changed"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def header_digest(header_bytes: bytes) -> str:
+    """Return a short digest identifying a message's header block"""
+    return hashlib.sha1(header_bytes).hexdigest()
+
+
+class MboxIndex:
+    """
+    Sidecar index of message byte ranges for a single mbox file.
+    """
+
+    def __init__(self, mbox_path: str, index_path: str = None):
+        """
+        Initialize the index.
+
+        Args:
+            mbox_path: Path to the mbox file being indexed
+            index_path: Path of the sidecar file (default: mbox_path + ".idx")
+        """
+        self.mbox_path = mbox_path
+        self.index_path = index_path or mbox_path + INDEX_SUFFIX
+
+    def file_state(self) -> Tuple[int, int]:
+        """Return the (size, mtime_ns) of the mbox file"""
+        return file_state(self.mbox_path)
+
+    def _read_header(self, f) -> Optional[Dict[str, Any]]:
+        """Read and validate the header line of an open index file"""
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return None
+        if not isinstance(header, dict) or header.get("version") != INDEX_VERSION:
+            return None
+        return header
+
+    def header(self) -> Optional[Dict[str, Any]]:
+        """Return the index header (version, size and mtime of the indexed file), or None"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return self._read_header(f)
+        except OSError:
+            return None
+
+    def is_current(self, state: Tuple[int, int] = None) -> bool:
+        """Check whether the index exists and matches the mbox file's size and mtime"""
+        state = state or self.file_state()
+        header = self.header()
+        return header is not None and (header.get("size"), header.get("mtime")) == tuple(state)
+
+    def entries(self) -> Generator[Dict[str, Any], None, None]:
+        """
+        Yield the index entries in file order.
+
+        Each entry is a dict with keys: uid, offset, length, body_offset,
+        digest, envelope.
+        """
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            if self._read_header(f) is None:
+                return
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if "trailer" in entry:
+                        return
+                    yield entry
+
+    def trailer(self) -> Dict[str, Any]:
+        """Return the trailer stored after the entries (empty if there is none)"""
+        try:
+            with open(self.index_path, "rb") as f:
+                # Read backwards until the start of the last line is in view
+                f.seek(0, 2)
+                end = f.tell()
+                block = b""
+                pos = end
+                while pos > 0 and b"\n" not in block.rstrip(b"\n"):
+                    step = min(64 * 1024, pos)
+                    pos -= step
+                    f.seek(pos)
+                    block = f.read(step) + block
+            last_line = block.rstrip(b"\n").rsplit(b"\n", 1)[-1]
+            record = json.loads(last_line)
+        except (OSError, ValueError):
+            return {}
+        if isinstance(record, dict) and isinstance(record.get("trailer"), dict):
+            return record["trailer"]
+        return {}
+
+    def writer(self, state: Tuple[int, int]) -> 'MboxIndexWriter':
+        """Start writing a new index for the given mbox file state"""
+        return MboxIndexWriter(self, state)
+
+    def remove(self) -> None:
+        """Delete the sidecar file if it exists"""
+        try:
+            os.remove(self.index_path)
+        except FileNotFoundError:
+            pass
+
+
+class MboxIndexWriter:
+    """
+    Streams index entries to a temporary file and atomically installs it.
+
+    The new index only replaces the old one when commit() is called and the
+    mbox file has not changed since the scan started; otherwise the temporary
+    file is discarded.
+    """
+
+    def __init__(self, index: MboxIndex, state: Tuple[int, int]):
+        self.index = index
+        self.state = tuple(state)
+        self.tmp_path = f"{index.index_path}.tmp.{os.getpid()}"
+        self._file = open(self.tmp_path, "w", encoding="utf-8")
+        self._file.write(json.dumps({
+            "version": INDEX_VERSION,
+            "size": self.state[0],
+            "mtime": self.state[1],
+        }) + "\n")
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        """Append one message entry"""
+        self._file.write(json.dumps(entry) + "\n")
+
+    def commit(self, trailer: Dict[str, Any] = None) -> bool:
+        """
+        Install the index if the mbox file is unchanged.
+
+        Args:
+            trailer: Optional extra data stored after the entries
+
+        Returns:
+            True if the index was installed
+        """
+        if trailer:
+            self._file.write(json.dumps({"trailer": trailer}) + "\n")
+        self._file.close()
+        if self.index.file_state() != self.state:
+            self.abort()
+            return False
+        os.replace(self.tmp_path, self.index.index_path)
+        return True
+
+    def abort(self) -> None:
+        """Discard the partially written index"""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
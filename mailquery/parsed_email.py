@@ -3,13 +3,44 @@ from email.policy import default
 from typing import Callable, Optional, List
 
 
+class LazyAttachment(dict):
+    """
+    Attachment metadata whose 'content' is only downloaded when it is read.
+    
+    Behaves like the attachment dicts returned by get_attachments
+    (filename, content_type, size), with 'content' fetched on first access
+    of attachment['content'] or attachment.get('content').
+    """
+    
+    def __init__(self, metadata: dict, fetch_content_func: Callable[[], bytes]):
+        super().__init__(metadata)
+        self._fetch_content = fetch_content_func
+    
+    def __missing__(self, key):
+        if key != 'content':
+            raise KeyError(key)
+        self['content'] = self._fetch_content()
+        return self['content']
+    
+    def get(self, key, default=None):
+        if key == 'content':
+            return self['content']
+        return super().get(key, default)
+
+
 class ParsedEmail:
-    def __init__(self, uid: str, envelope: dict, fetch_raw_func: Callable[[], bytes]):
+    def __init__(self, uid: str, envelope: dict, fetch_raw_func: Callable[[], bytes],
+                 fetch_attachments_func: Optional[Callable[[], List[dict]]] = None,
+                 fetch_preview_func: Optional[Callable[[int], bytes]] = None):
         self.uid = uid
         self.envelope = envelope  # header-only info
         self._fetch_raw = fetch_raw_func
+        self._fetch_attachments = fetch_attachments_func  # metadata without the message body, if the client can
+        self._fetch_preview = fetch_preview_func  # truncated raw message for previews, if the client can
+        self._preview = None  # (length, text) of the last preview
         self._body = None
         self._html = None
+        self._size = None
         self._attachments = None  # Cache for attachments
         self.deleted_on_server = False  # Track if this email has been deleted on the server
         self.extra_attributes = {}  # Store computed attributes from add_attribute filters
@@ -60,6 +91,46 @@ class ParsedEmail:
             self._html = parsed.get("html")
         return self._body
 
+    def get_size(self) -> int:
+        """
+        Get the size of the raw message in bytes.
+        
+        Taken from the envelope when the client knows it; otherwise the
+        message is downloaded once and its body cached for later reads.
+        """
+        size = self.envelope.get("size")
+        if size is not None:
+            return size
+        if self._size is None:
+            raw = self._fetch_raw()
+            self._size = len(raw)
+            if self._body is None:
+                parsed = parse_full_email(raw)
+                self._body = parsed["body"]
+                self._html = parsed.get("html")
+        return self._size
+
+    def get_plain_text_preview(self, length: int = 1000) -> str:
+        """
+        Get roughly the first `length` characters of the plain text body.
+        
+        Clients that support partial fetches download only the start of the
+        message for this; otherwise (or once the full body has been loaded)
+        it is a prefix of get_plain_text_body().
+        """
+        if self._body is not None:
+            return self._body[:length]
+        if self._preview is not None and self._preview[0] >= length:
+            return self._preview[1][:length]
+        if self._fetch_preview is not None:
+            try:
+                text = parse_full_email(self._fetch_preview(length))["body"][:length]
+                self._preview = (length, text)
+                return text
+            except Exception:
+                pass  # Fall back to the full body
+        return self.get_plain_text_body()[:length]
+
     def get_formatted_body(self) -> str:
         """Get formatted body (HTML if available, otherwise plain text)"""
         html = self.get_html()
@@ -91,9 +162,19 @@ class ParsedEmail:
             - content_type: str (e.g., 'image/jpeg', 'application/pdf')
             - size: int (size in bytes)
             - content: bytes (the actual attachment data)
+            
+        Clients that can describe a message's structure without downloading
+        it supply the list as metadata; 'content' is then fetched only when
+        it is read (see LazyAttachment).
         """
         if self._attachments is None:
-            self._attachments = self._extract_attachments()
+            if self._fetch_attachments is not None:
+                try:
+                    self._attachments = self._fetch_attachments()
+                except Exception:
+                    self._attachments = self._extract_attachments()
+            else:
+                self._attachments = self._extract_attachments()
         return self._attachments
 
     def _extract_attachments(self) -> List[dict]:
@@ -436,4 +436,239 @@ class INVOLVES(Predicate):
         if len(self.persons) == 1:
             return f"INVOLVES('{self.persons[0]}')"
         else:
-            return f"INVOLVES({self.persons})" 
\ No newline at end of file
+            return f"INVOLVES({self.persons})" 
+
+class SUBJECT(Predicate):
+    """Filter for emails whose subject contains some text"""
+    
+    def __init__(self, text, mailbox=None):
+        """
+        Initialize with text string or OR object
+        
+        Args:
+            text: Text to look for in the subject (case-insensitive), or OR object containing several
+            mailbox: Reference to mailbox for verbose setting
+        """
+        if isinstance(text, OR):
+            self.texts = [t.lower() for t in text.xs]
+        else:
+            self.texts = [text.lower()]
+        self.mailbox = mailbox
+    
+    @property
+    def verbose(self):
+        """Get verbose setting from mailbox if available"""
+        return getattr(self.mailbox, '_verbose', True) if self.mailbox else True
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the subject contains any of the texts"""
+        try:
+            subject = email["subject"]
+        except KeyError:
+            return False
+        if not subject:
+            return False
+        return any(text in subject.lower() for text in self.texts)
+    
+    def __repr__(self):
+        if len(self.texts) == 1:
+            return f"SUBJECT('{self.texts[0]}')"
+        else:
+            return f"SUBJECT({self.texts})"
+
+
+class BODY(Predicate):
+    """Filter for emails whose body contains some text"""
+    
+    def __init__(self, text, mailbox=None, prefix: int = None):
+        """
+        Initialize with text string or OR object
+        
+        Args:
+            text: Text to look for in the body (case-insensitive), or OR object containing several
+            mailbox: Reference to mailbox for verbose setting
+            prefix: Only search the first `prefix` characters of the body, which
+                clients with partial fetches can do without downloading the message
+        """
+        if isinstance(text, OR):
+            self.texts = [t.lower() for t in text.xs]
+        else:
+            self.texts = [text.lower()]
+        self.mailbox = mailbox
+        self.prefix = prefix
+    
+    @property
+    def verbose(self):
+        """Get verbose setting from mailbox if available"""
+        return getattr(self.mailbox, '_verbose', True) if self.mailbox else True
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the plain text body (or its prefix) contains any of the texts"""
+        if self.prefix:
+            body = email.get_plain_text_preview(self.prefix).lower()
+        else:
+            body = email.get_plain_text_body().lower()
+        return any(text in body for text in self.texts)
+    
+    def __repr__(self):
+        if len(self.texts) == 1:
+            return f"BODY('{self.texts[0]}')"
+        else:
+            return f"BODY({self.texts})"
+
+
+class LARGER(Predicate):
+    """Filter for emails larger than a given size"""
+    
+    def __init__(self, size: int, mailbox=None):
+        """
+        Initialize with a size in bytes
+        
+        Args:
+            size: Size of the whole raw message, in bytes
+            mailbox: Reference to mailbox for verbose setting
+        """
+        self.size = int(size)
+        self.mailbox = mailbox
+    
+    @property
+    def verbose(self):
+        """Get verbose setting from mailbox if available"""
+        return getattr(self.mailbox, '_verbose', True) if self.mailbox else True
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the message is larger than size bytes"""
+        return email.get_size() > self.size
+    
+    def __repr__(self):
+        return f"LARGER({self.size})"
+
+
+class SMALLER(Predicate):
+    """Filter for emails smaller than a given size"""
+    
+    def __init__(self, size: int, mailbox=None):
+        """
+        Initialize with a size in bytes
+        
+        Args:
+            size: Size of the whole raw message, in bytes
+            mailbox: Reference to mailbox for verbose setting
+        """
+        self.size = int(size)
+        self.mailbox = mailbox
+    
+    @property
+    def verbose(self):
+        """Get verbose setting from mailbox if available"""
+        return getattr(self.mailbox, '_verbose', True) if self.mailbox else True
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the message is smaller than size bytes"""
+        return email.get_size() < self.size
+    
+    def __repr__(self):
+        return f"SMALLER({self.size})"
+
+
+class HAS_ATTACHMENT(Predicate):
+    """Filter for emails with at least one attachment"""
+    
+    def __init__(self, mailbox=None):
+        """
+        Initialize the predicate
+        
+        Args:
+            mailbox: Reference to mailbox for verbose setting
+        """
+        self.mailbox = mailbox
+    
+    @property
+    def verbose(self):
+        """Get verbose setting from mailbox if available"""
+        return getattr(self.mailbox, '_verbose', True) if self.mailbox else True
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the email has attachments"""
+        return email.has_attachments()
+    
+    def __repr__(self):
+        return "HAS_ATTACHMENT()"
+
+
+class LABEL(Predicate):
+    """Filter for emails carrying a label (Gmail labels; other clients have none)"""
+    
+    def __init__(self, label, mailbox=None):
+        """
+        Initialize with label name or OR object
+        
+        Args:
+            label: Label name (case-insensitive), or OR object containing several
+            mailbox: Reference to mailbox for verbose setting
+        """
+        if isinstance(label, OR):
+            self.labels = [l.lower() for l in label.xs]
+        else:
+            self.labels = [label.lower()]
+        self.mailbox = mailbox
+    
+    @property
+    def verbose(self):
+        """Get verbose setting from mailbox if available"""
+        return getattr(self.mailbox, '_verbose', True) if self.mailbox else True
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the email has any of the labels"""
+        labels = {l.lower() for l in email.envelope.get("labels", [])}
+        if any(label in labels for label in self.labels):
+            return True
+        if self.verbose and "labels" not in email.envelope:
+            print(f"LABEL predicate: No labels known for email {email.uid}")
+        return False
+    
+    def __repr__(self):
+        if len(self.labels) == 1:
+            return f"LABEL('{self.labels[0]}')"
+        else:
+            return f"LABEL({self.labels})"
+
+
+class ANY(Predicate):
+    """Matches when any of several predicates matches"""
+    
+    def __init__(self, *predicates):
+        """
+        Initialize with the alternatives
+        
+        Args:
+            predicates: Predicates (or plain filter functions) to try in order
+        """
+        self.predicates = predicates
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if any predicate returns True"""
+        return any(predicate(email) for predicate in self.predicates)
+    
+    def __repr__(self):
+        return f"ANY({', '.join(repr(p) for p in self.predicates)})"
+
+
+class NOT(Predicate):
+    """Matches when another predicate doesn't"""
+    
+    def __init__(self, predicate):
+        """
+        Initialize with the predicate to negate
+        
+        Args:
+            predicate: Predicate (or plain filter function) to negate
+        """
+        self.predicate = predicate
+    
+    def __call__(self, email: ParsedEmail) -> bool:
+        """Return True if the predicate returns False"""
+        return not self.predicate(email)
+    
+    def __repr__(self):
+        return f"NOT({self.predicate!r})"
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Prefetch - Ordered, bounded background fetching
+
+Clients use this to overlap slow network fetches (message bodies, batches of
+messages) with the consumer's processing. Work items are fetched in a thread
+pool a few steps ahead of the consumer, and results are yielded in the order
+of the input, so callers see the same sequence as a serial loop.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Generator, Iterable, Tuple, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_prefetch(items: Iterable[T], fetch: Callable[[T], R], workers: int = 4,
+                     depth: int = None) -> Generator[Tuple[T, R], None, None]:
+    """
+    Apply fetch to each item in a thread pool, yielding (item, result) in input order.
+
+    At most `depth` items are fetched or waiting to be consumed at any time,
+    which bounds memory use when the consumer is slower than the fetches.
+    An exception raised by fetch is re-raised when its item is reached.
+
+    Args:
+        items: Work items, consumed lazily
+        fetch: Function called (in a worker thread) for each item
+        workers: Number of worker threads
+        depth: Maximum number of items fetched ahead (default: 2 * workers)
+
+    Returns:
+        Generator of (item, fetch(item)) tuples
+    """
+    depth = max(1, depth or workers * 2)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in items:
+            pending.append((item, executor.submit(fetch, item)))
+            if len(pending) >= depth:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+    finally:
+        # Don't wait for fetches the consumer no longer wants
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Rate Limit - Token bucket and retry with backoff for quota-limited APIs
+
+APIs such as Gmail charge each call a number of quota units and reject
+callers that go over the per-user rate. A TokenBucket shared by all threads
+of a client keeps calls under that rate, and retry_with_backoff absorbs the
+occasional rejection (or transient server error) instead of failing the run.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+
+R = TypeVar("R")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at `rate` per second, up to `capacity`.
+    acquire() reserves tokens immediately and sleeps off any shortfall, so a
+    request larger than the capacity (e.g. a big batch) is still let through,
+    and the callers that follow wait for the debt to be repaid.
+    """
+
+    def __init__(self, rate: float, capacity: float = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize the bucket (full).
+
+        Args:
+            rate: Tokens added per second
+            capacity: Largest burst allowed (default: one second's worth)
+            clock: Monotonic time source
+            sleep: Function used to wait
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens, waiting until the rate allows it.
+
+        Returns:
+            Seconds spent waiting
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+def retry_with_backoff(func: Callable[[], R], should_retry: Callable[[Exception], bool], max_retries: int = 5,
+                       base_delay: float = 1.0, max_delay: float = 32.0,
+                       sleep: Callable[[float], None] = None) -> R:
+    """
+    Call func, retrying with jittered exponential backoff on retryable errors.
+
+    The n-th retry waits a random time between 0 and min(max_delay,
+    base_delay * 2**n) seconds ("full jitter"), so threads that were
+    rejected together don't retry together.
+
+    Args:
+        func: Function to call
+        should_retry: Returns True for exceptions worth retrying
+        max_retries: Retries before the last exception is re-raised
+        base_delay: Upper bound of the first wait
+        max_delay: Upper bound of any wait
+        sleep: Function used to wait (default: time.sleep)
+
+    Returns:
+        The result of func
+    """
+    sleep = sleep or time.sleep
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not should_retry(e):
+                raise
+            sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+            attempt += 1
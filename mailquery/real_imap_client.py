@@ -1,15 +1,473 @@
+import base64
+import email.header
+import email.utils
 import imaplib
+import io
+import queue
+import quopri
+import re
+import select
 import ssl
-from typing import Generator, Optional, Dict, Any
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Generator, Iterable, Optional, Dict, Any, List, Tuple
 from email import message_from_bytes
 from email.policy import default
-from .parsed_email import ParsedEmail, parse_envelope
+from .parsed_email import ParsedEmail, LazyAttachment, parse_envelope
+from .predicates import BEFORE, AFTER, FROM, TO, INVOLVES, SUBJECT, BODY, LARGER
+from .prefetch import ordered_prefetch
+from .sync_state import SyncStateStore
+
+
+# Envelope keys and the headers they come from; only these header fields
+# are downloaded when listing messages
+ENVELOPE_KEYS = {
+    "sender": "From",
+    "from": "From",
+    "sender_header": "Sender",
+    "subject": "Subject",
+    "date": "Date",
+    "message_id": "Message-ID",
+    "reply_to": "Reply-To",
+    "to": "To",
+    "cc": "Cc",
+    "bcc": "Bcc",
+}
+ENVELOPE_HEADER_FIELDS = tuple(dict.fromkeys(h.upper() for h in ENVELOPE_KEYS.values()))
+
+# Headers needed to decode a partially fetched body, and the minimum preview fetch size
+MIME_HEADER_FIELDS = ("MIME-VERSION", "CONTENT-TYPE", "CONTENT-TRANSFER-ENCODING")
+PREVIEW_MIN_OCTETS = 4096
+
+# Adaptive FETCH batching: aim for about this many bytes per FETCH response,
+# and keep each round trip short enough to stay clear of server timeouts
+FETCH_TARGET_BYTES = 1024 * 1024
+FETCH_TARGET_SECONDS = 10.0
+FETCH_INITIAL_BATCH = 50
+FETCH_MIN_BATCH = 10
+FETCH_MAX_BATCH = 500
+
+# RFC 2177: clients should re-issue IDLE at least every 29 minutes
+IDLE_RENEW_SECONDS = 29 * 60
+
+IMAP_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _imap_string(text: str) -> Optional[str]:
+    """Quote text for a SEARCH command, or return None if it can't be sent as ASCII"""
+    if not text.isascii() or "\r" in text or "\n" in text:
+        return None
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _imap_date(dt) -> str:
+    """Format a date as IMAP's dd-Mon-yyyy (independent of the locale)"""
+    return f"{dt.day:02d}-{IMAP_MONTHS[dt.month - 1]}-{dt.year}"
+
+
+def _imap_or(keys: List[str]) -> Optional[str]:
+    """Combine search keys with IMAP's binary prefix OR"""
+    if not keys:
+        return None
+    result = keys[-1]
+    for key in reversed(keys[:-1]):
+        result = f"OR {key} {result}"
+    return result
+
+
+def _expand_uid_set(uid_set: str) -> List[str]:
+    """Expand an IMAP sequence set such as '41,43:45' into individual UIDs"""
+    uids = []
+    for part in uid_set.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            low, high = sorted(int(n) for n in part.split(":", 1))
+            uids.extend(str(n) for n in range(low, high + 1))
+        else:
+            uids.append(part)
+    return uids
+
+
+def _compress_uid_set(uids: List[str]) -> str:
+    """Collapse UIDs into an IMAP sequence set, e.g. 1,2,3,50,51 -> '1:3,50:51'"""
+    numbers = sorted({int(uid) for uid in uids})
+    ranges = []
+    for n in numbers:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ",".join(str(low) if low == high else f"{low}:{high}" for low, high in ranges)
+
+
+_IMAP_TOKEN = re.compile(rb'[()]|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+
+def _trim_truncated_body(headers: bytes, text: bytes) -> bytes:
+    """
+    Cut a body truncated by a partial fetch back to where it still decodes.
+    
+    The cut can split a base64 group of 4 characters or a quoted-printable
+    =XX escape, and the email package then gives up and returns the part
+    undecoded. The encoding that matters is that of the part the cut falls
+    in: the message's own, or the last part begun in a multipart message.
+    """
+    message = message_from_bytes(headers)
+    encoding = message.get("Content-Transfer-Encoding", "7bit")
+    body_start = 0
+    if message.get_content_maintype() == "multipart":
+        # Start of the last boundary line (the body can open with one)
+        boundary = (b"\n" + text).rfind(b"\n--")
+        if boundary < 0:
+            return text
+        header_end = text.find(b"\n\r\n", boundary)
+        if header_end < 0:
+            header_end = text.find(b"\n\n", boundary)
+        if header_end < 0:
+            return text  # cut inside the part's headers, it has no body yet
+        body_start = text.index(b"\n", header_end + 1) + 1
+        match = re.search(rb"(?im)^content-transfer-encoding:[ \t]*([\w-]+)", text[boundary:header_end])
+        encoding = match.group(1).decode() if match else "7bit"
+    
+    encoding = str(encoding).strip().lower()
+    if encoding == "base64":
+        # Drop the characters of an incomplete final group, whatever the line length
+        excess = len(re.sub(rb"\s+", b"", text[body_start:])) % 4
+        text = text.rstrip()
+        return text[:len(text) - excess]
+    if encoding == "quoted-printable":
+        return re.sub(rb"=[0-9A-Fa-f]?$", b"", text)
+    return text
+
+
+def _response_bytes(message_data: list) -> int:
+    """Return the number of literal bytes in a FETCH response"""
+    return sum(len(item[1]) for item in message_data or [] if isinstance(item, tuple) and len(item) == 2)
+
+
+def _imap_tokens(message_data: list) -> Generator[Tuple[str, str], None, None]:
+    """Tokenize a FETCH response as returned by imaplib, including literals"""
+    for item in message_data:
+        if isinstance(item, tuple) and len(item) == 2:
+            text, literal = item
+            yield from _imap_tokens([re.sub(rb"\{\d+\}\s*$", b"", text)])
+            yield "string", literal.decode("utf-8", errors="replace")
+        elif isinstance(item, bytes):
+            for token in _IMAP_TOKEN.findall(item):
+                if token in (b"(", b")"):
+                    yield "punct", token.decode()
+                elif token.startswith(b'"'):
+                    yield "string", re.sub(r'\\(.)', r'\1', token[1:-1].decode("utf-8", errors="replace"))
+                else:
+                    yield "atom", token.decode("utf-8", errors="replace")
+
+
+def _parse_imap_list(tokens) -> list:
+    """Build nested lists from IMAP tokens; NIL becomes None"""
+    stack = [[]]
+    for kind, value in tokens:
+        if kind == "punct":
+            if value == "(":
+                stack.append([])
+            elif len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        elif kind == "atom" and value.upper() == "NIL":
+            stack[-1].append(None)
+        else:
+            stack[-1].append(value)
+    while len(stack) > 1:
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def _find_fetch_item(parsed: list, name: str):
+    """Return the value following a FETCH item name (e.g. BODYSTRUCTURE) in a parsed response"""
+    for element in parsed:
+        if isinstance(element, list):
+            for i, item in enumerate(element[:-1]):
+                if isinstance(item, str) and item.upper() == name:
+                    return element[i + 1]
+    return None
+
+
+def _param_dict(pairs) -> Dict[str, str]:
+    """Turn a BODYSTRUCTURE parameter list ("NAME" "value" ...) into a dict with lowercase keys"""
+    if not isinstance(pairs, list):
+        return {}
+    return {str(k).lower(): v for k, v in zip(pairs[::2], pairs[1::2]) if isinstance(v, str)}
+
+
+def _param_filename(params: Dict[str, str], name: str) -> Optional[str]:
+    """Decode a filename parameter, handling RFC 2047 and RFC 2231 encodings"""
+    if name in params:
+        try:
+            return str(email.header.make_header(email.header.decode_header(params[name])))
+        except Exception:
+            return params[name]
+    if name + "*" in params:
+        return email.utils.collapse_rfc2231_value(email.utils.decode_rfc2231(params[name + "*"]))
+    return None
+
+
+def _bodystructure_attachments(structure: list, section: str = "") -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Find the attachments described by a BODYSTRUCTURE.
+    
+    Uses the same rule as ParsedEmail._extract_attachments: a non-multipart
+    part is an attachment if it has a filename, isn't text/*, or has
+    Content-Disposition: attachment.
+    
+    Returns:
+        List of (section, transfer encoding, metadata) per attachment, where
+        section is the part number for BODY[section]
+    """
+    if not structure:
+        return []
+    
+    if isinstance(structure[0], list):
+        # multipart: the child parts come first, then the subtype and extension data
+        attachments = []
+        children = []
+        for item in structure:
+            if not isinstance(item, list):
+                break
+            children.append(item)
+        for i, child in enumerate(children, 1):
+            attachments.extend(_bodystructure_attachments(child, f"{section}.{i}" if section else str(i)))
+        return attachments
+    
+    def field(i, default=""):
+        value = structure[i] if len(structure) > i else None
+        return value.lower() if isinstance(value, str) else default
+    
+    maintype = field(0)
+    subtype = field(1)
+    params = _param_dict(structure[2] if len(structure) > 2 else None)
+    encoding = field(5, "7bit")
+    try:
+        size = int(structure[6])
+    except (IndexError, TypeError, ValueError):
+        size = 0
+    
+    # Extension data starts after the type-specific fields
+    if maintype == "text":
+        extension = 8
+    elif maintype == "message" and subtype == "rfc822":
+        extension = 10
+    else:
+        extension = 7
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    if isinstance(disposition, list) and disposition and isinstance(disposition[0], str):
+        disposition_type = disposition[0].lower()
+        disposition_params = _param_dict(disposition[1] if len(disposition) > 1 else None)
+    else:
+        disposition_type, disposition_params = "", {}
+    
+    filename = _param_filename(disposition_params, "filename") or _param_filename(params, "name")
+    if not (filename is not None or maintype != "text" or disposition_type == "attachment") or not size:
+        return []
+    
+    if encoding == "base64":
+        size = size * 57 // 78  # 76 characters plus CRLF per line encode 57 bytes
+    metadata = {"filename": filename, "content_type": f"{maintype}/{subtype}", "size": size}
+    return [(section or "1", encoding, metadata)]
+
+
+def _imap_match(fields: List[str], texts: List[str]) -> Optional[str]:
+    """Search key matching any of the texts in any of the fields (e.g. FROM, CC, HEADER SENDER)"""
+    keys = []
+    for text in texts:
+        quoted = _imap_string(text)
+        if quoted is None:
+            return None  # leave this predicate to the client side
+        keys.extend(f"{field} {quoted}" for field in fields)
+    return _imap_or(keys)
+
+
+class ImapConnectionPool:
+    """
+    Bounded pool of authenticated IMAP sessions with the same folder selected.
+    
+    imaplib connections can't be shared between threads, so each fetch
+    borrows a session for its duration. Sessions are opened lazily, up to
+    `size`, and the folder is selected read-only.
+    """
+    
+    def __init__(self, open_connection: Callable[[], imaplib.IMAP4], mailbox: str, size: int):
+        """
+        Initialize the pool.
+        
+        Args:
+            open_connection: Function returning a new logged-in connection
+            mailbox: Folder selected on every session
+            size: Maximum number of sessions
+        """
+        self.mailbox = mailbox
+        self.size = max(1, size)
+        self._open_connection = open_connection
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+    
+    def _acquire(self) -> imaplib.IMAP4:
+        """Take an idle session, open a new one, or wait for one to be released"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if not can_open:
+            return self._idle.get()
+        
+        try:
+            conn = self._open_connection()
+            status, _ = conn.select(self.mailbox, readonly=True)
+            if status != 'OK':
+                raise RuntimeError(f"Failed to select mailbox '{self.mailbox}': {status}")
+            return conn
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+    
+    def _discard(self, conn: imaplib.IMAP4) -> None:
+        """Log out of a session and forget it"""
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.logout()
+        except Exception:
+            pass  # Ignore errors during logout
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a session; sessions that fail with a protocol or socket error are dropped"""
+        conn = self._acquire()
+        try:
+            yield conn
+        except (imaplib.IMAP4.abort, OSError):
+            self._discard(conn)
+            raise
+        except BaseException:
+            self._idle.put(conn)
+            raise
+        else:
+            self._idle.put(conn)
+    
+    def close(self) -> None:
+        """Log out of all idle sessions"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+class FetchBatchSizer:
+    """
+    Chooses how many messages go into each FETCH from what was observed so far.
+    
+    Batches are sized so each response carries about target_bytes, based on
+    a moving average of the bytes per message, and shrunk when a fetch took
+    longer than target_seconds. Growth is limited to doubling per batch, so
+    a few small messages at the start don't produce one huge request.
+    Workers fetching in parallel may record results concurrently.
+    """
+    
+    def __init__(self, target_bytes: int = FETCH_TARGET_BYTES, target_seconds: float = FETCH_TARGET_SECONDS,
+                 initial: int = FETCH_INITIAL_BATCH):
+        """
+        Initialize the sizer.
+        
+        Args:
+            target_bytes: Desired size of each FETCH response
+            target_seconds: Longest a single FETCH should take
+            initial: Size of the first batch
+        """
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.size = initial
+        self._bytes_per_message: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def record(self, count: int, nbytes: int, seconds: float) -> None:
+        """Update the batch size after a FETCH of count messages returned nbytes in seconds"""
+        if count <= 0:
+            return
+        with self._lock:
+            observed = nbytes / count
+            if self._bytes_per_message is None:
+                self._bytes_per_message = observed
+            else:
+                self._bytes_per_message = 0.7 * self._bytes_per_message + 0.3 * observed
+            
+            size = min(self.target_bytes / max(self._bytes_per_message, 1.0), 2 * self.size)
+            if seconds > self.target_seconds:
+                size = min(size, count * self.target_seconds / seconds)
+            self.size = int(max(FETCH_MIN_BATCH, min(FETCH_MAX_BATCH, size)))
+    
+    def batches(self, uids: List[bytes]) -> Generator[List[bytes], None, None]:
+        """Split uids into batches, each using the size current when it is taken"""
+        start = 0
+        while start < len(uids):
+            batch = uids[start:start + self.size]
+            start += len(batch)
+            yield batch
+
+
+class _DeflateStream(io.RawIOBase):
+    """Socket wrapper for a connection after COMPRESS DEFLATE (RFC 4978)"""
+    
+    def __init__(self, sock):
+        self.sock = sock
+        self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._inflated = b""
+        self.bytes_received = 0
+        self.bytes_inflated = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        while not self._inflated:
+            data = self.sock.recv(64 * 1024)
+            if not data:
+                return 0
+            self.bytes_received += len(data)
+            self._inflated = self._inflater.decompress(data)
+            self.bytes_inflated += len(self._inflated)
+        n = min(len(buffer), len(self._inflated))
+        buffer[:n] = self._inflated[:n]
+        self._inflated = self._inflated[n:]
+        return n
+    
+    def sendall(self, data: bytes) -> None:
+        # Each command must reach the server whole, so flush after every write
+        self.sock.sendall(self._deflater.compress(data) + self._deflater.flush(zlib.Z_SYNC_FLUSH))
 
 
 class RealImapClient:
     """Real IMAP client that connects to actual email servers"""
     
-    def __init__(self, credentials: Dict[str, str], allow_delete: bool = False):
+    # Mailbox.delete passes all matching UIDs to delete_messages at once
+    supports_bulk_delete = True
+    
+    def __init__(self, credentials: Dict[str, str], allow_delete: bool = False, verbose: bool = False,
+                 connections: int = 1, prefetch_bodies: bool = False, sync_state: SyncStateStore = None,
+                 compress: bool = True, fetch_target_bytes: int = FETCH_TARGET_BYTES):
         """
         Initialize with credentials
         
@@ -21,37 +479,130 @@ class RealImapClient:
                 - 'password': Email password or app password
                 - 'use_ssl': Boolean, default True
             allow_delete: Whether to allow actual deletion of emails (default False for safety)
+            verbose: Whether to print diagnostic messages
+            connections: Number of sessions used to fetch message bodies concurrently
+            prefetch_bodies: Download whole messages while listing, with batches
+                fetched ahead on the pooled sessions while the consumer works.
+                Use this when the query needs bodies (body_contains, store_local...).
+            sync_state: Store for incremental sync markers. When given, each
+                listing only returns messages that are new or changed since the
+                previous complete listing of the same folder and query.
+            compress: Use COMPRESS=DEFLATE when the server offers it
+            fetch_target_bytes: Approximate size of each FETCH response; the
+                number of messages per FETCH adapts to reach it
         """
         self.credentials = credentials
         self.allow_delete = allow_delete
+        self.verbose = verbose
+        self.connections = max(1, connections)
+        self.prefetch_bodies = prefetch_bodies
+        self.compress = compress
+        self.fetch_target_bytes = fetch_target_bytes
         self.connection: Optional[imaplib.IMAP4_SSL] = None
         self.connected = False
+        self._pool: Optional[ImapConnectionPool] = None
+        self.sync_state = sync_state
+        self._sync_extensions = set()  # CONDSTORE/QRESYNC as enabled on the main connection
+        self.vanished_uids: List[str] = []  # UIDs expunged since the previous sync
+        self.listing_last_uid = 0  # Highest UID in the folder when the last listing selected it
+    
+    def _open_connection(self) -> imaplib.IMAP4:
+        """Open and log in a new connection to the IMAP server"""
+        host = self.credentials['host']
+        port = self.credentials.get('port', 993)
+        username = self.credentials['username']
+        password = self.credentials['password']
+        use_ssl = self.credentials.get('use_ssl', True)
+        
+        if use_ssl:
+            # Create SSL context for secure connection
+            context = ssl.create_default_context()
+            connection = imaplib.IMAP4_SSL(host, port, ssl_context=context)
+        else:
+            connection = imaplib.IMAP4(host, port)
+        
+        # Login
+        connection.login(username, password)
+        self._refresh_capabilities(connection)
+        if self.compress:
+            self._enable_compression(connection)
+        return connection
+    
+    def _refresh_capabilities(self, connection: imaplib.IMAP4) -> None:
+        """
+        Replace the connection's capabilities with the post-login list.
+        
+        imaplib only reads CAPABILITY at connect time, but servers such as
+        Dovecot and Gmail advertise COMPRESS, UIDPLUS, ENABLE, QRESYNC and
+        IDLE only once the client has logged in.
+        """
+        status, data = connection.capability()
+        if status == 'OK' and data and data[-1]:
+            connection.capabilities = tuple(str(data[-1], 'ascii').upper().split())
+    
+    def _enable_compression(self, connection: imaplib.IMAP4) -> bool:
+        """
+        Switch a logged-in connection to COMPRESS=DEFLATE if the server offers it.
+        
+        imaplib has no COMPRESS support, so after the server accepts the
+        command the connection's reader and send() are replaced by ones
+        that inflate and deflate the stream.
+        
+        Returns:
+            True if compression was enabled
+        """
+        if 'COMPRESS=DEFLATE' not in connection.capabilities:
+            return False
+        imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+        status, _ = connection._simple_command('COMPRESS', 'DEFLATE')
+        if status != 'OK':
+            return False
+        
+        stream = _DeflateStream(connection.sock)
+        connection.file = io.BufferedReader(stream)
+        connection.send = stream.sendall
+        if self.verbose:
+            print("RealImapClient: Enabled COMPRESS=DEFLATE")
+        return True
         
     def connect(self) -> None:
         """Establish connection to IMAP server"""
         try:
-            host = self.credentials['host']
-            port = self.credentials.get('port', 993)
-            username = self.credentials['username']
-            password = self.credentials['password']
-            use_ssl = self.credentials.get('use_ssl', True)
-            
-            if use_ssl:
-                # Create SSL context for secure connection
-                context = ssl.create_default_context()
-                self.connection = imaplib.IMAP4_SSL(host, port, ssl_context=context)
-            else:
-                self.connection = imaplib.IMAP4(host, port)
-            
-            # Login
-            self.connection.login(username, password)
+            self.connection = self._open_connection()
             self.connected = True
+            if self.sync_state is not None:
+                self._enable_sync_extensions()
             
         except Exception as e:
             raise ConnectionError(f"Failed to connect to IMAP server: {e}")
     
+    def _enable_sync_extensions(self) -> None:
+        """Turn on QRESYNC (or at least CONDSTORE) so SELECT reports HIGHESTMODSEQ"""
+        capabilities = set(self.connection.capabilities)
+        self._sync_extensions = set()
+        if 'ENABLE' not in capabilities:
+            return
+        for extension in ('QRESYNC', 'CONDSTORE'):
+            if extension in capabilities:
+                status, _ = self.connection.enable(extension)
+                if status == 'OK':
+                    # QRESYNC implies CONDSTORE
+                    self._sync_extensions.update({extension, 'CONDSTORE'})
+                    break
+    
+    def _get_pool(self, mailbox: str) -> ImapConnectionPool:
+        """Return the session pool for mailbox, replacing a pool for another folder"""
+        if self._pool is None or self._pool.mailbox != mailbox:
+            if self._pool is not None:
+                self._pool.close()
+            self._pool = ImapConnectionPool(self._open_connection, mailbox, self.connections)
+        return self._pool
+    
     def disconnect(self) -> None:
         """Close the IMAP connection"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
         if self.connection and self.connected:
             try:
                 self.connection.logout()
@@ -70,119 +621,490 @@ class RealImapClient:
         if status != 'OK':
             raise RuntimeError(f"Failed to select mailbox '{mailbox}': {status}")
     
-    def list_messages(self, mailbox: str = "INBOX", limit: int = None, filters: list = None) -> Generator[ParsedEmail, None, None]:
+    def _parse_fetch_response(self, message_data: list) -> List[Tuple[str, Dict[str, int], bytes]]:
+        """
+        Split a UID FETCH response into one record per message.
+        
+        imaplib returns each message as a (metadata, literal) tuple, followed
+        by a bytes item with whatever the server sent after the literal
+        (e.g. b' UID 42)' when it reorders the items).
+        
+        Returns:
+            List of (uid, attributes, literal) where attributes holds the
+            numeric items such as RFC822.SIZE
+        """
+        records = []
+        for item in message_data:
+            if isinstance(item, tuple) and len(item) == 2:
+                records.append([item[0], item[1]])
+            elif isinstance(item, bytes) and records and item.startswith((b" ", b")")):
+                records[-1][0] += item
+        
+        messages = []
+        for meta, literal in records:
+            uid = re.search(rb"UID (\d+)", meta)
+            if not uid:
+                continue
+            attributes = {name.decode(): int(value)
+                          for name, value in re.findall(rb"(RFC822\.SIZE) (\d+)", meta)}
+            messages.append((uid.group(1).decode(), attributes, literal))
+        return messages
+    
+    def _build_search_criteria(self, filters: list, verbose: bool = None) -> str:
+        """
+        Build IMAP SEARCH criteria from filter list
+        
+        Predicates in the filter list are ANDed together, so each recognised
+        predicate contributes one search key; OR objects inside a predicate
+        become IMAP OR trees. The server may return a superset of the matches
+        (e.g. SENTSINCE works on whole days) because the predicates are still
+        applied client-side.
+        
+        Args:
+            filters: List of filter objects (functions and Predicate instances)
+            verbose: Whether to print diagnostic messages (overrides self.verbose if provided)
+        
+        Returns:
+            Search criteria string, 'ALL' if no server-side filters were found
+        """
+        verbose_mode = verbose if verbose is not None else self.verbose
+        keys = []
+        
+        for filter_obj in filters or []:
+            if isinstance(filter_obj, FROM):
+                # The client-side check matches the Sender header too
+                key = _imap_match(["FROM", "HEADER SENDER"], filter_obj.senders)
+            elif isinstance(filter_obj, TO):
+                key = _imap_match(["TO", "CC", "BCC"], filter_obj.recipients)
+            elif isinstance(filter_obj, INVOLVES):
+                key = _imap_match(["FROM", "TO", "CC", "BCC", "HEADER SENDER", "HEADER REPLY-TO"],
+                                  filter_obj.persons)
+            elif isinstance(filter_obj, AFTER):
+                key = f"SENTSINCE {_imap_date(filter_obj.cutoff_date)}"
+            elif isinstance(filter_obj, BEFORE):
+                key = f"SENTBEFORE {_imap_date(filter_obj.cutoff_date)}"
+            elif isinstance(filter_obj, SUBJECT):
+                key = _imap_match(["SUBJECT"], filter_obj.texts)
+            elif isinstance(filter_obj, BODY):
+                key = _imap_match(["BODY"], filter_obj.texts)
+            elif isinstance(filter_obj, LARGER):
+                key = f"LARGER {filter_obj.size}"
+            else:
+                key = None
+            
+            if key:
+                keys.append(f"({key})" if key.startswith("OR ") else key)
+                if verbose_mode:
+                    print(f"RealImapClient: Added '{keys[-1]}' to search for {filter_obj!r}")
+        
+        criteria = " ".join(keys) if keys else "ALL"
+        if verbose_mode:
+            print(f"RealImapClient: Search criteria: {criteria}")
+        return criteria
+    
+    def list_messages(self, mailbox: str = "INBOX", limit: int = None, filters: list = None,
+                      verbose: bool = None) -> Generator[ParsedEmail, None, None]:
         """
         List all messages in the mailbox, yielding ParsedEmail objects
         
-        This fetches headers only initially. Body is fetched lazily when needed.
+        Filters that IMAP can evaluate are sent to the server with SEARCH so
+        that only candidate messages are transferred; all filters are still
+        applied client-side by the mailbox.
+        
+        Only the envelope header fields and the message size are fetched
+        (with BODY.PEEK, so messages aren't marked as read). The body is
+        fetched lazily when needed, unless prefetch_bodies is set.
+        
+        With a sync_state store, only messages new or changed since the last
+        complete listing are returned (see _begin_sync).
         """
+        verbose_mode = verbose if verbose is not None else self.verbose
+        
         if not self.connected:
             self.connect()
         
         self.select_mailbox(mailbox)
+        self.listing_last_uid = self._selected_last_uid()
         
-        # Get UIDs for all messages
-        status, uid_data = self.connection.uid('search', None, 'ALL')
-        if status != 'OK':
-            raise RuntimeError(f"Failed to get UIDs: {status}")
-        
-        if not uid_data[0]:
-            return  # No messages
-        
-        uids = uid_data[0].split()
+        # Get UIDs of the messages matching the server-side part of the filters
+        criteria = self._build_search_criteria(filters, verbose_mode)
+        sync = self._begin_sync(mailbox, criteria, self.listing_last_uid, verbose_mode) if self.sync_state is not None else None
+        uids = sync["uids"] if sync else self._search_uids(criteria)
         
         # Apply limit if specified
         if limit:
             uids = uids[:limit]
             print(f"Limited to {len(uids)} messages")
         
-        # Fetch headers for all messages in batches
-        batch_size = 50  # Fetch 50 messages at a time to avoid timeouts
+        if verbose_mode:
+            print(f"RealImapClient: Fetching headers for {len(uids)} messages in {mailbox}")
+        
+        # Fetch in batches sized from the message sizes and fetch times seen so far
+        sizer = FetchBatchSizer(self.fetch_target_bytes)
+        if self.prefetch_bodies:
+            yield from self._list_with_bodies(sizer.batches(uids), mailbox, verbose_mode, sizer)
+        else:
+            yield from self._list_headers(sizer.batches(uids), verbose_mode, sizer)
+        
+        # Only a listing that ran to the end moves the sync markers forward
+        if sync and not limit:
+            self.sync_state.set(sync["key"], sync["state"])
+            if verbose_mode:
+                print(f"RealImapClient: Saved sync state for {sync['key']}")
+    
+    def _search_uids(self, criteria: str) -> List[bytes]:
+        """Run UID SEARCH and return the matching UIDs"""
+        status, uid_data = self.connection.uid('search', None, criteria)
+        if status != 'OK':
+            raise RuntimeError(f"Failed to get UIDs: {status}")
+        return uid_data[0].split() if uid_data and uid_data[0] else []
+    
+    def _response_int(self, code: str) -> Optional[int]:
+        """Return the numeric value of a response code (e.g. UIDVALIDITY) from the last SELECT"""
+        _, data = self.connection.response(code)
+        try:
+            return int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            return None
+    
+    def _selected_last_uid(self) -> int:
+        """Return the highest UID in the folder just selected (UIDNEXT - 1, or by searching)"""
+        uidnext = self._response_int('UIDNEXT')
+        if uidnext is not None:
+            return uidnext - 1
+        highest = self._search_uids("UID *")
+        return int(highest[-1]) if highest else 0
+    
+    def _begin_sync(self, mailbox: str, criteria: str, last_uid: int, verbose_mode: bool) -> Dict[str, Any]:
+        """
+        Work out which messages changed since the stored sync state.
+        
+        Must be called straight after selecting the mailbox, while its
+        UIDVALIDITY/HIGHESTMODSEQ response codes are available; last_uid
+        is the highest UID at that point.
+        New messages are found by UID range, changed ones (flags etc.) by
+        MODSEQ when the server supports CONDSTORE, and expunged ones are
+        collected in self.vanished_uids when it supports QRESYNC. If
+        UIDVALIDITY changed, the stored UIDs are meaningless and the whole
+        folder is listed again.
+        
+        Returns:
+            Dict with the state key, the UIDs to list and the state to store
+            once the listing is complete
+        """
+        uidvalidity = self._response_int('UIDVALIDITY')
+        highestmodseq = self._response_int('HIGHESTMODSEQ')
+        
+        key = f"{self.credentials.get('username')}@{self.credentials.get('host')}/{mailbox}"
+        if criteria != "ALL":
+            key += f"?{criteria}"
+        previous = self.sync_state.get(key)
+        self.vanished_uids = []
+        
+        state = {"uidvalidity": uidvalidity, "highestmodseq": highestmodseq, "last_uid": last_uid}
         
-        for i in range(0, len(uids), batch_size):
-            batch_uids = uids[i:i + batch_size]
+        if not previous or previous.get("uidvalidity") != uidvalidity or uidvalidity is None:
+            if previous and verbose_mode:
+                print(f"RealImapClient: UIDVALIDITY of {mailbox} changed, listing everything")
+            return {"key": key, "state": state, "uids": self._search_uids(criteria)}
+        
+        seen = previous["last_uid"]
+        restrict = "" if criteria == "ALL" else f" {criteria}"
+        # "n:*" always matches the highest UID, even when it is below n
+        uids = [uid for uid in self._search_uids(f"UID {seen + 1}:*{restrict}") if int(uid) > seen]
+        
+        old_modseq = previous.get("highestmodseq")
+        if old_modseq and highestmodseq and highestmodseq != old_modseq and seen:
+            changed = [uid for uid in self._search_uids(f"MODSEQ {old_modseq + 1}{restrict}") if int(uid) <= seen]
+            uids = sorted(set(changed) | set(uids), key=int)
+            
+            if 'QRESYNC' in self._sync_extensions:
+                self.vanished_uids = self._fetch_vanished(seen, old_modseq)
+        
+        if verbose_mode:
+            print(f"RealImapClient: {len(uids)} new or changed and {len(self.vanished_uids)} vanished messages since last sync")
+        return {"key": key, "state": state, "uids": uids}
+    
+    def _fetch_vanished(self, last_uid: int, modseq: int) -> List[str]:
+        """Ask a QRESYNC server which UIDs up to last_uid were expunged since modseq"""
+        self.connection.untagged_responses.pop('VANISHED', None)
+        status, _ = self.connection.uid('fetch', f"1:{last_uid}", '(UID)', f"(CHANGEDSINCE {modseq} VANISHED)")
+        if status != 'OK':
+            return []
+        vanished = []
+        for item in self.connection.untagged_responses.pop('VANISHED', []):
+            text = item.decode() if isinstance(item, bytes) else str(item)
+            vanished.extend(_expand_uid_set(text.replace("(EARLIER)", "")))
+        return vanished
+    
+    def _list_headers(self, batches: Iterable[List[bytes]], verbose_mode: bool,
+                      sizer: FetchBatchSizer = None) -> Generator[ParsedEmail, None, None]:
+        """Yield messages from header-only fetches, one UID FETCH per batch"""
+        fetch_items = f"(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({' '.join(ENVELOPE_HEADER_FIELDS)})])"
+        
+        for i, batch_uids in enumerate(batches):
             uid_list = b','.join(batch_uids)
             
-            # Fetch full messages (headers + body) but we'll only parse headers for now
-            status, message_data = self.connection.uid('fetch', uid_list, '(RFC822)')
+            started = time.monotonic()
+            status, message_data = self.connection.uid('fetch', uid_list, fetch_items)
+            if sizer is not None and status == 'OK':
+                sizer.record(len(batch_uids), _response_bytes(message_data), time.monotonic() - started)
             
             if status != 'OK':
+                if verbose_mode:
+                    print(f"RealImapClient: Failed to fetch headers for batch {i}: {status}")
                 continue  # Skip this batch if there's an error
             
-
-            
-            # Process each message in the batch
-            for j in range(0, len(message_data), 2):
-                if j + 1 >= len(message_data):
-                    break
-                    
-                uid_info = message_data[j]
-                message_bytes = message_data[j + 1]
-                
-                if not uid_info or not message_bytes:
-                    continue
+            for uid, attributes, header_bytes in self._parse_fetch_response(message_data):
+                envelope = self._parse_headers(header_bytes)
+                if "RFC822.SIZE" in attributes:
+                    envelope["size"] = attributes["RFC822.SIZE"]
                 
-                # Extract UID from response - uid_info is a tuple (uid_string, message_bytes)
-                if isinstance(uid_info, tuple) and len(uid_info) == 2:
-                    uid_str = uid_info[0].decode() if isinstance(uid_info[0], bytes) else str(uid_info[0])
-                    uid = uid_str.split()[2].rstrip(')')
-                    actual_message_bytes = uid_info[1]
-                else:
-                    # Fallback for different format
-                    uid_info_str = uid_info.decode() if isinstance(uid_info, bytes) else str(uid_info)
-                    uid = uid_info_str.split()[2].rstrip(')')
-                    actual_message_bytes = message_bytes
+                # Create lazy body fetcher
+                def make_body_fetcher(uid=uid):
+                    def fetch_body():
+                        return self._fetch_full_message(uid)
+                    return fetch_body
                 
-                # Parse headers from full message
-                envelope = self._parse_headers(actual_message_bytes)
+                yield ParsedEmail(uid, envelope, make_body_fetcher(),
+                                  partial(self._fetch_attachment_metadata, uid),
+                                  partial(self._fetch_preview, uid))
+    
+    def _fetch_preview(self, uid: str, length: int) -> bytes:
+        """
+        Fetch the start of a message for a text preview.
+        
+        Uses a partial fetch, BODY.PEEK[TEXT]<0.N>, together with the MIME
+        headers needed to decode it. N allows for markup and transfer
+        encoding overhead on top of `length` characters of text. A body
+        cut off at N octets is trimmed to whole base64 groups or
+        quoted-printable escapes so that it still decodes.
+        
+        Returns:
+            Truncated raw message (MIME headers plus the start of the body)
+        """
+        if not self.connected:
+            self.connect()
+        
+        octets = max(4 * length, PREVIEW_MIN_OCTETS)
+        status, data = self.connection.uid(
+            'fetch', uid, f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(MIME_HEADER_FIELDS)})] BODY.PEEK[TEXT]<0.{octets}>)")
+        if status != 'OK' or not data:
+            raise RuntimeError(f"Failed to fetch preview of message {uid}")
+        
+        headers = text = b""
+        for item in data:
+            if isinstance(item, tuple) and len(item) == 2:
+                if b"HEADER.FIELDS" in item[0].upper():
+                    headers = item[1]
+                elif b"TEXT]" in item[0].upper():
+                    text = item[1]
+        if len(text) >= octets:
+            text = _trim_truncated_body(headers, text)
+        return headers.rstrip(b"\r\n") + b"\r\n\r\n" + text
+    
+    def _input_buffered(self, conn: imaplib.IMAP4) -> bool:
+        """
+        Tell whether response data is waiting where select() can't see it.
+        
+        Lines can sit in conn.file's buffer, in the inflated output of a
+        _DeflateStream or in the SSL layer after an earlier read took a
+        whole packet. Peeking with the socket made non-blocking returns
+        them without waiting for more data from the server.
+        """
+        timeout = conn.sock.gettimeout()
+        conn.sock.settimeout(0.0)
+        try:
+            return bool(conn.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            conn.sock.settimeout(timeout)
+    
+    def _idle_wait(self, timeout: float) -> bool:
+        """
+        Wait in IDLE until the server reports new mail or timeout expires.
+        
+        The wait blocks in select() on the socket, so it uses no CPU. Flag
+        changes and expunges reported during IDLE are ignored.
+        
+        Returns:
+            True if an EXISTS or RECENT response arrived
+        """
+        conn = self.connection
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        line = conn.readline()
+        if not line.startswith(b"+"):
+            raise RuntimeError(f"Server refused IDLE: {line!r}")
+        
+        new_mail = False
+        deadline = time.monotonic() + timeout
+        while not new_mail:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._input_buffered(conn):
+                readable, _, _ = select.select([conn.sock], [], [], remaining)
+                if not readable:
+                    break
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed during IDLE")
+            new_mail = re.match(rb"\* \d+ (EXISTS|RECENT)", line) is not None
+        
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed while ending IDLE")
+            if line.startswith(tag):
+                break
+            new_mail = new_mail or re.match(rb"\* \d+ (EXISTS|RECENT)", line) is not None
+        return new_mail
+    
+    def follow(self, poll_interval: float = 60.0, filters: list = None, verbose: bool = None,
+               mailbox: str = "INBOX") -> Generator[ParsedEmail, None, None]:
+        """
+        Yield the messages in a mailbox, then new ones as they arrive, indefinitely.
+        
+        After listing the current messages, the UIDs above the highest one
+        seen are fetched, first for mail that arrived during the listing and
+        then whenever the server announces new mail while waiting in IDLE. Servers without IDLE are polled every
+        poll_interval seconds instead. Stop by closing the generator.
+        
+        Args:
+            poll_interval: Seconds between checks when the server has no IDLE
+            filters: Filters whose server-side part restricts the fetched UIDs
+            verbose: Whether to print diagnostic messages
+            mailbox: Folder to watch
+        """
+        verbose_mode = verbose if verbose is not None else self.verbose
+        criteria = self._build_search_criteria(filters, verbose_mode)
+        
+        # Carry on from the highest UID when the listing selected the folder
+        # rather than searching again, so mail arriving during a long listing
+        # isn't skipped. Listed UIDs above it arrived before the listing's
+        # SEARCH and are already yielded.
+        last_uid = 0
+        for parsed_email in self.list_messages(mailbox, filters=filters, verbose=verbose):
+            last_uid = max(last_uid, int(parsed_email.uid))
+            yield parsed_email
+        last_uid = max(last_uid, self.listing_last_uid)
+        
+        while True:
+            # Look before waiting: mail that arrived during the listing was
+            # announced before IDLE started, and won't be announced again
+            # "n:*" always matches the highest UID, even when it is below n
+            arrived = [uid for uid in self._search_uids(f"UID {last_uid + 1}:*") if int(uid) > last_uid]
+            if arrived:
+                last_uid = max(int(uid) for uid in arrived)
+                if criteria != "ALL":
+                    arrived = self._search_uids(f"UID {_compress_uid_set(arrived)} {criteria}")
+                if verbose_mode:
+                    print(f"RealImapClient: {len(arrived)} new messages in {mailbox}")
+                yield from self._list_headers([arrived], verbose_mode)
+            
+            if 'IDLE' in self.connection.capabilities:
+                if verbose_mode:
+                    print(f"RealImapClient: Waiting in IDLE on {mailbox} (last UID {last_uid})")
+                while not self._idle_wait(IDLE_RENEW_SECONDS):
+                    pass
+            else:
+                time.sleep(poll_interval)
+                self.connection.noop()
+    
+    def _fetch_attachment_metadata(self, uid: str) -> List[LazyAttachment]:
+        """
+        Describe a message's attachments from its BODYSTRUCTURE.
+        
+        Only the structure is downloaded; each attachment's content is
+        fetched with BODY.PEEK[section] when it is first read.
+        """
+        if not self.connected:
+            self.connect()
+        
+        status, data = self.connection.uid('fetch', uid, '(UID BODYSTRUCTURE)')
+        if status != 'OK' or not data:
+            raise RuntimeError(f"Failed to fetch structure of message {uid}")
+        
+        structure = _find_fetch_item(_parse_imap_list(_imap_tokens(data)), "BODYSTRUCTURE")
+        if not isinstance(structure, list):
+            raise RuntimeError(f"No BODYSTRUCTURE in response for message {uid}")
+        
+        return [LazyAttachment(metadata, partial(self._fetch_part, uid, section, encoding))
+                for section, encoding, metadata in _bodystructure_attachments(structure)]
+    
+    def _fetch_part(self, uid: str, section: str, encoding: str) -> bytes:
+        """Fetch and decode one MIME part of a message"""
+        if not self.connected:
+            self.connect()
+        
+        status, data = self.connection.uid('fetch', uid, f'(UID BODY.PEEK[{section}])')
+        messages = self._parse_fetch_response(data) if status == 'OK' and data else []
+        if not messages:
+            raise RuntimeError(f"Failed to fetch part {section} of message {uid}")
+        
+        content = messages[0][2]
+        if encoding == "base64":
+            return base64.b64decode(content)
+        if encoding == "quoted-printable":
+            return quopri.decodestring(content)
+        return content
+    
+    def _fetch_batch_bodies(self, batch_uids: List[bytes], pool: ImapConnectionPool,
+                            sizer: FetchBatchSizer = None) -> List[Tuple[str, Dict[str, int], bytes]]:
+        """Fetch whole messages for a batch of UIDs on a session from pool"""
+        with pool.connection() as conn:
+            started = time.monotonic()
+            status, message_data = conn.uid('fetch', b','.join(batch_uids), '(UID RFC822.SIZE BODY.PEEK[])')
+        if status != 'OK':
+            raise RuntimeError(f"Failed to fetch messages: {status}")
+        if sizer is not None:
+            sizer.record(len(batch_uids), _response_bytes(message_data), time.monotonic() - started)
+        return self._parse_fetch_response(message_data)
+    
+    def _list_with_bodies(self, batches: Iterable[List[bytes]], mailbox: str, verbose_mode: bool,
+                          sizer: FetchBatchSizer = None) -> Generator[ParsedEmail, None, None]:
+        """
+        Yield messages in order while later batches download on the session pool.
+        
+        At most one batch per session is in flight, so memory is bounded by
+        connections * batch size messages. The prefetched bytes are handed
+        to the first body access and then released; later accesses refetch.
+        """
+        if verbose_mode:
+            print(f"RealImapClient: Prefetching batches over {self.connections} connections")
+        
+        # Get the pool here: the prefetch workers would race to create it
+        fetch = partial(self._fetch_batch_bodies, pool=self._get_pool(mailbox), sizer=sizer)
+        for _, messages in ordered_prefetch(batches, fetch, workers=self.connections, depth=self.connections):
+            for uid, attributes, raw in messages:
+                envelope = self._parse_headers(raw)
+                if "RFC822.SIZE" in attributes:
+                    envelope["size"] = attributes["RFC822.SIZE"]
                 
-                # Create lazy body fetcher (reuse the already fetched message)
-                def make_body_fetcher(message_copy=actual_message_bytes):
+                def make_body_fetcher(uid=uid, prefetched=[raw]):
                     def fetch_body():
-                        return message_copy
+                        if prefetched:
+                            return prefetched.pop()
+                        return self._fetch_full_message(uid)
                     return fetch_body
                 
                 yield ParsedEmail(uid, envelope, make_body_fetcher())
     
     def _parse_headers(self, header_bytes: bytes) -> Dict[str, str]:
         """Parse email headers from raw bytes"""
+        empty = {key: "" for key in ENVELOPE_KEYS}
         try:
             if not isinstance(header_bytes, bytes):
-                return {"sender": "", "subject": "", "date": "", "message_id": ""}
+                return empty
             
             # Parse the email message
             msg = message_from_bytes(header_bytes, policy=default)
             
-            # Extract headers with fallbacks
-            sender = msg.get("From", "")
-            subject = msg.get("Subject", "")
-            date = msg.get("Date", "")
-            message_id = msg.get("Message-ID", "")
-            reply_to = msg.get("Reply-To", "")
-            to = msg.get("To", "")
-            
-            # Clean up the headers
-            if sender:
-                sender = sender.strip()
-            if subject:
-                subject = subject.strip()
-            if date:
-                date = date.strip()
-            if message_id:
-                message_id = message_id.strip()
-            if reply_to:
-                reply_to = reply_to.strip()
-            if to:
-                to = to.strip()
-            
-            return {
-                "sender": sender,
-                "subject": subject,
-                "date": date,
-                "message_id": message_id,
-                "reply_to": reply_to,
-                "to": to,
-            }
+            # Extract headers with fallbacks, cleaning up whitespace
+            return {key: (msg.get(header) or "").strip() for key, header in ENVELOPE_KEYS.items()}
             
         except Exception as e:
             # If parsing fails, try manual parsing of the raw bytes
@@ -190,83 +1112,92 @@ class RealImapClient:
                 header_str = header_bytes.decode('utf-8', errors='ignore')
                 lines = header_str.split('\n')
                 
-                sender = ""
-                subject = ""
-                date = ""
-                message_id = ""
-                reply_to = ""
-                to = ""
+                envelope = dict(empty)
+                prefixes = {header.lower() + ':': key for key, header in ENVELOPE_KEYS.items()}
                 
                 for line in lines:
                     line = line.strip()
-                    if line.lower().startswith('from:'):
-                        sender = line[5:].strip()
-                    elif line.lower().startswith('subject:'):
-                        subject = line[8:].strip()
-                    elif line.lower().startswith('date:'):
-                        date = line[5:].strip()
-                    elif line.lower().startswith('message-id:'):
-                        message_id = line[11:].strip()
-                    elif line.lower().startswith('reply-to:'):
-                        reply_to = line[9:].strip()
-                    elif line.lower().startswith('to:'):
-                        to = line[3:].strip()
-                    elif line.startswith('\n') or line == '':
+                    if line == '':
                         break  # End of headers
+                    name = line.split(':', 1)[0].lower() + ':'
+                    if name in prefixes:
+                        envelope[prefixes[name]] = line[len(name):].strip()
                 
-                return {
-                    "sender": sender,
-                    "subject": subject,
-                    "date": date,
-                    "message_id": message_id,
-                    "reply_to": reply_to,
-                    "to": to,
-                }
+                envelope["sender"] = envelope["from"]
+                return envelope
                 
             except Exception:
                 # Final fallback
-                return {
-                    "sender": "",
-                    "subject": "",
-                    "date": "",
-                    "message_id": "",
-                    "reply_to": "",
-                    "to": "",
-                }
+                return empty
     
     def _fetch_full_message(self, uid: str) -> bytes:
-        """Fetch the full message body for a given UID"""
+        """Fetch the full message body for a given UID (without setting \\Seen)"""
         if not self.connected:
             self.connect()
         
-        status, data = self.connection.uid('fetch', uid, '(RFC822)')
-        if status != 'OK' or not data or not data[0]:
+        status, data = self.connection.uid('fetch', uid, '(BODY.PEEK[])')
+        messages = self._parse_fetch_response(data) if status == 'OK' and data else []
+        if not messages:
             raise RuntimeError(f"Failed to fetch message {uid}")
         
-        return data[0][1]  # Return the raw message bytes
+        return messages[0][2]  # Return the raw message bytes
     
-    def delete_message(self, uid: str) -> bool:
-        """Delete a message by UID"""
+    def delete_messages(self, uids: List[str], batch_size: int = 1000) -> Dict[str, bool]:
+        """
+        Delete several messages with a few round trips.
+        
+        \\Deleted is stored over compressed UID sets, batch_size UIDs per
+        command, followed by a single expunge. With UIDPLUS the expunge is a
+        UID EXPUNGE restricted to these UIDs; otherwise a plain EXPUNGE is
+        used, which also removes any other messages already flagged \\Deleted.
+        
+        Args:
+            uids: UIDs of the messages to delete
+            batch_size: Maximum number of UIDs per STORE command
+            
+        Returns:
+            Dictionary mapping each UID to True if it was deleted
+        """
+        results = {uid: False for uid in uids}
         if not self.connected:
             self.connect()
         
         if not self.allow_delete:
-            print(f"Skipping deletion of message {uid} due to allow_delete=False")
-            return False
+            print(f"Skipping deletion of {len(results)} messages due to allow_delete=False")
+            return results
         
+        flagged = []
         try:
-            # Mark message for deletion
-            status, _ = self.connection.uid('store', uid, '+FLAGS', '(\\Deleted)')
-            if status != 'OK':
-                return False
+            ordered = sorted(results, key=int)
+            for i in range(0, len(ordered), batch_size):
+                batch = ordered[i:i + batch_size]
+                status, _ = self.connection.uid('store', _compress_uid_set(batch), '+FLAGS.SILENT', '(\\Deleted)')
+                if status == 'OK':
+                    flagged.extend(batch)
+                elif self.verbose:
+                    print(f"RealImapClient: Failed to flag {len(batch)} messages for deletion: {status}")
             
-            # Expunge deleted messages
-            status, _ = self.connection.expunge()
-            return status == 'OK'
+            if not flagged:
+                return results
+            
+            if 'UIDPLUS' in self.connection.capabilities:
+                status, _ = self.connection.uid('expunge', _compress_uid_set(flagged))
+            else:
+                status, _ = self.connection.expunge()
+            if status == 'OK':
+                for uid in flagged:
+                    results[uid] = True
             
         except Exception as e:
-            print(f"Error deleting message {uid}: {e}")
-            return False
+            print(f"Error deleting messages: {e}")
+        
+        if self.verbose:
+            print(f"RealImapClient: Deleted {sum(results.values())} of {len(results)} messages")
+        return results
+    
+    def delete_message(self, uid: str) -> bool:
+        """Delete a message by UID"""
+        return self.delete_messages([uid])[uid]
     
     def __enter__(self):
         """Context manager entry"""
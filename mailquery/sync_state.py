@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Sync State - Persistent per-folder state for incremental listing
+
+Clients that can ask a server for "what changed since last time" (IMAP
+CONDSTORE/QRESYNC, the Gmail History API) record where the previous run
+stopped in a small JSON file. Each entry is keyed by account, folder and
+query, and holds whatever markers the client needs (e.g. UIDVALIDITY,
+HIGHESTMODSEQ and the last seen UID for IMAP).
+
+The file is rewritten atomically, so an interrupted run leaves the previous
+state intact and the next run simply repeats the work.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, Any, Optional
+
+
+DEFAULT_STATE_PATH = os.path.join("~", ".mailquery", "sync_state.json")
+STATE_VERSION = 1
+
+
+class SyncStateStore:
+    """
+    JSON file of sync markers keyed by account/folder/query.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        Initialize the store.
+
+        Args:
+            path: Path of the JSON state file (default: ~/.mailquery/sync_state.json)
+        """
+        self.path = os.path.expanduser(path or DEFAULT_STATE_PATH)
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Read all states from disk (empty if the file is missing or unreadable)"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != STATE_VERSION:
+            return {}
+        return data.get("states", {})
+
+    def _save(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """Atomically replace the state file"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "states": states}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the state stored under key, or None"""
+        return self._load().get(key)
+
+    def set(self, key: str, state: Dict[str, Any]) -> None:
+        """Store the state for key, keeping the other entries"""
+        with self._lock:
+            states = self._load()
+            states[key] = state
+            self._save(states)
+
+    def remove(self, key: str) -> None:
+        """Forget the state for key"""
+        with self._lock:
+            states = self._load()
+            if states.pop(key, None) is not None:
+                self._save(states)
@@ -42,6 +42,9 @@ setup(
             "google-auth-httplib2>=0.1.0",
             "google-api-python-client>=2.0.0",
         ],
+        "zstd": [
+            "zstandard>=0.18.0",
+        ],
         "dev": [
             "pytest",
             "pytest-cov",
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Test GmailClient against a fake Gmail API service
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+from googleapiclient.errors import HttpError
+from mailquery.gmail_client import GmailClient
+from mailquery.mailbox import Mailbox
+from mailquery.predicates import OR, ANY, NOT, FROM, SUBJECT, BODY, LABEL, LARGER, SMALLER, HAS_ATTACHMENT
+from mailquery.rate_limit import TokenBucket
+from mailquery.sync_state import SyncStateStore
+
+
+def http_error(status):
+    return HttpError(Mock(status=status, reason="error"), b"{}")
+
+
+class FakeRequest:
+    """Unexecuted API request that knows its own result"""
+    
+    def __init__(self, service, result):
+        self.service = service
+        self.result = result
+    
+    def execute(self):
+        self.service.executed.append(self)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+    
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+    
+    def execute(self):
+        self.service.batches.append([request_id for request_id, _ in self.requests])
+        for request_id, request in self.requests:
+            failure = self.service.batch_failures.get(request_id)
+            if failure is not None:
+                self.callback(request_id, None, failure)
+            elif isinstance(request.result, Exception):
+                self.callback(request_id, None, request.result)
+            else:
+                self.callback(request_id, request.result, None)
+
+
+class FakeGmailService:
+    """Just enough of the Gmail API for listing: messages().list/get and batches"""
+    
+    def __init__(self, messages):
+        self.messages_by_id = {m["id"]: m for m in messages}
+        self.order = [m["id"] for m in messages]
+        self.executed = []
+        self.batches = []
+        self.batch_failures = {}
+        self.get_calls = []
+        self.list_calls = []
+        self.history_id = "1000"
+        self.history_records = []
+        self.history_calls = []
+        self.bulk_calls = []
+        self.label_list = [{"id": "INBOX", "name": "INBOX"}, {"id": "Label_7", "name": "Receipts/2024"}]
+        self.failing_bulk_ids = set()
+    
+    def users(self):
+        return self
+    
+    def messages(self):
+        return self
+    
+    def list(self, userId, pageToken=None, maxResults=100, q=None, **kwargs):
+        self.list_calls.append(kwargs)
+        start = int(pageToken or 0)
+        ids = self.order[start:start + maxResults]
+        result = {"messages": [{"id": i, "threadId": i} for i in ids], "resultSizeEstimate": len(self.order)}
+        if start + maxResults < len(self.order):
+            result["nextPageToken"] = str(start + maxResults)
+        return FakeRequest(self, result)
+    
+    def get(self, userId, id, **kwargs):
+        self.get_calls.append((id, kwargs))
+        message = self.messages_by_id.get(id)
+        return FakeRequest(self, message if message is not None else http_error(404))
+    
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+    
+    def batchDelete(self, userId, body):
+        return self._bulk("batchDelete", body)
+    
+    def batchModify(self, userId, body):
+        return self._bulk("batchModify", body)
+    
+    def _bulk(self, name, body):
+        self.bulk_calls.append((name, body))
+        failed = self.failing_bulk_ids & set(body["ids"])
+        return FakeRequest(self, http_error(400) if failed else "")
+    
+    def labels(self):
+        return Mock(list=lambda userId, fields=None: FakeRequest(self, {"labels": self.label_list}))
+    
+    def getProfile(self, userId):
+        return FakeRequest(self, {"emailAddress": "me@example.com", "historyId": self.history_id})
+    
+    def history(self):
+        return FakeHistory(self)
+    
+    def threads(self):
+        return FakeThreads(self)
+
+
+class FakeHistory:
+    """users.history, returning one record per page"""
+    
+    def __init__(self, service):
+        self.service = service
+    
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, fields=None):
+        self.service.history_calls.append(startHistoryId)
+        if startHistoryId == "expired":
+            return FakeRequest(self.service, http_error(404))
+        records = self.service.history_records
+        page = int(pageToken or 0)
+        result = {"history": records[page:page + 1], "historyId": self.service.history_id}
+        if page + 1 < len(records):
+            result["nextPageToken"] = str(page + 1)
+        return FakeRequest(self.service, result)
+
+
+class FakeThreads:
+    """users.threads, grouping the service's messages by threadId"""
+    
+    def __init__(self, service):
+        self.service = service
+    
+    def _threads(self):
+        threads = {}
+        for msg_id in self.service.order:
+            message = self.service.messages_by_id[msg_id]
+            threads.setdefault(message["threadId"], []).append(message)
+        return threads
+    
+    def list(self, userId, pageToken=None, maxResults=100, q=None, **kwargs):
+        self.service.list_calls.append(dict(kwargs, q=q))
+        thread_ids = list(self._threads())
+        start = int(pageToken or 0)
+        result = {"threads": [{"id": i} for i in thread_ids[start:start + maxResults]],
+                  "resultSizeEstimate": len(thread_ids)}
+        if start + maxResults < len(thread_ids):
+            result["nextPageToken"] = str(start + maxResults)
+        return FakeRequest(self.service, result)
+    
+    def get(self, userId, id, **kwargs):
+        self.service.get_calls.append((id, kwargs))
+        messages = self._threads().get(id)
+        return FakeRequest(self.service, {"id": id, "messages": messages} if messages else http_error(404))
+
+
+def metadata(msg_id, subject, sender="alice@example.com", thread_id=None):
+    return {
+        "id": msg_id,
+        "threadId": thread_id or msg_id,
+        "internalDate": "1212313338000",
+        "payload": {"headers": [
+            {"name": "From", "value": sender},
+            {"name": "Subject", "value": subject},
+            {"name": "Date", "value": "Sun, 01 Jun 2008 10:42:18 +0100"},
+        ]},
+    }
+
+
+class GmailClientTestCase(unittest.TestCase):
+    def make_client(self, messages, **kwargs):
+        kwargs.setdefault("rate_limiter", TokenBucket(1e9))
+        client = GmailClient(**kwargs)
+        client.service = FakeGmailService(messages)
+        client.connected = True
+        client.verbose = False
+        return client
+
+
+class TestGmailBatchMetadata(GmailClientTestCase):
+    def test_metadata_fetched_in_batches_of_100(self):
+        messages = [metadata(f"m{n:03d}", f"Subject {n}") for n in range(250)]
+        client = self.make_client(messages, batch_size=500)
+        
+        emails = list(client.list_messages(verbose=False))
+        self.assertEqual([e.uid for e in emails], [m["id"] for m in messages])
+        self.assertEqual(emails[7]["subject"], "Subject 7")
+        self.assertEqual([len(b) for b in client.service.batches], [100, 100, 50])
+
+    def test_deleted_messages_skipped_and_errors_retried(self):
+        messages = [metadata("a", "A"), metadata("c", "C")]
+        client = self.make_client(messages)
+        client.service.order = ["a", "b", "c"]  # b was deleted after listing
+        client.service.batch_failures = {"c": http_error(429)}
+        
+        responses = client._fetch_metadata(["a", "b", "c"], verbose_mode=False)
+        self.assertEqual([r and r["id"] for r in responses], ["a", None, "c"])
+        # c was fetched again on its own after the batch
+        self.assertEqual([r.result["id"] for r in client.service.executed], ["c"])
+        client.service.batch_failures = {}
+        self.assertEqual([e.uid for e in client.list_messages(verbose=False)], ["a", "c"])
+
+
+class TestGmailPartialResponses(GmailClientTestCase):
+    def test_field_masks_and_no_peek(self):
+        messages = [metadata(f"m{n}", f"Subject {n}") for n in range(3)]
+        messages[2]["internalDate"] = "1212399738000"
+        messages[1]["sizeEstimate"] = 4321
+        client = self.make_client(messages)
+        
+        with patch("builtins.print") as output:
+            emails = list(client.list_messages(verbose=True))
+        self.assertEqual(client.service.list_calls, [{"fields": "messages/id,nextPageToken,resultSizeEstimate"}])
+        self.assertEqual({kwargs["fields"] for _, kwargs in client.service.get_calls},
+                         {"id,threadId,labelIds,internalDate,sizeEstimate,payload/headers"})
+        # Only the metadata gets for the three listed messages, no extra peek
+        self.assertEqual(len(client.service.get_calls), 3)
+        
+        self.assertEqual(emails[1]["size"], 4321)
+        self.assertEqual(emails[2].envelope["internal_date"], 1212399738000)
+        summary = [c.args[0] for c in output.call_args_list if "Date range" in c.args[0]]
+        self.assertEqual(len(summary), 1)
+
+
+class TestGmailQueryPushdown(GmailClientTestCase):
+    def query(self, mailbox):
+        return mailbox.client._build_server_query(mailbox._filters, verbose=False)
+
+    def test_predicate_tree_to_query(self):
+        client = self.make_client([])
+        mailbox = (Mailbox(client).from_(OR("alice@example.com", "bob")).subject_contains("weekly report")
+                   .body_contains("invoice").larger(1000).smaller(10 ** 6).has_attachment().label("Receipts/2024")
+                   .after("2024-01-01").exclude_when(LARGER(10 ** 5)))
+        self.assertEqual(self.query(mailbox),
+                         '(from:alice@example.com OR from:bob) larger:1000 smaller:1000000 label:receipts-2024 '
+                         'after:2024/01/01 -larger:100000')
+
+    def test_text_and_attachment_filters_stay_client_side(self):
+        # Gmail matches whole words: subject:inv wouldn't find "Invoice"
+        messages = [metadata("a", "Invoice 12"), metadata("b", "Lunch")]
+        client = self.make_client(messages)
+        for mailbox in (Mailbox(client).subject_contains("inv"), Mailbox(client).body_contains("inv"),
+                        Mailbox(client).has_attachment()):
+            self.assertIsNone(self.query(mailbox))
+        mailbox = Mailbox(client).subject_contains("inv")
+        mailbox._set_verbose(False)
+        self.assertEqual([e.uid for e in mailbox.fetch()], ["a"])
+
+    def test_nested_any_and_not(self):
+        client = self.make_client([])
+        mailbox = Mailbox(client).include_when(
+            ANY(LABEL("work"), NOT(ANY(LARGER(1000), SMALLER(10)))))
+        self.assertEqual(self.query(mailbox), "(label:work OR -(larger:1000 OR smaller:10))")
+
+    def test_inexact_terms_not_negated(self):
+        client = self.make_client([])
+        mailbox = Mailbox(client).exclude_when(SUBJECT("spam")).include_when(NOT(BODY("invoice")))
+        self.assertIsNone(self.query(mailbox))
+        mailbox = Mailbox(client).include_when(ANY(FROM("alice"), NOT(ANY(LABEL("work"), HAS_ATTACHMENT()))))
+        self.assertIsNone(self.query(mailbox))
+
+    def test_unsupported_filters_stay_client_side(self):
+        client = self.make_client([])
+        mailbox = (Mailbox(client).reply_to("alice").include_when(ANY(FROM("bob"), lambda e: True))
+                   .exclude_when(lambda e: False))
+        self.assertIsNone(self.query(mailbox))
+
+    def test_client_side_recheck(self):
+        messages = [metadata("a", "Weekly report"), metadata("b", "Weekly reports")]
+        messages[0]["labelIds"] = ["INBOX", "Label_7"]
+        client = self.make_client(messages)
+        mailbox = Mailbox(client).label("receipts/2024").exclude_when(SUBJECT("reports"))
+        mailbox._set_verbose(False)
+        emails = list(mailbox.fetch())
+        self.assertEqual([e.uid for e in emails], ["a"])
+        self.assertEqual(emails[0].envelope["labels"], ["INBOX", "Receipts/2024"])
+
+
+class TestGmailRawBody(GmailClientTestCase):
+    def test_body_fetched_as_raw_bytes(self):
+        raw = (b"From: alice@example.com\r\nSubject: Hi\r\nContent-Type: text/plain; charset=latin-1\r\n"
+               b"Content-Transfer-Encoding: 8bit\r\n\r\nCaf\xe9 ol\xe9\r\n")
+        message = metadata("a", "Hi")
+        message["raw"] = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+        client = self.make_client([message])
+        
+        email = client._parsed_email_from_metadata("a", message)
+        self.assertEqual(email._fetch_raw(), raw)
+        self.assertEqual(email.get_plain_text_body().strip(), "Caf\u00e9 ol\u00e9")
+        self.assertEqual(client.service.get_calls[-1], ("a", {"format": "raw", "fields": "raw"}))
+
+
+class TestGmailBodyPrefetch(GmailClientTestCase):
+    def test_prefetch_in_order_on_thread_services(self):
+        messages = []
+        for n in range(30):
+            message = metadata(f"m{n:02d}", f"Subject {n}")
+            message["raw"] = base64.urlsafe_b64encode(b"Subject: Subject %d\r\n\r\nbody %d\r\n" % (n, n)).decode()
+            messages.append(message)
+        client = self.make_client(messages, prefetch_bodies=True, workers=3)
+        
+        thread_services = {}
+        def build_service(*args, **kwargs):
+            service = FakeGmailService(messages)
+            thread_services[threading.get_ident()] = service
+            return service
+        
+        with patch("mailquery.gmail_client.build", side_effect=build_service):
+            emails = list(client.list_messages(verbose=False))
+        
+        self.assertEqual([e.uid for e in emails], [m["id"] for m in messages])
+        self.assertEqual(emails[17].get_plain_text_body().strip(), "body 17")
+        # Bodies came from the worker threads' own services, not the main one
+        self.assertLessEqual(len(thread_services), 3)
+        self.assertNotIn(threading.get_ident(), thread_services)
+        raw_gets = [c for c in client.service.get_calls if c[1].get("format") == "raw"]
+        self.assertEqual(raw_gets, [])
+        self.assertEqual(sum(len(s.get_calls) for s in thread_services.values()), 30)
+
+    def test_one_pool_for_all_pages(self):
+        """Test that worker services are built once per worker, not once per page"""
+        messages = []
+        for n in range(30):
+            message = metadata(f"m{n:02d}", f"Subject {n}")
+            message["raw"] = base64.urlsafe_b64encode(b"Subject: Subject %d\r\n\r\nbody %d\r\n" % (n, n)).decode()
+            messages.append(message)
+        client = self.make_client(messages, prefetch_bodies=True, workers=3, batch_size=5)
+        
+        with patch("mailquery.gmail_client.build", side_effect=lambda *args, **kwargs: FakeGmailService(messages)) as build:
+            emails = list(client.list_messages(verbose=False))
+        
+        self.assertEqual([e.uid for e in emails], [m["id"] for m in messages])
+        self.assertEqual(len(client.service.list_calls), 6)
+        self.assertLessEqual(build.call_count, 3)
+
+
+class TestGmailHistorySync(GmailClientTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SyncStateStore(os.path.join(self.temp_dir, "state.json"))
+        self.messages = [metadata(f"m{n}", f"Subject {n}") for n in range(5)]
+        self.client = self.make_client(self.messages, sync_state=self.store)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def listed(self):
+        return [e.uid for e in self.client.list_messages(verbose=False)]
+
+    def test_first_run_lists_everything_and_saves_history_id(self):
+        self.assertEqual(self.listed(), ["m0", "m1", "m2", "m3", "m4"])
+        self.assertEqual(self.store.get("gmail:me@example.com"), {"history_id": "1000"})
+        self.assertEqual(self.client.service.history_calls, [])
+
+    def test_next_run_lists_only_changes(self):
+        self.listed()
+        service = self.client.service
+        service.history_id = "1010"
+        service.history_records = [
+            {"id": "1001", "messagesAdded": [{"message": {"id": "m3"}}]},
+            {"id": "1002", "labelsAdded": [{"message": {"id": "m1"}, "labelIds": ["STARRED"]}],
+             "messagesDeleted": [{"message": {"id": "m0"}}]},
+            {"id": "1003", "messagesAdded": [{"message": {"id": "m4"}}],
+             "messagesDeleted": [{"message": {"id": "m4"}}]},
+        ]
+        service.batches.clear()
+        
+        self.assertEqual(self.listed(), ["m3", "m1"])
+        self.assertEqual(self.client.deleted_ids, ["m0", "m4"])
+        self.assertEqual(service.history_calls, ["1000", "1000", "1000"])
+        self.assertEqual(service.batches, [["m3", "m1"]])
+        self.assertEqual(self.store.get("gmail:me@example.com"), {"history_id": "1010"})
+
+    def test_spam_and_trash_count_as_deleted(self):
+        """Test that messages moved to spam or trash are reported as deleted, not changed"""
+        self.listed()
+        service = self.client.service
+        self.messages[1]["labelIds"] = ["TRASH"]
+        self.messages[2]["labelIds"] = ["SPAM", "UNREAD"]
+        service.history_records = [
+            {"id": "1001", "labelsAdded": [{"message": {"id": "m1"}, "labelIds": ["TRASH"]},
+                                           {"message": {"id": "m2"}, "labelIds": ["SPAM"]},
+                                           {"message": {"id": "m3"}, "labelIds": ["STARRED"]}]},
+        ]
+        
+        self.assertEqual(self.listed(), ["m3"])
+        self.assertEqual(self.client.deleted_ids, ["m1", "m2"])
+
+    def test_expired_history_lists_everything(self):
+        self.store.set("gmail:me@example.com", {"history_id": "expired"})
+        self.assertEqual(len(self.listed()), 5)
+        self.assertEqual(self.store.get("gmail:me@example.com"), {"history_id": "1000"})
+
+    def test_limited_listing_keeps_old_state(self):
+        self.client.fetch_limit = 2
+        self.assertEqual(len(self.listed()), 2)
+        self.assertIsNone(self.store.get("gmail:me@example.com"))
+
+    def test_state_keyed_by_query(self):
+        mailbox = Mailbox(self.client).from_("alice@example.com")
+        mailbox._set_verbose(False)
+        list(mailbox.fetch())
+        self.assertIsNotNone(self.store.get("gmail:me@example.com?from:alice@example.com"))
+
+
+class TestGmailBulkDelete(GmailClientTestCase):
+    def test_mailbox_delete_uses_batch_delete(self):
+        messages = [metadata(f"m{n}", "Old news") for n in range(5)]
+        client = self.make_client(messages, allow_delete=True)
+        mailbox = Mailbox(client)
+        mailbox._set_verbose(False)
+        
+        mailbox.delete(verbose=False)
+        self.assertEqual(client.service.bulk_calls, [("batchDelete", {"ids": ["m0", "m1", "m2", "m3", "m4"]})])
+        self.assertTrue(all(e.deleted_on_server for e in mailbox._cached_emails.values()))
+
+    def test_failed_batch_reported_per_id(self):
+        client = self.make_client([], allow_delete=True)
+        client.service.failing_bulk_ids = {"m3"}
+        with patch("builtins.print"):
+            results = client.delete_messages(["m0", "m1", "m2", "m3", "m4"], batch_size=2)
+        self.assertEqual([len(body["ids"]) for _, body in client.service.bulk_calls], [2, 2, 1])
+        self.assertEqual(results, {"m0": True, "m1": True, "m2": False, "m3": False, "m4": True})
+
+    def test_trash_and_allow_delete(self):
+        client = self.make_client([metadata("a", "A")], allow_delete=True, trash_on_delete=True)
+        self.assertTrue(client.delete_message("a"))
+        self.assertEqual(client.service.bulk_calls, [("batchModify", {"ids": ["a"], "addLabelIds": ["TRASH"]})])
+        
+        client.allow_delete = False
+        with patch("builtins.print"):
+            self.assertEqual(client.delete_messages(["a"]), {"a": False})
+        self.assertEqual(len(client.service.bulk_calls), 1)
+
+
+class TestGmailRateLimit(GmailClientTestCase):
+    def test_quota_units_charged_per_call(self):
+        limiter = Mock()
+        client = self.make_client([metadata(f"m{n}", "S") for n in range(3)], rate_limiter=limiter)
+        list(client.list_messages(verbose=False))
+        # One page listed, then one HTTP batch carrying three metadata gets
+        self.assertEqual([c.args[0] for c in limiter.acquire.call_args_list], [5, 15])
+
+    def test_rate_limit_errors_retried_with_backoff(self):
+        client = self.make_client([metadata("a", "A")])
+        request = Mock()
+        request.execute.side_effect = [http_error(429), http_error(503), {"id": "a"}]
+        with patch("mailquery.rate_limit.time.sleep") as sleep, \
+                patch("mailquery.rate_limit.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual(client._execute(request, 'messages.get'), {"id": "a"})
+        self.assertEqual(request.execute.call_count, 3)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1.0, 2.0])
+
+    def test_other_errors_not_retried(self):
+        client = self.make_client([])
+        request = Mock()
+        request.execute.side_effect = http_error(400)
+        with self.assertRaises(HttpError):
+            client._execute(request, 'messages.get')
+        self.assertEqual(request.execute.call_count, 1)
+
+
+class TestGmailThreads(GmailClientTestCase):
+    def conversation(self):
+        return [metadata("a1", "Lunch?", thread_id="t1"), metadata("b1", "Report", thread_id="t2"),
+                metadata("a2", "Re: Lunch?", "bob@example.com", thread_id="t1"),
+                metadata("c1", "Hello", thread_id="t3")]
+
+    def test_one_request_per_thread(self):
+        client = self.make_client(self.conversation())
+        threads = list(client.list_threads(verbose=False))
+        
+        self.assertEqual([[e.uid for e in thread] for thread in threads], [["a1", "a2"], ["b1"], ["c1"]])
+        self.assertEqual(threads[0][1].envelope["thread_id"], "t1")
+        self.assertEqual(threads[0][1].envelope["sender"], "bob@example.com")
+        # One batch of three threads.get requests, no messages.get
+        self.assertEqual(client.service.batches, [["t1", "t2", "t3"]])
+        self.assertEqual([call[0] for call in client.service.get_calls], ["t1", "t2", "t3"])
+        self.assertEqual(client.service.get_calls[0][1]["format"], "metadata")
+
+    def test_fetch_limit_counts_threads(self):
+        client = self.make_client(self.conversation(), fetch_limit=2)
+        threads = list(client.list_threads(verbose=False))
+        self.assertEqual([[e.uid for e in thread] for thread in threads], [["a1", "a2"], ["b1"]])
+
+    def test_list_messages_in_thread_mode(self):
+        client = self.make_client(self.conversation(), threads=True, fetch_limit=3)
+        mailbox = Mailbox(client).subject_contains("Lunch", verbose=False)
+        mailbox._set_verbose(False)
+        
+        self.assertEqual([e.uid for e in mailbox], ["a1", "a2"])
+        self.assertIsNone(client.service.list_calls[0]["q"])
+
+    def test_fetch_limit_keeps_last_thread_whole(self):
+        client = self.make_client(self.conversation(), threads=True, fetch_limit=1)
+        emails = list(client.list_messages(verbose=False))
+        self.assertEqual([e.uid for e in emails], ["a1", "a2"])
+
+    def test_quota_units_and_prefetch(self):
+        limiter = Mock()
+        client = self.make_client(self.conversation(), threads=True, prefetch_bodies=True, rate_limiter=limiter)
+        client._fetch_full_message = lambda msg_id, service=None: f"body of {msg_id}".encode()
+        client._thread_service = lambda: None
+        emails = list(client.list_messages(verbose=False))
+        
+        self.assertEqual([e.uid for e in emails], ["a1", "a2", "b1", "c1"])
+        self.assertEqual([e._fetch_raw() for e in emails][1], b"body of a2")
+        self.assertEqual([c.args[0] for c in limiter.acquire.call_args_list], [10, 30])
+
+
+if __name__ == "__main__":
+    unittest.main()
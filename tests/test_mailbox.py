@@ -177,6 +177,7 @@ class TestMailboxFiltering(unittest.TestCase):
 
     def test_delete_action(self):
         """Test delete action"""
+        self.mock_client.supports_bulk_delete = False
         mbox = Mailbox(self.mock_client)
         mbox.from_("alice@example.com")
         
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Test the MboxClient streaming reader
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from mailquery.mailbox import Mailbox
+from mailquery.mbox_client import MboxClient, iter_mbox_messages, split_mbox_ranges
+from mailquery.mbox_compression import detect_compression, open_decompressed, read_zstd_seek_table
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MBOX_DATA = (
+    b"From alice@example.com Sun Jun  1 10:42:18 2008 +0100\n"
+    b"From: alice@example.com\n"
+    b"Subject: First\n"
+    b"Date: Sun, 01 Jun 2008 10:42:18 +0100\n"
+    b"\n"
+    b"Hello from the first message\n"
+    b"\n"
+    b"From bob@example.com Mon Jun  2 11:00:00 2008 +0100\n"
+    b"From: bob@example.com\n"
+    b"Subject: Second\n"
+    b"Date: Mon, 02 Jun 2008 11:00:00 +0100\n"
+    b"\n"
+    b">From here on this is body text, not a separator\n"
+    b"\n"
+    b"From carol@example.com Tue Jun  3 12:00:00 2008 +0100\n"
+    b"From: carol@example.com\n"
+    b"Subject: Third\n"
+    b"Content-Type: text/plain; charset=utf-8\n"
+    b"\n"
+    b"Caf\xc3\xa9 body\n"
+)
+
+
+class TestMboxScanner(unittest.TestCase):
+    def test_offsets_and_line_numbers(self):
+        """Test that messages are split on separators with absolute offsets"""
+        messages = list(iter_mbox_messages(io.BytesIO(MBOX_DATA)))
+        self.assertEqual(len(messages), 3)
+        self.assertEqual([m[1] for m in messages], [1, 8, 15])
+        for offset, _, length, raw in messages:
+            self.assertEqual(len(raw), length)
+            self.assertEqual(MBOX_DATA[offset:offset + length], raw)
+            self.assertTrue(raw.startswith(b"From "))
+        self.assertEqual(b"".join(m[3] for m in messages), MBOX_DATA)
+
+    def test_tiny_chunks(self):
+        """Test that separators split across chunk boundaries are found"""
+        expected = list(iter_mbox_messages(io.BytesIO(MBOX_DATA)))
+        for chunk_size in (1, 2, 3, 5, 7, 64):
+            messages = list(iter_mbox_messages(io.BytesIO(MBOX_DATA), chunk_size=chunk_size))
+            self.assertEqual(messages, expected)
+
+    def test_headers_only(self):
+        """Test that headers_only yields header blocks with full message lengths"""
+        full = list(iter_mbox_messages(io.BytesIO(MBOX_DATA)))
+        for chunk_size in (1, 3, 16, 1024):
+            heads = list(iter_mbox_messages(io.BytesIO(MBOX_DATA), chunk_size=chunk_size, headers_only=True))
+            self.assertEqual([h[:3] for h in heads], [m[:3] for m in full])
+            for (_, _, _, head), (_, _, _, raw) in zip(heads, full):
+                self.assertTrue(raw.startswith(head))
+                self.assertTrue(head.endswith(b"\n\n"))
+                self.assertNotIn(b"body", head)
+
+    def test_leading_garbage_skipped(self):
+        """Test that data before the first separator is ignored"""
+        data = b"garbage line\nmore garbage\n" + MBOX_DATA
+        messages = list(iter_mbox_messages(io.BytesIO(data), chunk_size=4))
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0][0], 26)
+        self.assertEqual(messages[0][1], 3)
+
+
+class TestMboxClient(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mbox_path = os.path.join(self.temp_dir, "test.mbox")
+        with open(self.mbox_path, "wb") as f:
+            f.write(MBOX_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_list_messages(self):
+        """Test that each message is yielded exactly once"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        emails = list(client.list_messages())
+        self.assertEqual([e.uid for e in emails], ["mbox_1", "mbox_8", "mbox_15"])
+        self.assertEqual([e["subject"] for e in emails], ["First", "Second", "Third"])
+
+    def test_lazy_body_reads_byte_range(self):
+        """Test that bodies are fetched from the file by byte range"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        emails = list(client.list_messages())
+        self.assertIn("From here on", emails[1].get_plain_text_body())
+        self.assertEqual(emails[2].get_plain_text_body().strip(), "Café body")
+
+    def test_size_filter_reads_each_body_once(self):
+        """Test that size filters without an envelope size share the body download"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        mailbox = Mailbox(client).larger(100).smaller(10 ** 6).body_contains("from")
+        mailbox._set_verbose(False)
+        with patch.object(client, "_read_range", wraps=client._read_range) as read_range:
+            emails = list(mailbox.fetch())
+        self.assertEqual([e.uid for e in emails], ["mbox_1", "mbox_8"])
+        self.assertEqual(read_range.call_count, 3)
+
+    def test_fetch_limit(self):
+        """Test that fetch_limit stops the scan early"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        client.fetch_limit = 2
+        self.assertEqual(len(list(client.list_messages())), 2)
+
+
+class TestParallelMbox(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mbox_path = os.path.join(self.temp_dir, "big.mbox")
+        with open(self.mbox_path, "wb") as f:
+            f.write(b"leading garbage\n")
+            for i in range(40):
+                f.write(b"From user%d@example.com Sun Jun  1 10:42:18 2008 +0100\n" % i)
+                f.write(b"From: user%d@example.com\nSubject: Message %d\n\n" % (i, i))
+                f.write(b"line\n" * (i % 7) + b"\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_ranges_aligned_on_separators(self):
+        """Test that ranges cover the file and start on separator lines"""
+        ranges = split_mbox_ranges(self.mbox_path, 6, chunk_size=16)
+        with open(self.mbox_path, "rb") as f:
+            data = f.read()
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertTrue(data[start:].startswith(b"From user"))
+            self.assertEqual(data[start - 1:start], b"\n")
+
+    def test_parallel_matches_serial(self):
+        """Test that parallel parsing yields the same messages in the same order"""
+        serial = MboxClient(self.mbox_path, verbose=False, use_index=False)
+        parallel = MboxClient(self.mbox_path, verbose=False, use_index=False, workers=3)
+        expected = [(e.uid, e["subject"]) for e in serial.list_messages()]
+        self.assertEqual(len(expected), 40)
+        self.assertEqual([(e.uid, e["subject"]) for e in parallel.list_messages()], expected)
+
+
+class TestCompressedMbox(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        plain = os.path.join(self.temp_dir, "plain.mbox")
+        with open(plain, "wb") as f:
+            f.write(MBOX_DATA)
+        self.expected = [(e.uid, e["subject"], e.get_plain_text_body())
+                         for e in MboxClient(plain, verbose=False, use_index=False).list_messages()]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _check(self, name, data, compression):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.assertEqual(detect_compression(path), compression)
+        
+        for _ in range(2):  # second pass lists from the index
+            client = MboxClient(path, verbose=False)
+            emails = list(client.list_messages())
+            self.assertEqual([(e.uid, e["subject"], e.get_plain_text_body()) for e in emails], self.expected)
+        return client
+
+    def test_gzip(self):
+        self._check("a.mbox.gz", gzip.compress(MBOX_DATA), "gzip")
+
+    def test_xz(self):
+        self._check("a.mbox.xz", lzma.compress(MBOX_DATA), "xz")
+
+    def test_bz2(self):
+        self._check("a.mbox.bz2", bz2.compress(MBOX_DATA), "bz2")
+
+    def test_bodies_read_in_one_pass(self):
+        """Test that bodies fetched in file order share one decompressed stream"""
+        path = os.path.join(self.temp_dir, "a.mbox.gz")
+        with open(path, "wb") as f:
+            f.write(gzip.compress(MBOX_DATA))
+        emails = list(MboxClient(path, verbose=False).list_messages())
+        with patch("mailquery.mbox_compression.open_decompressed", wraps=open_decompressed) as opened:
+            bodies = [e.get_plain_text_body() for e in emails]
+            self.assertEqual(opened.call_count, 1)
+            # Going back reopens the stream
+            self.assertTrue(emails[0]._fetch_raw().startswith(b"From alice@example.com"))
+            self.assertEqual(opened.call_count, 2)
+        self.assertEqual(bodies, [body for _, _, body in self.expected])
+
+    @unittest.skipUnless(zstandard, "zstandard not installed")
+    def test_zstd_frames_recorded(self):
+        """Test that a multi-frame zstd archive records and reuses its frame index"""
+        cctx = zstandard.ZstdCompressor()
+        pieces = [MBOX_DATA[i:i + 50] for i in range(0, len(MBOX_DATA), 50)]
+        client = self._check("a.mbox.zst", b"".join(cctx.compress(p) for p in pieces), "zstd")
+        self.assertEqual(len(client._zstd_frames), len(pieces))
+        self.assertEqual([d for _, d in client._zstd_frames], list(range(0, len(MBOX_DATA), 50)))
+
+    @unittest.skipUnless(zstandard, "zstandard not installed")
+    def test_zstd_seek_table(self):
+        """Test that the seek table of a seekable-format archive is read"""
+        cctx = zstandard.ZstdCompressor()
+        pieces = [MBOX_DATA[i:i + 100] for i in range(0, len(MBOX_DATA), 100)]
+        frames = [cctx.compress(p) for p in pieces]
+        table = b"".join(struct.pack("<II", len(c), len(p)) for c, p in zip(frames, pieces))
+        table += struct.pack("<IBI", len(frames), 0, 0x8F92EAB1)
+        data = b"".join(frames) + struct.pack("<II", 0x184D2A5E, len(table)) + table
+        
+        path = os.path.join(self.temp_dir, "seekable.mbox.zst")
+        with open(path, "wb") as f:
+            f.write(data)
+        offsets = read_zstd_seek_table(path)
+        self.assertEqual([d for _, d in offsets], list(range(0, len(MBOX_DATA), 100)))
+        self._check("seekable2.mbox.zst", data, "zstd")
+
+
+class TestMboxIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mbox_path = os.path.join(self.temp_dir, "test.mbox")
+        with open(self.mbox_path, "wb") as f:
+            f.write(MBOX_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_index_written_after_full_scan(self):
+        """Test that a complete scan leaves a sidecar index behind"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        list(client.list_messages())
+        self.assertTrue(os.path.exists(self.mbox_path + ".idx"))
+        self.assertTrue(client.index.is_current())
+
+    def test_rescan_uses_index(self):
+        """Test that an unchanged file is listed without scanning it again"""
+        first = [(e.uid, e["subject"]) for e in MboxClient(self.mbox_path, verbose=False).list_messages()]
+        
+        with patch("mailquery.mbox_client.iter_mbox_messages") as scanner:
+            client = MboxClient(self.mbox_path, verbose=False)
+            emails = list(client.list_messages())
+            scanner.assert_not_called()
+        
+        self.assertEqual([(e.uid, e["subject"]) for e in emails], first)
+        self.assertIn("Hello from the first message", emails[0].get_plain_text_body())
+
+    def test_changed_file_invalidates_index(self):
+        """Test that appending to the mbox forces a rescan"""
+        list(MboxClient(self.mbox_path, verbose=False).list_messages())
+        with open(self.mbox_path, "ab") as f:
+            f.write(b"\nFrom dave@example.com Wed Jun  4 12:00:00 2008 +0100\nSubject: Fourth\n\nbody\n")
+        
+        client = MboxClient(self.mbox_path, verbose=False)
+        self.assertFalse(client.index.is_current())
+        self.assertEqual(len(list(client.list_messages())), 4)
+        self.assertTrue(client.index.is_current())
+
+    def test_partial_scan_does_not_write_index(self):
+        """Test that stopping early leaves no index behind"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        client.fetch_limit = 1
+        list(client.list_messages())
+        self.assertFalse(os.path.exists(self.mbox_path + ".idx"))
+        self.assertEqual(os.listdir(self.temp_dir), ["test.mbox"])
+
+    def test_index_disabled(self):
+        """Test that use_index=False never touches the sidecar"""
+        client = MboxClient(self.mbox_path, verbose=False, use_index=False)
+        self.assertEqual(len(list(client.list_messages())), 3)
+        self.assertFalse(os.path.exists(self.mbox_path + ".idx"))
+
+
+class TestMboxTail(unittest.TestCase):
+    FOURTH = b"\nFrom dave@example.com Wed Jun  4 12:00:00 2008 +0100\nSubject: Fourth\n\nbody\n\n"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mbox_path = os.path.join(self.temp_dir, "test.mbox")
+        with open(self.mbox_path, "wb") as f:
+            f.write(MBOX_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _append(self, data):
+        with open(self.mbox_path, "ab") as f:
+            f.write(data)
+
+    def test_only_new_messages_listed(self):
+        """Test that list_new_messages picks up where the previous call stopped"""
+        client = MboxClient(self.mbox_path, verbose=False, settle_time=0)
+        self.assertEqual(len(list(client.list_new_messages())), 3)
+        self.assertEqual(list(client.list_new_messages()), [])
+        
+        self._append(self.FOURTH)
+        with patch("mailquery.mbox_client.MboxIndex.entries") as entries:
+            emails = list(client.list_new_messages())
+            entries.assert_not_called()
+        self.assertEqual([(e.uid, e["subject"]) for e in emails], [("mbox_22", "Fourth")])
+
+    def test_partial_message_held_back(self):
+        """Test that a message still being written is listed once it is complete"""
+        client = MboxClient(self.mbox_path, verbose=False, settle_time=3600)
+        self.assertEqual([e["subject"] for e in client.list_new_messages()], ["First", "Second"])
+        
+        self._append(self.FOURTH[:-10])
+        self.assertEqual([e["subject"] for e in client.list_new_messages()], ["Third"])
+        self._append(self.FOURTH[-10:])
+        emails = list(client.list_new_messages())
+        self.assertEqual([e["subject"] for e in emails], ["Fourth"])
+        self.assertEqual(emails[0].get_plain_text_body().strip(), "body")
+
+    def test_truncated_file_relisted(self):
+        """Test that a file rewritten to be shorter is read from the start"""
+        client = MboxClient(self.mbox_path, verbose=False, settle_time=0)
+        list(client.list_new_messages())
+        with open(self.mbox_path, "wb") as f:
+            f.write(MBOX_DATA[:100])
+        self.assertEqual([e["subject"] for e in client.list_new_messages()], ["First"])
+
+    def test_index_extended_after_append(self):
+        """Test that appending only rescans from the last indexed message"""
+        expected = [e.uid for e in MboxClient(self.mbox_path, verbose=False).list_messages()]
+        self._append(self.FOURTH)
+        
+        client = MboxClient(self.mbox_path, verbose=False)
+        with patch.object(client, "_scan_entries", wraps=client._scan_entries) as scan:
+            uids = [e.uid for e in client.list_messages()]
+            self.assertEqual(scan.call_args.kwargs["start"], MBOX_DATA.index(b"From carol"))
+        self.assertEqual(uids, expected + ["mbox_22"])
+        self.assertTrue(client.index.is_current())
+
+    def test_mailbox_follow(self):
+        """Test that a following mailbox keeps polling for new mail"""
+        from mailquery.mailbox import Mailbox
+        client = MboxClient(self.mbox_path, verbose=False, settle_time=0)
+        mailbox = Mailbox(client).follow(poll_interval=0)
+        
+        def sleep(_):
+            self._append(self.FOURTH)
+        
+        with patch("mailquery.mbox_client.time.sleep", side_effect=sleep):
+            emails = mailbox.fetch()
+            subjects = [next(emails)["subject"] for _ in range(4)]
+        self.assertEqual(subjects, ["First", "Second", "Third", "Fourth"])
+
+
+class TestMboxDelete(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mbox_path = os.path.join(self.temp_dir, "test.mbox")
+        with open(self.mbox_path, "wb") as f:
+            f.write(b"leading line\n" + MBOX_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_delete_disallowed(self):
+        """Test that allow_delete=False leaves the file alone"""
+        client = MboxClient(self.mbox_path, verbose=False)
+        list(client.list_messages())
+        self.assertFalse(client.delete_message("mbox_2"))
+        with open(self.mbox_path, "rb") as f:
+            self.assertEqual(f.read(), b"leading line\n" + MBOX_DATA)
+
+    def test_mailbox_delete_compacts_once(self):
+        """Test that Mailbox.delete removes all matches with a single rewrite"""
+        from mailquery.mailbox import Mailbox
+        client = MboxClient(self.mbox_path, verbose=False, allow_delete=True)
+        mailbox = Mailbox(client)
+        mailbox._set_verbose(False)
+        mailbox.exclude_when(lambda e: e["subject"] == "Second")
+        
+        with patch("mailquery.mbox_client.os.replace", wraps=os.replace) as replace:
+            mailbox.delete(verbose=False)
+        rewrites = [c for c in replace.call_args_list if c.args[1] == self.mbox_path]
+        self.assertEqual(len(rewrites), 1)
+        
+        with open(self.mbox_path, "rb") as f:
+            data = f.read()
+        second = MBOX_DATA.index(b"From bob")
+        self.assertEqual(data, b"leading line\n" + MBOX_DATA[second:MBOX_DATA.index(b"From carol")])
+        
+        emails = list(MboxClient(self.mbox_path, verbose=False, use_index=False).list_messages())
+        self.assertEqual([(e.uid, e["subject"]) for e in emails], [("mbox_2", "Second")])
+
+    def test_index_rewritten_with_new_offsets(self):
+        """Test that the rewritten index matches a fresh scan"""
+        client = MboxClient(self.mbox_path, verbose=False, allow_delete=True)
+        emails = list(client.list_messages())
+        self.assertEqual(client.delete_messages(["mbox_2"]), {"mbox_2": True})
+        self.assertTrue(client.index.is_current())
+        
+        fresh = MboxClient(self.mbox_path, verbose=False, use_index=False)
+        self.assertEqual(list(client.index.entries()), list(fresh._iter_entries(False)))
+        
+        # Emails listed before the compaction still read the right bodies
+        self.assertEqual(emails[0]._fetch_raw(), b"")
+        self.assertEqual(emails[2].get_plain_text_body().strip(), "Café body")
+
+    def test_changed_file_not_compacted(self):
+        """Test that deletes are refused if the file changed since listing"""
+        client = MboxClient(self.mbox_path, verbose=False, allow_delete=True)
+        list(client.list_messages())
+        with open(self.mbox_path, "ab") as f:
+            f.write(b"\nFrom dave@example.com Wed Jun  4 12:00:00 2008 +0100\n\nbody\n")
+        self.assertFalse(client.delete_message("mbox_2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the ordered background prefetcher
+"""
+
+import threading
+import time
+import unittest
+from mailquery.prefetch import ordered_prefetch
+
+
+class TestOrderedPrefetch(unittest.TestCase):
+    def test_results_in_input_order(self):
+        """Test that slow early items don't reorder the output"""
+        def fetch(n):
+            time.sleep(0.01 * (5 - n % 5))
+            return n * n
+        
+        results = list(ordered_prefetch(range(20), fetch, workers=4))
+        self.assertEqual(results, [(n, n * n) for n in range(20)])
+
+    def test_bounded_lookahead(self):
+        """Test that no more than depth items are fetched ahead of the consumer"""
+        started = []
+        lock = threading.Lock()
+        def fetch(n):
+            with lock:
+                started.append(n)
+            return n
+        
+        consumed = 0
+        for n, _ in ordered_prefetch(range(100), fetch, workers=2, depth=3):
+            time.sleep(0.005)
+            consumed += 1
+            with lock:
+                self.assertLessEqual(len(started), consumed + 3)
+
+    def test_exception_raised_at_item(self):
+        """Test that a failed fetch surfaces when its item is reached"""
+        def fetch(n):
+            if n == 3:
+                raise ValueError("boom")
+            return n
+        
+        seen = []
+        with self.assertRaises(ValueError):
+            for n, _ in ordered_prefetch(range(10), fetch, workers=2):
+                seen.append(n)
+        self.assertEqual(seen, [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test the token bucket and retry helpers
+"""
+
+import unittest
+from unittest.mock import patch
+from mailquery.rate_limit import TokenBucket, retry_with_backoff
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_steady_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=20, clock=clock, sleep=clock.sleep)
+        for _ in range(4):
+            bucket.acquire(5)
+        self.assertEqual(clock.sleeps, [])
+        bucket.acquire(5)
+        self.assertAlmostEqual(clock.sleeps[-1], 0.5)
+        
+        clock.now += 10  # refills up to the capacity only
+        for _ in range(4):
+            bucket.acquire(5)
+        self.assertEqual(len(clock.sleeps), 1)
+
+    def test_request_larger_than_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=100, clock=clock, sleep=clock.sleep)
+        self.assertEqual(bucket.acquire(300), 2.0)
+        self.assertEqual(bucket.acquire(50), 0.5)
+
+
+class TestRetryWithBackoff(unittest.TestCase):
+    def test_retries_until_success(self):
+        attempts = []
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ValueError("busy")
+            return "done"
+        
+        sleeps = []
+        with patch("mailquery.rate_limit.random.uniform", side_effect=lambda low, high: high):
+            result = retry_with_backoff(flaky, lambda e: isinstance(e, ValueError), base_delay=0.5, sleep=sleeps.append)
+        self.assertEqual(result, "done")
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+    def test_gives_up(self):
+        def failing():
+            raise ValueError("busy")
+        sleeps = []
+        with self.assertRaises(ValueError):
+            retry_with_backoff(failing, lambda e: True, max_retries=3, max_delay=1.5, sleep=sleeps.append)
+        self.assertEqual(len(sleeps), 3)
+        self.assertTrue(all(0 <= s <= 1.5 for s in sleeps))
+        
+        with self.assertRaises(KeyError):
+            retry_with_backoff(lambda: {}["x"], lambda e: isinstance(e, ValueError), sleep=sleeps.append)
+        self.assertEqual(len(sleeps), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+Test RealImapClient against a fake IMAP connection
+"""
+
+import base64
+import io
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+import zlib
+from unittest.mock import Mock, patch
+from mailquery.mailbox import Mailbox
+from mailquery.parsed_email import parse_full_email
+from mailquery.predicates import OR
+from mailquery.real_imap_client import RealImapClient, ImapConnectionPool, FetchBatchSizer, _DeflateStream, _compress_uid_set
+from mailquery.sync_state import SyncStateStore
+
+
+HEADERS = {
+    b"101": b"From: Alice <alice@example.com>\r\nSubject: Hello\r\nDate: Sun, 01 Jun 2008 10:42:18 +0100\r\n\r\n",
+    b"102": b"From: bob@example.com\r\nTo: carol@example.com\r\nCc: dave@example.com\r\nSubject: Re: Hello\r\n\r\n",
+}
+BODIES = {
+    b"101": HEADERS[b"101"] + b"First body\r\n",
+    b"102": HEADERS[b"102"] + b"Second body\r\n",
+}
+
+
+def fake_uid(command, *args):
+    """Answer UID commands the way imaplib returns server responses"""
+    if command == 'search':
+        return 'OK', [b" ".join(HEADERS)]
+    if command == 'fetch':
+        uids, items = args
+        if isinstance(uids, str):
+            uids = uids.encode()
+        data = []
+        for n, uid in enumerate(uids.split(b","), 1):
+            if "HEADER.FIELDS" in items:
+                # Item order as the server chooses: UID arrives after the literal
+                data.append((b"%d (RFC822.SIZE %d BODY[HEADER.FIELDS (FROM)] {%d}" % (n, len(BODIES[uid]), len(HEADERS[uid])),
+                             HEADERS[uid]))
+                data.append(b" UID %s)" % uid)
+            else:
+                data.append((b"%d (UID %s BODY[] {%d}" % (n, uid, len(BODIES[uid])), BODIES[uid]))
+                data.append(b")")
+        return 'OK', data
+    raise AssertionError(f"unexpected command {command}")
+
+
+class TestRealImapClient(unittest.TestCase):
+    def setUp(self):
+        self.client = RealImapClient({"host": "imap.example.com", "username": "u", "password": "p"})
+        self.client.connection = Mock()
+        self.client.connection.select.return_value = ('OK', [b"2"])
+        self.client.connection.response.return_value = ('UIDNEXT', [None])
+        self.client.connection.uid.side_effect = fake_uid
+        self.client.connected = True
+
+    def test_list_fetches_header_fields_only(self):
+        """Test that listing peeks at header fields and the size, not whole messages"""
+        emails = list(self.client.list_messages(verbose=False))
+
+        self.assertEqual([e.uid for e in emails], ["101", "102"])
+        self.assertEqual(emails[0]["subject"], "Hello")
+        self.assertEqual(emails[0]["sender"], "Alice <alice@example.com>")
+        self.assertEqual(emails[1]["cc"], "dave@example.com")
+        self.assertEqual(emails[1]["size"], len(BODIES[b"102"]))
+
+        fetch_items = [c.args[2] for c in self.client.connection.uid.call_args_list if c.args[0] == 'fetch']
+        self.assertEqual(len(fetch_items), 1)
+        self.assertIn("BODY.PEEK[HEADER.FIELDS (", fetch_items[0])
+        self.assertIn("RFC822.SIZE", fetch_items[0])
+        self.assertNotIn("RFC822)", fetch_items[0])
+
+    def test_body_fetched_lazily(self):
+        """Test that the body is only downloaded when asked for"""
+        emails = list(self.client.list_messages(verbose=False))
+        self.client.connection.uid.reset_mock()
+
+        self.assertEqual(emails[1].get_plain_text_body().strip(), "Second body")
+        self.client.connection.uid.assert_called_once_with('fetch', "102", '(BODY.PEEK[])')
+
+    def test_prefetch_bodies_on_pool(self):
+        """Test that prefetching spreads batches over pooled sessions and keeps order"""
+        uids = [b"%d" % n for n in range(1000, 1120)]
+        for uid in uids:
+            HEADERS.setdefault(uid, b"Subject: Message %s\r\n\r\n" % uid)
+            BODIES.setdefault(uid, HEADERS[uid] + b"body %s\r\n" % uid)
+        self.addCleanup(lambda: [(HEADERS.pop(u), BODIES.pop(u)) for u in uids])
+        
+        sessions = []
+        def open_connection():
+            conn = Mock()
+            conn.select.return_value = ('OK', [b"120"])
+            conn.response.return_value = ('UIDNEXT', [None])
+            conn.uid.side_effect = fake_uid
+            sessions.append(conn)
+            return conn
+        
+        client = RealImapClient({"host": "imap.example.com"}, connections=3, prefetch_bodies=True)
+        client.connection = self.client.connection
+        client.connection.uid.side_effect = lambda command, *args: (
+            ('OK', [b" ".join(uids)]) if command == 'search' else fake_uid(command, *args))
+        client.connected = True
+        client._open_connection = open_connection
+        
+        emails = list(client.list_messages(verbose=False))
+        self.assertEqual([e.uid for e in emails], [u.decode() for u in uids])
+        self.assertEqual(emails[5]["subject"], "Message 1005")
+        self.assertEqual(emails[5].get_plain_text_body().strip(), "body 1005")
+        
+        self.assertLessEqual(len(sessions), 3)
+        for conn in sessions:
+            conn.select.assert_called_once_with("INBOX", readonly=True)
+        fetches = [c.args for conn in sessions for c in conn.uid.call_args_list]
+        # Batch sizes adapt as sizes are observed, but every message is fetched once
+        self.assertEqual(sorted(uid for args in fetches for uid in args[1].split(b",")), uids)
+        self.assertTrue(all(args[2] == '(UID RFC822.SIZE BODY.PEEK[])' for args in fetches))
+        # Bodies came from the prefetch, not from the main connection
+        self.assertFalse(any(c.args[0] == 'fetch' for c in client.connection.uid.call_args_list))
+
+    def test_prefetch_opens_one_pool(self):
+        """Test that the prefetch workers share one pool and every session is logged out"""
+        uids = [b"%d" % n for n in range(1000, 1200)]
+        for uid in uids:
+            HEADERS.setdefault(uid, b"Subject: Message %s\r\n\r\n" % uid)
+            BODIES.setdefault(uid, HEADERS[uid] + b"body %s\r\n" % uid)
+        self.addCleanup(lambda: [(HEADERS.pop(u), BODIES.pop(u)) for u in uids])
+        
+        sessions = []
+        def open_connection():
+            time.sleep(0.01)  # keep the first session busy so others are opened
+            conn = Mock()
+            conn.select.return_value = ('OK', [b"200"])
+            conn.uid.side_effect = fake_uid
+            sessions.append(conn)
+            return conn
+        
+        client = RealImapClient({"host": "imap.example.com"}, connections=4, prefetch_bodies=True)
+        client.connection = self.client.connection
+        client.connection.uid.side_effect = lambda command, *args: (
+            ('OK', [b" ".join(uids)]) if command == 'search' else fake_uid(command, *args))
+        client.connected = True
+        client._open_connection = open_connection
+        
+        def make_pool(*args):
+            time.sleep(0.01)  # widen the window in which workers could race to create pools
+            return ImapConnectionPool(*args)
+        
+        with patch("mailquery.real_imap_client.ImapConnectionPool", side_effect=make_pool) as pools:
+            self.assertEqual(len(list(client.list_messages(verbose=False))), 200)
+        client.disconnect()
+        
+        self.assertEqual(pools.call_count, 1)
+        self.assertGreater(len(sessions), 1)
+        for conn in sessions:
+            conn.logout.assert_called_once_with()
+
+
+class TestImapAttachmentMetadata(unittest.TestCase):
+    STRUCTURE = [(b'1 (UID 101 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL)'
+                  b'("APPLICATION" "PDF" ("NAME" {11}', "r\u00e9port.pdf".encode()),
+                 b') NIL NIL "BASE64" 7800 NIL ("ATTACHMENT" ("FILENAME" "=?utf-8?q?r=C3=A9port.pdf?=")) NIL NIL)'
+                 b'("IMAGE" "PNG" NIL "<x>" NIL "BASE64" 780 NIL ("INLINE" NIL) NIL NIL) "MIXED" ("BOUNDARY" "b1") NIL NIL NIL))']
+
+    def setUp(self):
+        self.client = RealImapClient({"host": "imap.example.com"})
+        self.client.connection = Mock()
+        self.client.connection.select.return_value = ('OK', [b"2"])
+        self.client.connection.response.return_value = ('UIDNEXT', [None])
+        self.client.connected = True
+        
+        def uid(command, *args):
+            if args[-1] == '(UID BODYSTRUCTURE)':
+                return 'OK', self.STRUCTURE
+            if args[-1] == '(UID BODY.PEEK[2])':
+                return 'OK', [(b"1 (UID 101 BODY[2] {8}", b"JVBERi0x\r\n"), b")"]
+            return fake_uid(command, *args)
+        self.client.connection.uid.side_effect = uid
+
+    def test_metadata_without_content(self):
+        """Test that attachment metadata comes from BODYSTRUCTURE and content stays lazy"""
+        email = list(self.client.list_messages(verbose=False))[0]
+        self.assertTrue(email.has_attachments())
+        attachments = email.get_attachments()
+        self.assertEqual([(a["filename"], a["content_type"]) for a in attachments],
+                         [("r\u00e9port.pdf", "application/pdf"), (None, "image/png")])
+        self.assertEqual(attachments[0]["size"], 5700)
+        
+        requests = [c.args[-1] for c in self.client.connection.uid.call_args_list]
+        self.assertNotIn('(BODY.PEEK[])', requests)
+        self.assertNotIn('(UID BODY.PEEK[2])', requests)
+        
+        self.assertEqual(attachments[0]["content"], b"%PDF-1")
+        self.assertEqual(attachments[0].get("content"), b"%PDF-1")
+        self.assertEqual([c.args[-1] for c in self.client.connection.uid.call_args_list].count('(UID BODY.PEEK[2])'), 1)
+
+
+class TestImapPreview(unittest.TestCase):
+    def setUp(self):
+        self.client = RealImapClient({"host": "imap.example.com"})
+        self.client.connection = Mock()
+        self.client.connection.select.return_value = ('OK', [b"2"])
+        self.client.connection.response.return_value = ('UIDNEXT', [None])
+        self.client.connected = True
+        
+        def uid(command, *args):
+            if "BODY.PEEK[TEXT]<0." in args[-1]:
+                return 'OK', [(b"1 (UID 102 BODY[HEADER.FIELDS (CONTENT-TYPE)] {42}",
+                               b"Content-Type: text/plain; charset=utf-8\r\n\r\n"),
+                              (b" BODY[TEXT]<0> {20}", b"The first line\r\nSig"), b")"]
+            return fake_uid(command, *args)
+        self.client.connection.uid.side_effect = uid
+
+    def test_preview_uses_partial_fetch(self):
+        email = list(self.client.list_messages(verbose=False))[1]
+        self.assertEqual(email.get_plain_text_preview(10), "The first ")
+        self.assertEqual(email.get_plain_text_preview(5), "The f")
+        
+        requests = [c.args[-1] for c in self.client.connection.uid.call_args_list]
+        self.assertEqual(sum("BODY.PEEK[TEXT]<0.4096>" in r for r in requests), 1)
+        self.assertNotIn('(BODY.PEEK[])', requests)
+
+    def test_truncated_base64_still_decodes(self):
+        """Test that a preview cut inside a base64 group is trimmed, not returned undecoded"""
+        headers = b"Content-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: base64\r\n\r\n"
+        text = "".join(f"Line {n} of the invoice.\n" for n in range(400))
+        # Each line layout leaves 1, 2 and 3 characters of a group after 4096 octets
+        for line_length, separator in ((64, b"\n"), (72, b"\r\n"), (76, b"\n")):
+            encoded = base64.b64encode(text.encode())
+            encoded = separator.join(encoded[i:i + line_length] for i in range(0, len(encoded), line_length))
+            self.client.connection.uid.side_effect = lambda command, *args: (
+                'OK', [(b"1 (UID 102 BODY[HEADER.FIELDS (CONTENT-TYPE)] {%d}" % len(headers), headers),
+                       (b" BODY[TEXT]<0> {4096}", encoded[:4096]), b")"])
+            preview = self.client._fetch_preview("102", 1000)
+            self.assertEqual(parse_full_email(preview)["body"][:1000], text[:1000])
+
+    def test_body_contains_prefix(self):
+        """Test that a prefix body search reads only the preview"""
+        mailbox = Mailbox(self.client).body_contains("first line", prefix=500)
+        mailbox._set_verbose(False)
+        self.assertEqual([e.uid for e in mailbox.fetch()], ["101", "102"])
+        self.assertNotIn('(BODY.PEEK[])', [c.args[-1] for c in self.client.connection.uid.call_args_list])
+
+
+class TestImapSearchPushdown(unittest.TestCase):
+    def setUp(self):
+        self.client = RealImapClient({"host": "imap.example.com", "username": "u", "password": "p"})
+
+    def criteria(self, mailbox):
+        return self.client._build_search_criteria(mailbox._filters, verbose=False)
+
+    def test_no_predicates_searches_all(self):
+        mailbox = Mailbox(self.client).include_when(lambda e: True)
+        self.assertEqual(self.criteria(mailbox), "ALL")
+
+    def test_predicates_anded(self):
+        """Test that chained predicates become juxtaposed search keys"""
+        mailbox = Mailbox(self.client).from_("x@example.com").after("2024-01-01").before("2024-03-05")
+        mailbox.subject_contains('say "hi"').larger(1000)
+        self.assertEqual(self.criteria(mailbox),
+                         '(OR FROM "x@example.com" HEADER SENDER "x@example.com") SENTSINCE 01-Jan-2024 SENTBEFORE 05-Mar-2024 '
+                         'SUBJECT "say \\"hi\\"" LARGER 1000')
+
+    def test_or_trees(self):
+        """Test that OR objects and multi-field predicates become IMAP OR trees"""
+        mailbox = Mailbox(self.client).from_(OR("a", "b", "c")).to("d")
+        self.assertEqual(self.criteria(mailbox),
+                         '(OR FROM "a" OR HEADER SENDER "a" OR FROM "b" OR HEADER SENDER "b" OR FROM "c" HEADER SENDER "c") '
+                         '(OR TO "d" OR CC "d" BCC "d")')
+
+    def test_non_ascii_left_to_client(self):
+        """Test that text IMAP can't carry as ASCII isn't pushed down"""
+        mailbox = Mailbox(self.client).subject_contains("café").body_contains("invoice")
+        self.assertEqual(self.criteria(mailbox), 'BODY "invoice"')
+
+    def test_search_uses_criteria(self):
+        """Test that list_messages sends the criteria and still lets the mailbox filter"""
+        self.client.connection = Mock()
+        self.client.connection.select.return_value = ('OK', [b"2"])
+        self.client.connection.response.return_value = ('UIDNEXT', [None])
+        self.client.connection.uid.side_effect = fake_uid
+        self.client.connected = True
+        
+        mailbox = Mailbox(self.client).from_("alice")
+        mailbox._set_verbose(False)
+        self.assertEqual([e.uid for e in mailbox.fetch()], ["101"])
+        self.client.connection.uid.assert_any_call('search', None, '(OR FROM "alice" HEADER SENDER "alice")')
+
+
+class TestImapBulkDelete(unittest.TestCase):
+    def setUp(self):
+        self.client = RealImapClient({"host": "imap.example.com"}, allow_delete=True)
+        self.client.connection = Mock()
+        self.client.connection.uid.return_value = ('OK', [])
+        self.client.connection.expunge.return_value = ('OK', [])
+        self.client.connected = True
+
+    def test_compress_uid_set(self):
+        self.assertEqual(_compress_uid_set(["3", "1", "2", "50", "77", "90", "91", "92", "2"]), "1:3,50,77,90:92")
+
+    def test_one_store_and_uid_expunge(self):
+        """Test that many deletes cost one STORE and one UID EXPUNGE"""
+        self.client.connection.capabilities = ('IMAP4REV1', 'UIDPLUS')
+        uids = [str(n) for n in list(range(1, 51)) + [77] + list(range(90, 121))]
+        
+        results = self.client.delete_messages(uids)
+        self.assertTrue(all(results[uid] for uid in uids))
+        self.assertEqual(self.client.connection.uid.call_args_list[0].args,
+                         ('store', '1:50,77,90:120', '+FLAGS.SILENT', '(\\Deleted)'))
+        self.client.connection.uid.assert_called_with('expunge', '1:50,77,90:120')
+        self.assertEqual(self.client.connection.uid.call_count, 2)
+        self.client.connection.expunge.assert_not_called()
+
+    def test_plain_expunge_without_uidplus(self):
+        self.client.connection.capabilities = ('IMAP4REV1',)
+        results = self.client.delete_messages([str(n) for n in range(2500)], batch_size=1000)
+        self.assertEqual(self.client.connection.uid.call_count, 3)
+        self.client.connection.expunge.assert_called_once_with()
+        self.assertEqual(sum(results.values()), 2500)
+
+    def test_delete_disallowed(self):
+        self.client.allow_delete = False
+        self.assertFalse(self.client.delete_message("5"))
+        self.client.connection.uid.assert_not_called()
+
+
+class TestImapIncrementalSync(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SyncStateStore(os.path.join(self.temp_dir, "state.json"))
+        self.codes = {"UIDVALIDITY": 7, "UIDNEXT": 103, "HIGHESTMODSEQ": 500}
+        self.searches = []
+        
+        self.client = RealImapClient({"host": "imap.example.com", "username": "u", "password": "p"},
+                                     sync_state=self.store)
+        conn = Mock()
+        conn.select.return_value = ('OK', [b"2"])
+        conn.response.side_effect = lambda code: (code, [str(self.codes[code]).encode()])
+        conn.untagged_responses = {}
+        conn.uid.side_effect = self.fake_uid
+        self.client.connection = conn
+        self.client.connected = True
+        self.client._sync_extensions = {'CONDSTORE', 'QRESYNC'}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def fake_uid(self, command, *args):
+        if command == 'search':
+            self.searches.append(args[1])
+            if args[1].startswith("UID 103:*"):
+                return 'OK', [b"102"]  # n:* always includes the highest UID
+            if args[1].startswith("MODSEQ 501"):
+                return 'OK', [b"101"]
+            return 'OK', [b"101 102"]
+        if command == 'fetch' and 'VANISHED' in args[-1]:
+            self.client.connection.untagged_responses['VANISHED'] = [b"(EARLIER) 90,95:97"]
+            return 'OK', []
+        return fake_uid(command, *args)
+
+    def test_first_run_lists_everything_and_saves_state(self):
+        self.assertEqual([e.uid for e in self.client.list_messages(verbose=False)], ["101", "102"])
+        self.assertEqual(self.store.get("u@imap.example.com/INBOX"),
+                         {"uidvalidity": 7, "highestmodseq": 500, "last_uid": 102})
+
+    def test_nothing_changed(self):
+        list(self.client.list_messages(verbose=False))
+        self.assertEqual(list(self.client.list_messages(verbose=False)), [])
+        self.assertEqual(self.searches[-1], "UID 103:*")
+
+    def test_changed_and_vanished(self):
+        """Test that CONDSTORE changes and QRESYNC expunges are picked up"""
+        list(self.client.list_messages(verbose=False))
+        self.codes.update(HIGHESTMODSEQ=520, UIDNEXT=104)
+        self.assertEqual([e.uid for e in self.client.list_messages(verbose=False)], ["101"])
+        self.assertEqual(self.client.vanished_uids, ["90", "95", "96", "97"])
+        self.assertEqual(self.store.get("u@imap.example.com/INBOX")["highestmodseq"], 520)
+
+    def test_uidvalidity_change_resyncs(self):
+        list(self.client.list_messages(verbose=False))
+        self.codes["UIDVALIDITY"] = 8
+        self.assertEqual([e.uid for e in self.client.list_messages(verbose=False)], ["101", "102"])
+
+    def test_unfinished_listing_keeps_old_state(self):
+        listing = self.client.list_messages(verbose=False)
+        next(listing)
+        listing.close()
+        self.assertIsNone(self.store.get("u@imap.example.com/INBOX"))
+
+    def test_state_keyed_by_query(self):
+        mailbox = Mailbox(self.client).from_("alice")
+        mailbox._set_verbose(False)
+        list(mailbox.fetch())
+        self.assertIsNotNone(self.store.get('u@imap.example.com/INBOX?(OR FROM "alice" HEADER SENDER "alice")'))
+        self.assertIsNone(self.store.get("u@imap.example.com/INBOX"))
+
+
+class TestImapIdleFollow(unittest.TestCase):
+    def setUp(self):
+        self.client = RealImapClient({"host": "imap.example.com", "username": "u", "password": "p"})
+        self.searches = []
+        conn = Mock()
+        conn.select.return_value = ('OK', [b"2"])
+        conn.capabilities = ('IMAP4REV1', 'IDLE')
+        conn._new_tag.return_value = b"A7"
+        conn.response.return_value = ('UIDNEXT', [None])
+        conn.file.peek.return_value = b""
+        conn.readline.side_effect = [b"+ idling\r\n", b"* 3 EXISTS\r\n", b"A7 OK IDLE terminated\r\n"]
+        conn.uid.side_effect = self.fake_uid
+        # Message 103 arrives once the client waits in IDLE or polls
+        self.appended = False
+        conn.send.side_effect = conn.noop.side_effect = lambda *args: setattr(self, "appended", True)
+        self.client.connection = conn
+        self.client.connected = True
+
+    def fake_uid(self, command, *args):
+        if command == 'search':
+            self.searches.append(args[1])
+            if args[1] == "ALL":
+                return 'OK', [b"101 102"]
+            if args[1] == "UID *":
+                return 'OK', [b"103" if self.appended else b"102"]
+            if args[1] == "UID 103:*":
+                return 'OK', [b"103" if self.appended else b"102"]
+            if args[1].startswith("UID 103 "):
+                return 'OK', [b"103"] if 'alice' in args[1] else [b""]
+        return fake_uid(command, *args)
+
+    def follow(self, mailbox):
+        header = b"From: alice@example.com\r\nSubject: New\r\n\r\n"
+        with patch.dict(HEADERS, {b"103": header}), patch.dict(BODIES, {b"103": header + b"Hi\r\n"}), \
+                patch("mailquery.real_imap_client.select.select", return_value=([1], [], [])):
+            emails = iter(mailbox.fetch())
+            return [next(emails).uid for _ in range(3)]
+
+    def test_idle_yields_new_mail(self):
+        """Test that messages announced during IDLE are fetched by UID and yielded"""
+        mailbox = Mailbox(self.client).follow()
+        mailbox._set_verbose(False)
+        self.assertEqual(self.follow(mailbox), ["101", "102", "103"])
+        sent = [c.args[0] for c in self.client.connection.send.call_args_list]
+        self.assertEqual(sent, [b"A7 IDLE\r\n", b"DONE\r\n"])
+        self.assertIn("UID 103:*", self.searches)
+
+    def test_idle_applies_filters(self):
+        mailbox = Mailbox(self.client).follow().from_("alice")
+        mailbox._set_verbose(False)
+        self.client.connection.uid.side_effect = lambda command, *args: (
+            ('OK', [b"101"]) if command == 'search' and args[1] == '(OR FROM "alice" HEADER SENDER "alice")' else self.fake_uid(command, *args))
+        with patch.dict(HEADERS, {b"103": b"From: alice@example.com\r\n\r\n"}), \
+                patch.dict(BODIES, {b"103": b"From: alice@example.com\r\n\r\nHi\r\n"}), \
+                patch("mailquery.real_imap_client.select.select", return_value=([1], [], [])):
+            emails = iter(mailbox.fetch())
+            self.assertEqual([next(emails).uid for _ in range(2)], ["101", "103"])
+        self.assertIn('UID 103 (OR FROM "alice" HEADER SENDER "alice")', self.searches)
+
+    def test_delete_while_following(self):
+        """Test that a following mailbox deletes each email as it arrives"""
+        deleted = []
+        def delete_messages(uids):
+            deleted.append(uids)
+            if uids == ["103"]:
+                raise KeyboardInterrupt
+            return {uid: True for uid in uids}
+        
+        mailbox = Mailbox(self.client).follow()
+        mailbox._set_verbose(False)
+        header = b"From: alice@example.com\r\nSubject: New\r\n\r\n"
+        with patch.dict(HEADERS, {b"103": header}), patch.dict(BODIES, {b"103": header + b"Hi\r\n"}), \
+                patch("mailquery.real_imap_client.select.select", return_value=([1], [], [])), \
+                patch.object(self.client, "delete_messages", side_effect=delete_messages):
+            with self.assertRaises(KeyboardInterrupt):
+                mailbox.delete(verbose=False)
+        self.assertEqual(deleted, [["101"], ["102"], ["103"]])
+
+    def test_polls_without_idle(self):
+        self.client.connection.capabilities = ('IMAP4REV1',)
+        mailbox = Mailbox(self.client).follow(poll_interval=5)
+        mailbox._set_verbose(False)
+        with patch("mailquery.real_imap_client.time.sleep") as sleep:
+            self.assertEqual(self.follow(mailbox), ["101", "102", "103"])
+        sleep.assert_called_with(5)
+        self.client.connection.send.assert_not_called()
+
+    def test_mail_arriving_during_listing(self):
+        """Test that mail appended after the listing's SELECT is yielded before waiting in IDLE"""
+        self.client.connection.response.return_value = ('UIDNEXT', [b"103"])
+        self.appended = True
+        mailbox = Mailbox(self.client).follow()
+        mailbox._set_verbose(False)
+        self.assertEqual(self.follow(mailbox), ["101", "102", "103"])
+        self.assertNotIn("UID *", self.searches)
+        self.client.connection.send.assert_not_called()
+
+    def test_buffered_lines_seen_before_select(self):
+        client_sock, server_sock = socket.socketpair()
+        try:
+            for compressed in (False, True):
+                conn = Mock(sock=client_sock)
+                if compressed:
+                    conn.file = io.BufferedReader(_DeflateStream(client_sock))
+                    deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+                    packet = lambda data: deflater.compress(data) + deflater.flush(zlib.Z_SYNC_FLUSH)
+                else:
+                    conn.file = client_sock.makefile('rb')
+                    packet = lambda data: data
+                
+                self.assertFalse(self.client._input_buffered(conn))
+                server_sock.sendall(packet(b"* 1 FETCH (FLAGS (\\Seen))\r\n* 3 EXISTS\r\n"))
+                self.assertEqual(conn.file.readline(), b"* 1 FETCH (FLAGS (\\Seen))\r\n")
+                self.assertTrue(self.client._input_buffered(conn))
+                self.assertEqual(conn.file.readline(), b"* 3 EXISTS\r\n")
+                self.assertFalse(self.client._input_buffered(conn))
+                self.assertIsNone(client_sock.gettimeout())
+        finally:
+            client_sock.close()
+            server_sock.close()
+
+
+class TestFetchBatchSizer(unittest.TestCase):
+    def test_grows_towards_target_bytes(self):
+        sizer = FetchBatchSizer(target_bytes=100 * 1000, initial=50)
+        sizer.record(50, 50 * 1000, 0.1)
+        self.assertEqual(sizer.size, 100)  # at most doubles per batch
+        sizer.record(100, 100 * 1000, 0.1)
+        self.assertEqual(sizer.size, 100)
+
+    def test_shrinks_for_large_messages_and_slow_fetches(self):
+        sizer = FetchBatchSizer(target_bytes=1000 * 1000, target_seconds=10, initial=200)
+        sizer.record(200, 200 * 50000, 1)
+        self.assertEqual(sizer.size, 20)
+        sizer = FetchBatchSizer(target_bytes=1000 * 1000, target_seconds=10, initial=200)
+        sizer.record(200, 200 * 1000, 40)
+        self.assertEqual(sizer.size, 50)
+
+    def test_batches_follow_current_size(self):
+        sizer = FetchBatchSizer(initial=2)
+        batches = sizer.batches([b"1", b"2", b"3", b"4", b"5", b"6", b"7"])
+        self.assertEqual(next(batches), [b"1", b"2"])
+        sizer.size = 4
+        self.assertEqual(list(batches), [[b"3", b"4", b"5", b"6"], [b"7"]])
+
+
+class TestImapCompression(unittest.TestCase):
+    def test_deflate_stream_round_trip(self):
+        client_sock, server_sock = socket.socketpair()
+        try:
+            stream = _DeflateStream(client_sock)
+            stream.sendall(b"A1 NOOP\r\n")
+            inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            self.assertEqual(inflater.decompress(server_sock.recv(1024)), b"A1 NOOP\r\n")
+            
+            deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            server_sock.sendall(deflater.compress(b"* OK " + b"x" * 1000 + b"\r\nA1 OK done\r\n")
+                                + deflater.flush(zlib.Z_SYNC_FLUSH))
+            reader = io.BufferedReader(stream)
+            self.assertEqual(reader.readline(), b"* OK " + b"x" * 1000 + b"\r\n")
+            self.assertEqual(reader.readline(), b"A1 OK done\r\n")
+            self.assertLess(stream.bytes_received, 100)
+        finally:
+            client_sock.close()
+            server_sock.close()
+
+    def test_enabled_only_when_offered(self):
+        client = RealImapClient({"host": "imap.example.com", "username": "u", "password": "p"})
+        conn = Mock()
+        conn.capabilities = ('IMAP4REV1',)
+        self.assertFalse(client._enable_compression(conn))
+        conn._simple_command.assert_not_called()
+        
+        conn.capabilities = ('IMAP4REV1', 'COMPRESS=DEFLATE')
+        conn._simple_command.return_value = ('OK', [b"DEFLATE active"])
+        self.assertTrue(client._enable_compression(conn))
+        conn._simple_command.assert_called_once_with('COMPRESS', 'DEFLATE')
+        self.assertIsInstance(conn.file.raw, _DeflateStream)
+
+    def test_capabilities_refreshed_after_login(self):
+        client = RealImapClient({"host": "imap.example.com", "username": "u", "password": "p", "use_ssl": False},
+                                compress=False)
+        conn = Mock()
+        conn.capabilities = ('IMAP4REV1', 'AUTH=PLAIN')
+        conn.capability.return_value = ('OK', [b"IMAP4rev1 IDLE UIDPLUS ENABLE QRESYNC COMPRESS=DEFLATE"])
+        with patch("imaplib.IMAP4", return_value=conn):
+            self.assertIs(client._open_connection(), conn)
+        conn.login.assert_called_once_with("u", "p")
+        self.assertEqual(conn.capabilities, ('IMAP4REV1', 'IDLE', 'UIDPLUS', 'ENABLE', 'QRESYNC', 'COMPRESS=DEFLATE'))
+
+
+if __name__ == "__main__":
+    unittest.main()